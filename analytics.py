@@ -0,0 +1,157 @@
+"""
+Training Analytics: fixed-size statistics computed in SQL.
+
+build_training_digest() aggregates the sessions / session_grades tables inside the database and
+returns a compact digest (overall, per role, per scenario, per criterion, weekly trend, worst
+criteria). format_digest() renders it as short text for the executive-summary prompt, so the
+prompt size stays constant no matter how many sessions are stored.
+kpi_snapshot() serves the dashboard KPI cards/charts from the kpi_* rollup tables.
+"""
+import os
+import json
+import time
+import argparse
+from datetime import date, timedelta
+from engine import repo
+from repository import PASS_SCORE
+
+DIGEST_WEEKS = int(os.getenv("DIGEST_WEEKS", "8")) # Weekly trend window
+DIGEST_TOP_N = int(os.getenv("DIGEST_TOP_N", "5")) # Rows kept for ranked lists
+
+# Score bands: BELUM SIAP (<60) / BUTUH LATIHAN (60-79) / SIAP (>=80)
+_SCORE_STATS = f'''
+    count(*) AS sessions,
+    ROUND(AVG(s.total_score), 1) AS avg_score,
+    MIN(s.total_score) AS min_score,
+    MAX(s.total_score) AS max_score,
+    ROUND(100.0 * SUM(CASE WHEN s.total_score >= {PASS_SCORE} THEN 1 ELSE 0 END) / count(*), 1) AS pass_rate,
+    SUM(CASE WHEN s.total_score < 60 THEN 1 ELSE 0 END) AS band_low,
+    SUM(CASE WHEN s.total_score >= 60 AND s.total_score < {PASS_SCORE} THEN 1 ELSE 0 END) AS band_mid,
+    SUM(CASE WHEN s.total_score >= {PASS_SCORE} THEN 1 ELSE 0 END) AS band_high
+'''
+
+SQL_OVERALL = f"SELECT {_SCORE_STATS} FROM sessions s"
+
+SQL_BY_ROLE = f'''
+    SELECT sc.role_id, {_SCORE_STATS}
+    FROM sessions s JOIN scenarios sc ON s.scenario_id = sc.scenario_id
+    GROUP BY sc.role_id
+    ORDER BY avg_score ASC
+'''
+
+SQL_BY_SCENARIO = f'''
+    SELECT s.scenario_id, sc.topic, {_SCORE_STATS}
+    FROM sessions s JOIN scenarios sc ON s.scenario_id = sc.scenario_id
+    GROUP BY s.scenario_id, sc.topic
+    ORDER BY avg_score ASC
+'''
+
+SQL_BY_CRITERIA = '''
+    SELECT s.scenario_id, g.criteria, count(*) AS graded, ROUND(AVG(g.score), 1) AS avg_score
+    FROM session_grades g JOIN sessions s ON g.session_id = s.session_id
+    GROUP BY s.scenario_id, g.criteria
+    ORDER BY avg_score ASC
+'''
+
+SQL_WEEKLY = f'''
+    SELECT strftime('%Y-W%W', s.date) AS week, {_SCORE_STATS}
+    FROM sessions s
+    GROUP BY week
+    ORDER BY week DESC
+    LIMIT ?
+'''
+
+SQL_READINESS = '''
+    SELECT readiness, count(*) AS sessions
+    FROM sessions
+    GROUP BY readiness
+    ORDER BY sessions DESC
+'''
+
+def build_training_digest(weeks: int = DIGEST_WEEKS, top_n: int = DIGEST_TOP_N) -> dict:
+    """All dashboard / executive statistics, aggregated by the database (O(groups), not O(sessions))."""
+    overall = repo.query(SQL_OVERALL)[0]
+    criteria = repo.query(SQL_BY_CRITERIA)
+    return {
+        "overall": overall,
+        "by_role": repo.query(SQL_BY_ROLE),
+        "by_scenario": repo.query(SQL_BY_SCENARIO),
+        "by_criteria": criteria,
+        "worst_criteria": criteria[:top_n],
+        "weekly": list(reversed(repo.query(SQL_WEEKLY, (weeks,)))),
+        "readiness": repo.query(SQL_READINESS),
+    }
+
+def kpi_snapshot(recent_days: int = 7) -> dict:
+    """
+    Dashboard KPI cards and charts from the kpi_* rollup tables (a handful of small reads, independent
+    of how many sessions exist). The total_sessions / avg_score / pass_rate keys are also what
+    create_executive_summary expects.
+    """
+    since = (date.today() - timedelta(days=recent_days - 1)).isoformat()
+    kpis = repo.get_kpis(since)
+
+    total = sum(r["sessions"] for r in kpis["scenarios"])
+    score_sum = sum(r["score_sum"] for r in kpis["scenarios"])
+    passed = sum(r["pass_count"] for r in kpis["scenarios"])
+
+    # Charts: 10-point histogram + readiness levels, both derived from the exact score counts
+    histogram, levels = {}, {"Not Ready": 0, "Training Needed": 0, "Ready": 0}
+    for score, sessions in kpis["scores"].items():
+        key = (min(score // 10 * 10, 100), "Passed" if score >= PASS_SCORE else "Failed")
+        histogram[key] = histogram.get(key, 0) + sessions
+        level = "Ready" if score > 80 else ("Training Needed" if score > 60 else "Not Ready")
+        levels[level] += sessions
+
+    return {
+        "total_sessions": total,
+        "avg_score": score_sum / total if total else 0.0,
+        "pass_rate": 100.0 * passed / total if total else 0.0,
+        "most_active_role": kpis["roles"][0]["role_id"] if kpis["roles"] else "N/A",
+        "recent_sessions": kpis["recent_sessions"],
+        "score_histogram": [{"bucket": b, "status": st, "sessions": n} for (b, st), n in sorted(histogram.items())],
+        "readiness_levels": [{"level": lvl, "sessions": n} for lvl, n in levels.items() if n],
+    }
+
+def _bands(row: dict) -> str:
+    return f"<60: {row['band_low']}, 60-79: {row['band_mid']}, >=80: {row['band_high']}"
+
+def format_digest(digest: dict) -> str:
+    """Compact, plain-text rendering of the digest for the LLM (a few hundred tokens, bounded)."""
+    o = digest["overall"]
+    if not o["sessions"]:
+        return "No training sessions recorded yet."
+
+    lines = [
+        "OVERALL",
+        f"- Sessions: {o['sessions']}, Avg score: {o['avg_score']}, Min/Max: {o['min_score']}/{o['max_score']}, "
+        f"Pass rate (>= {PASS_SCORE}): {o['pass_rate']}%",
+        f"- Score bands: {_bands(o)}",
+        "- Readiness: " + ", ".join(f"{r['readiness']}: {r['sessions']}" for r in digest["readiness"]),
+        "",
+        "PER ROLE (role | sessions | avg | pass rate | bands)",
+    ]
+    lines += [f"- {r['role_id']} | {r['sessions']} | {r['avg_score']} | {r['pass_rate']}% | {_bands(r)}" for r in digest["by_role"]]
+    lines += ["", "PER SCENARIO (scenario | topic | sessions | avg | pass rate)"]
+    lines += [f"- {r['scenario_id']} | {r['topic']} | {r['sessions']} | {r['avg_score']} | {r['pass_rate']}%" for r in digest["by_scenario"]]
+    lines += ["", "WORST CRITERIA (scenario | criteria | graded | avg score)"]
+    lines += [f"- {r['scenario_id']} | {r['criteria']} | {r['graded']} | {r['avg_score']}" for r in digest["worst_criteria"]]
+    lines += ["", "WEEKLY TREND (week | sessions | avg | pass rate)"]
+    lines += [f"- {r['week']} | {r['sessions']} | {r['avg_score']} | {r['pass_rate']}%" for r in digest["weekly"]]
+    return "\n".join(lines)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Training analytics utilities.")
+    parser.add_argument("--rebuild-kpis", action="store_true", help="Recompute the kpi_* rollup tables from all sessions")
+    parser.add_argument("--digest", action="store_true", help="Print the executive-summary statistics digest")
+    args = parser.parse_args()
+
+    if args.rebuild_kpis:
+        started = time.perf_counter()
+        repo.rebuild_kpis()
+        print(f"KPI rollups rebuilt in {time.perf_counter() - started:.2f}s")
+        print(json.dumps({k: v for k, v in kpi_snapshot().items() if k not in ("score_histogram", "readiness_levels")}, indent=2))
+    if args.digest:
+        print(format_digest(build_training_digest()))
+    if not (args.rebuild_kpis or args.digest):
+        parser.print_help()
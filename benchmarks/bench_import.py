@@ -0,0 +1,63 @@
+"""
+Import-time budget check: cold-imports the app modules in fresh interpreters (`python -X importtime`) and
+fails when one of them gets slower than its budget or pulls in a heavy dependency at import time.
+
+    python benchmarks/bench_import.py
+    python benchmarks/bench_import.py --budget-ms 300 --repeat 9
+
+Exit status is 1 on any regression, so it can run as a CI step.
+"""
+import os
+import sys
+import argparse
+import subprocess
+import statistics
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Cumulative import time allowed per module (ms, median of the runs)
+BUDGETS_MS = {
+    "engine": 400,
+    "analytics": 400,
+    "jobs": 400,
+}
+
+# Must only be loaded on first use (reports, retrieval, LLM calls, dashboard charts)
+LAZY_MODULES = ["pandas", "docx", "langchain_core", "langchain_chroma", "langchain_ollama",
+                "langchain_google_genai", "chromadb", "altair"]
+
+def import_time_ms(module: str) -> float:
+    """Cumulative import time of `module` in a fresh interpreter, from the -X importtime report."""
+    result = subprocess.run([sys.executable, "-X", "importtime", "-c", f"import {module}"],
+                            cwd=ROOT, capture_output=True, text=True, check=True)
+    for line in reversed(result.stderr.splitlines()):
+        fields = [f.strip() for f in line.split("|")]
+        if len(fields) == 3 and fields[2] == module:
+            return int(fields[1]) / 1000
+    raise RuntimeError(f"No importtime entry for {module}:\n{result.stderr[-2000:]}")
+
+def eagerly_loaded(module: str) -> list:
+    """Heavy modules that end up in sys.modules just by importing `module`."""
+    code = f"import sys, {module}; print(' '.join(m for m in {LAZY_MODULES!r} if m in sys.modules))"
+    result = subprocess.run([sys.executable, "-c", code], cwd=ROOT, capture_output=True, text=True, check=True)
+    return result.stdout.split()
+
+def run(budgets: dict, repeat: int) -> bool:
+    ok = True
+    print(f"{'module':<12} {'median ms':>10} {'budget ms':>10}  eager heavy imports")
+    for module, budget in budgets.items():
+        import_time_ms(module) # Warm-up: writes .pyc files so the runs below measure imports only
+        median = statistics.median(import_time_ms(module) for _ in range(repeat))
+        eager = eagerly_loaded(module)
+        failed = median > budget or bool(eager)
+        ok = ok and not failed
+        print(f"{module:<12} {median:>10.1f} {budget:>10.0f}  {', '.join(eager) or '-'}{'  FAIL' if failed else ''}")
+    return ok
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Fail when app module import time exceeds its budget.")
+    parser.add_argument("--budget-ms", type=float, help="Override the budget of every module")
+    parser.add_argument("--repeat", type=int, default=5, help="Fresh-interpreter runs per module (median reported)")
+    args = parser.parse_args()
+    budgets = {m: args.budget_ms or b for m, b in BUDGETS_MS.items()}
+    sys.exit(0 if run(budgets, args.repeat) else 1)
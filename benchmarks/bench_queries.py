@@ -0,0 +1,116 @@
+"""
+Dashboard / repository query benchmark: query plans and timings before and after the index migration.
+
+Builds a throw-away SQLite database with synthetic sessions, migrates it up to the last step *before*
+the query indexes, measures every query, applies the index step and measures again.
+
+    python benchmarks/bench_queries.py --sessions 50000
+"""
+import os
+import sys
+import time
+import random
+import argparse
+import tempfile
+import statistics
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from repository import (Repository, ConnectionPool, SQLiteBackend, SQL_SESSION_GRADES, SQL_NEXT_PENDING_JOB,
+                        SQL_READINESS_LABELS, SQL_COUNT_SESSION_HEADERS, _session_filter, page_query)
+from migrations import migrate, MIGRATIONS
+
+NAMES = ["Andi", "Budi", "Citra", "Dewi", "Eko", "Fajar", "Gita", "Hesti", "Indra", "Joko"]
+READINESS = ["SIAP TERJUN", "BUTUH LATIHAN", "BELUM SIAP"]
+INDEX_VERSION = next(version for version, name, _ in MIGRATIONS if name == "query indexes")
+
+def populate(repo: Repository, sessions: int, transcript_chars: int):
+    rng = random.Random(42)
+    roles = [("CS", "Customer Service"), ("TELLER", "Bank Teller")]
+    scenarios = [(f"{role}_{i}", role, f"Topic {i}", "", "", "") for role, _ in roles for i in range(10)]
+    start = datetime(2024, 1, 1)
+    filler = "Selamat pagi, ada yang bisa saya bantu? " * (transcript_chars // 40 + 1)
+
+    with repo.pool.transaction() as con:
+        con.executemany("INSERT INTO roles VALUES (?,?)", roles)
+        con.executemany("INSERT INTO scenarios VALUES (?,?,?,?,?,?)", scenarios)
+        con.executemany("INSERT INTO grading_rubrics (scenario_id, criteria, description) VALUES (?,?,?)",
+                        [(s[0], f"Criteria {k}", "") for s in scenarios for k in range(4)])
+        rows, grades, jobs = [], [], []
+        for i in range(sessions):
+            sid = f"SES-{i:07d}"
+            score = rng.randint(0, 100)
+            date = (start + timedelta(minutes=rng.randint(0, 60 * 24 * 700))).strftime("%Y-%m-%d %H:%M")
+            rows.append((sid, f"{rng.choice(NAMES)} {i % 997}", rng.choice(scenarios)[0], date, score,
+                         rng.choice(READINESS), filler[:transcript_chars], "", "ready"))
+            grades += [(sid, f"Criteria {k}", rng.randint(0, 100), "evidence", "feedback") for k in range(4)]
+            jobs.append((sid, "done" if i % 500 else "pending", 1, 0, 0))
+        con.executemany("INSERT INTO sessions (session_id, trainee_name, scenario_id, date, total_score, readiness, chat_log, report_path, report_status) VALUES (?,?,?,?,?,?,?,?,?)", rows)
+        con.executemany("INSERT INTO session_grades (session_id, criteria, score, evidence, feedback) VALUES (?,?,?,?,?)", grades)
+        con.executemany("INSERT INTO report_jobs (session_id, status, attempts, created_at, updated_at) VALUES (?,?,?,?,?)", jobs)
+
+def page_sql(filters, after=None):
+    return page_query(filters, 51, after)
+
+def count_sql(filters):
+    clauses, params = _session_filter(filters)
+    return SQL_COUNT_SESSION_HEADERS + (f" WHERE {' AND '.join(clauses)}" if clauses else ""), tuple(params)
+
+def cases(sample_session: str, middle_cursor):
+    return [
+        ("dashboard page 1", *page_sql({})),
+        ("dashboard deep page (keyset)", *page_sql({}, after=middle_cursor)),
+        ("name prefix 'budi 1'", *page_sql({"name_prefix": "budi 1"})),
+        ("role + score band", *page_sql({"role_id": "TELLER", "score_band": ">=80"})),
+        ("readiness filter", *page_sql({"readiness": "BELUM SIAP"})),
+        ("count: score band", *count_sql({"score_band": "60-79"})),
+        ("readiness options", SQL_READINESS_LABELS, ()),
+        ("session grades", SQL_SESSION_GRADES, (sample_session,)),
+        ("scenario rubrics", "SELECT scenario_id, criteria, description FROM grading_rubrics WHERE scenario_id IN (?) ORDER BY rubric_id", ("CS_3",)),
+        ("next report job", SQL_NEXT_PENDING_JOB, ()),
+    ]
+
+def measure(repo: Repository, sql: str, params, repeat: int):
+    with repo.pool.connection() as con:
+        plan = " | ".join(row[-1] for row in con.execute("EXPLAIN QUERY PLAN " + sql, params).fetchall())
+        timings = []
+        for _ in range(repeat):
+            started = time.perf_counter()
+            con.execute(sql, params).fetchall()
+            timings.append((time.perf_counter() - started) * 1000)
+    return plan, statistics.median(timings)
+
+def run(sessions: int, transcript_chars: int, repeat: int):
+    path = os.path.join(tempfile.mkdtemp(prefix="gaia-bench-"), "bench.db")
+    repo = Repository(ConnectionPool(SQLiteBackend(path), size=2))
+    migrate(repo, target=INDEX_VERSION - 1)
+
+    started = time.perf_counter()
+    populate(repo, sessions, transcript_chars)
+    print(f"Populated {sessions} sessions in {time.perf_counter() - started:.1f}s ({path})\n")
+
+    middle = repo.query("SELECT date, session_id FROM sessions ORDER BY date DESC, session_id DESC LIMIT 1 OFFSET ?", (sessions // 2,))[0]
+    workload = cases("SES-0000042", (middle["date"], middle["session_id"]))
+
+    before = {name: measure(repo, sql, params, repeat) for name, sql, params in workload}
+    started = time.perf_counter()
+    migrate(repo, target=INDEX_VERSION)
+    print(f"Index migration applied in {time.perf_counter() - started:.1f}s\n")
+    after = {name: measure(repo, sql, params, repeat) for name, sql, params in workload}
+
+    print(f"{'query':<30} {'before ms':>10} {'after ms':>10} {'speedup':>8}")
+    for name, _, _ in workload:
+        b, a = before[name][1], after[name][1]
+        print(f"{name:<30} {b:>10.2f} {a:>10.2f} {b / a if a else float('inf'):>7.1f}x")
+    print("\nQuery plans")
+    for name, _, _ in workload:
+        print(f"- {name}\n    before: {before[name][0]}\n    after:  {after[name][0]}")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark dashboard queries before/after the index migration.")
+    parser.add_argument("--sessions", type=int, default=50000)
+    parser.add_argument("--transcript-chars", type=int, default=4000, help="Size of each chat_log")
+    parser.add_argument("--repeat", type=int, default=7, help="Timed runs per query (median reported)")
+    args = parser.parse_args()
+    run(args.sessions, args.transcript_chars, args.repeat)
@@ -0,0 +1,63 @@
+"""
+Retrieval benchmark: Chroma similarity search vs the memory-mapped snapshot (vector_index.py).
+
+Builds a throw-away Chroma collection with random vectors, exports it with export_snapshot() and times
+top-k queries on both paths (embedding time excluded). Also reports how many of Chroma's (approximate,
+HNSW) hits the exact memmap top-k agrees with.
+
+    python benchmarks/bench_retriever.py --chunks 30000 --dim 1024
+"""
+import os
+import sys
+import time
+import argparse
+import tempfile
+import statistics
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from vector_index import MemmapIndex, export_snapshot
+
+def timed_ms(fn, queries) -> float:
+    samples = []
+    for query in queries:
+        started = time.perf_counter()
+        fn(query)
+        samples.append((time.perf_counter() - started) * 1000)
+    return statistics.median(samples)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--chunks", type=int, default=30000)
+    parser.add_argument("--dim", type=int, default=1024)
+    parser.add_argument("--k", type=int, default=3)
+    parser.add_argument("--queries", type=int, default=200)
+    args = parser.parse_args()
+
+    from langchain_chroma import Chroma
+    rng = np.random.default_rng(42)
+    vectors = rng.standard_normal((args.chunks, args.dim), dtype=np.float32)
+    queries = rng.standard_normal((args.queries, args.dim), dtype=np.float32)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        store = Chroma(persist_directory=os.path.join(tmp, "chroma"), collection_name="knowledge_base",
+                       collection_metadata={"hnsw:space": "cosine"})
+        for start in range(0, args.chunks, 5000):
+            end = min(start + 5000, args.chunks)
+            store._collection.add(ids=[f"c{i}" for i in range(start, end)], embeddings=vectors[start:end],
+                                  documents=[f"chunk {i}" for i in range(start, end)],
+                                  metadatas=[{"source": "bench.pdf", "page": i} for i in range(start, end)])
+
+        meta = export_snapshot(store, os.path.join(tmp, "snapshot"), kb_version=1)
+        index = MemmapIndex.open(os.path.join(tmp, "snapshot"))
+        print(f"{args.chunks} chunks x {args.dim} dims, export {meta['seconds']}s")
+
+        chroma_ms = timed_ms(lambda q: store.similarity_search_by_vector(q.tolist(), k=args.k), queries)
+        memmap_ms = timed_ms(lambda q: index.search(q, args.k), queries)
+        agree = sum(len({d.id for d in store.similarity_search_by_vector(q.tolist(), k=args.k)} &
+                        {r["id"] for _, r in index.search(q, args.k)}) for q in queries)
+
+        print(f"{'chroma':<8} {chroma_ms:8.3f} ms/query")
+        print(f"{'memmap':<8} {memmap_ms:8.3f} ms/query")
+        print(f"top-{args.k} agreement: {agree / (args.k * args.queries):.1%}")
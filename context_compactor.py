@@ -0,0 +1,66 @@
+"""
+Retrieved-context compaction for TUTORING prompts.
+
+The retriever over-fetches CONTEXT_FETCH_K chunks; compact_documents() then keeps the few that are worth
+their tokens:
+1. exact duplicates (same text after whitespace/case normalization) are dropped,
+2. chunks below CONTEXT_MIN_RELEVANCE cosine similarity to the question are dropped (the best one is kept),
+3. the rest is ordered by MMR (relevance vs. similarity to the chunks already chosen); near-duplicates
+   (similarity >= CONTEXT_DUPLICATE_SIMILARITY to a chosen chunk) are skipped,
+4. at most CONTEXT_MAX_CHUNKS are returned.
+Chunk vectors come from the embedding client, i.e. the embedding cache that ingestion filled, so a turn
+normally costs no extra embedding call. Rendering with source tags and the token cap is done by
+prompt_budget.fit_context.
+"""
+import os
+import re
+import logging
+
+logger = logging.getLogger("gaia")
+
+CONTEXT_FETCH_K = int(os.getenv("CONTEXT_FETCH_K", "8")) # Chunks retrieved per question (0 disables compaction)
+CONTEXT_MAX_CHUNKS = int(os.getenv("CONTEXT_MAX_CHUNKS", "4")) # Chunks kept in the prompt
+CONTEXT_MIN_RELEVANCE = float(os.getenv("CONTEXT_MIN_RELEVANCE", "0.3")) # Cosine similarity floor
+CONTEXT_DUPLICATE_SIMILARITY = float(os.getenv("CONTEXT_DUPLICATE_SIMILARITY", "0.95")) # Near-duplicate cut-off
+CONTEXT_MMR_LAMBDA = float(os.getenv("CONTEXT_MMR_LAMBDA", "0.7")) # 1 = pure relevance, 0 = pure diversity
+
+def _normalized_text(text: str) -> str:
+    return re.sub(r"\s+", " ", text).strip().casefold()
+
+def compact_documents(docs: list, question: str, embeddings, max_chunks: int = CONTEXT_MAX_CHUNKS,
+                      min_relevance: float = CONTEXT_MIN_RELEVANCE, duplicate_similarity: float = CONTEXT_DUPLICATE_SIMILARITY,
+                      mmr_lambda: float = CONTEXT_MMR_LAMBDA, query_vector=None) -> list:
+    """Deduplicated, relevance-filtered, MMR-ordered subset of `docs` (LangChain Documents); `query_vector` skips embedding the question."""
+    import numpy as np
+
+    unique, seen = [], set()
+    for doc in docs:
+        key = _normalized_text(getattr(doc, "page_content", "") or "")
+        if key and key not in seen:
+            seen.add(key)
+            unique.append(doc)
+    if len(unique) <= 1:
+        return unique
+
+    vectors = np.asarray(embeddings.embed_documents([doc.page_content for doc in unique]), dtype=np.float32)
+    vectors /= np.maximum(np.linalg.norm(vectors, axis=1, keepdims=True), 1e-12)
+    query = np.asarray(query_vector if query_vector is not None else embeddings.embed_query(question), dtype=np.float32)
+    relevance = vectors @ (query / max(np.linalg.norm(query), 1e-12))
+
+    candidates = [i for i in np.argsort(-relevance) if relevance[i] >= min_relevance] or [int(np.argmax(relevance))]
+    chosen, dropped = [], 0
+    while candidates and len(chosen) < max_chunks:
+        if chosen:
+            redundancy = (vectors[candidates] @ vectors[chosen].T).max(axis=1)
+            scores = mmr_lambda * relevance[candidates] - (1 - mmr_lambda) * redundancy
+            pick = int(np.argmax(scores))
+            if redundancy[pick] >= duplicate_similarity:
+                candidates.pop(pick)
+                dropped += 1
+                continue
+        else:
+            pick = 0 # Most relevant first
+        chosen.append(candidates.pop(pick))
+
+    logger.debug(f"Context compaction: {len(docs)} retrieved -> {len(unique)} unique -> {len(chosen)} kept ({dropped} near-duplicates)")
+    return [unique[i] for i in chosen]
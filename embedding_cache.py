@@ -0,0 +1,192 @@
+"""
+Content-addressed embedding cache.
+
+CachedEmbeddings wraps any LangChain Embeddings (e.g. OllamaEmbeddings) and implements the same
+interface. Vectors are keyed by (model name, sha256(text)):
+- L1: in-process LRU (OrderedDict)
+- L2: local SQLite file, float32 blobs, evicted by total size (least recently used first)
+"""
+import time
+import array
+import hashlib
+import logging
+import sqlite3
+import threading
+from collections import OrderedDict
+from typing import List
+from langchain_core.embeddings import Embeddings
+
+logger = logging.getLogger("gaia")
+
+TOUCH_FLUSH_SECONDS = 60 # Disk-hit last_used updates are batched: at most one write per interval...
+TOUCH_FLUSH_ITEMS = 512 # ...or once this many hits are pending
+
+def _text_hash(text: str) -> str:
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+def _pack(vector: List[float]) -> bytes:
+    return array.array("f", vector).tobytes()
+
+def _unpack(blob: bytes) -> List[float]:
+    vec = array.array("f")
+    vec.frombytes(blob)
+    return vec.tolist()
+
+class CachedEmbeddings(Embeddings):
+    """Drop-in Embeddings with a memory LRU in front of a size-bounded SQLite store."""
+
+    def __init__(self, underlying: Embeddings, model_name: str, path: str,
+                 memory_items: int = 4096, max_bytes: int = 512 * 1024 * 1024):
+        self.underlying = underlying
+        self.model_name = model_name
+        self.path = path
+        self.memory_items = memory_items
+        self.max_bytes = max_bytes
+        self._lru = OrderedDict()
+        self._lock = threading.Lock()
+        self._stats = {"memory_hits": 0, "disk_hits": 0, "misses": 0}
+        self._touched = {} # text_hash -> last disk hit, not written yet
+        self._touched_at = time.monotonic()
+
+        self._con = sqlite3.connect(path, timeout=30, check_same_thread=False)
+        self._con.execute("PRAGMA journal_mode=WAL;")
+        self._con.execute("PRAGMA synchronous=NORMAL;")
+        self._con.execute('''CREATE TABLE IF NOT EXISTS embeddings (
+            model TEXT,
+            text_hash TEXT,
+            vector BLOB,
+            bytes INTEGER,
+            last_used REAL,
+            PRIMARY KEY (model, text_hash)
+        )''')
+        self._con.execute("CREATE INDEX IF NOT EXISTS idx_embeddings_last_used ON embeddings(last_used)")
+        self._con.commit()
+        self._disk_bytes = self._con.execute("SELECT COALESCE(SUM(bytes), 0) FROM embeddings").fetchone()[0]
+
+    # --- Embeddings interface ---
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        return self._embed(texts, self.underlying.embed_documents)
+
+    def embed_query(self, text: str) -> List[float]:
+        return self._embed([text], lambda batch: [self.underlying.embed_query(batch[0])])[0]
+
+    # --- Cache internals ---
+    def _embed(self, texts: List[str], compute) -> List[List[float]]:
+        keys = [_text_hash(t) for t in texts]
+        results = [None] * len(texts)
+
+        with self._lock:
+            # 1. Memory LRU
+            for i, key in enumerate(keys):
+                vector = self._lru.get(key)
+                if vector is not None:
+                    self._lru.move_to_end(key)
+                    results[i] = vector
+                    self._stats["memory_hits"] += 1
+
+            # 2. SQLite (one query for all memory misses)
+            missing = list({keys[i] for i, v in enumerate(results) if v is None})
+            if missing:
+                found = self._disk_get(missing)
+                for i, key in enumerate(keys):
+                    if results[i] is None and key in found:
+                        results[i] = found[key]
+                        self._remember(key, found[key])
+                        self._stats["disk_hits"] += 1
+
+        # 3. Embedding server (outside the lock, unique texts only)
+        pending = {}
+        for i, key in enumerate(keys):
+            if results[i] is None:
+                pending.setdefault(key, []).append(i)
+        if pending:
+            batch = [texts[idx[0]] for idx in pending.values()]
+            vectors = compute(batch)
+            with self._lock:
+                self._stats["misses"] += len(batch)
+                rows = []
+                for (key, idx), vector in zip(pending.items(), vectors):
+                    for i in idx:
+                        results[i] = vector
+                    self._remember(key, vector)
+                    rows.append((key, vector))
+                self._disk_put(rows)
+
+        return results
+
+    def _remember(self, key: str, vector: List[float]):
+        self._lru[key] = vector
+        self._lru.move_to_end(key)
+        while len(self._lru) > self.memory_items:
+            self._lru.popitem(last=False)
+
+    def _disk_get(self, keys: List[str]) -> dict:
+        found = {}
+        now = time.time()
+        # Stay below SQLite's host parameter limit
+        for start in range(0, len(keys), 500):
+            part = keys[start:start + 500]
+            marks = ",".join("?" * len(part))
+            rows = self._con.execute(
+                f"SELECT text_hash, vector FROM embeddings WHERE model = ? AND text_hash IN ({marks})",
+                [self.model_name, *part]
+            ).fetchall()
+            for text_hash, blob in rows:
+                found[text_hash] = _unpack(blob)
+                self._touched[text_hash] = now
+        # Reads stay off the write lock: recency only matters for eviction, so it is written in batches
+        if len(self._touched) >= TOUCH_FLUSH_ITEMS or time.monotonic() - self._touched_at >= TOUCH_FLUSH_SECONDS:
+            self._flush_touched()
+        return found
+
+    def _flush_touched(self):
+        if self._touched:
+            self._con.executemany(
+                "UPDATE embeddings SET last_used = ? WHERE model = ? AND text_hash = ?",
+                [(used, self.model_name, k) for k, used in self._touched.items()]
+            )
+            self._con.commit()
+            self._touched.clear()
+        self._touched_at = time.monotonic()
+
+    def _disk_put(self, rows: list):
+        now = time.time()
+        payload = []
+        for key, vector in rows:
+            blob = _pack(vector)
+            payload.append((self.model_name, key, blob, len(blob), now))
+            self._disk_bytes += len(blob) # Upper bound (replaced rows, other processes); _evict recounts
+        self._con.executemany("INSERT OR REPLACE INTO embeddings VALUES (?, ?, ?, ?, ?)", payload)
+        self._con.commit()
+        if self._disk_bytes > self.max_bytes:
+            self._evict()
+
+    def _evict(self):
+        """Drops least recently used vectors until the store is back under 90% of max_bytes."""
+        # The running total over-counts replaced rows and misses other processes' writes: recount first
+        self._disk_bytes = self._con.execute("SELECT COALESCE(SUM(bytes), 0) FROM embeddings").fetchone()[0]
+        if self._disk_bytes <= self.max_bytes:
+            return
+        self._flush_touched()
+        target = int(self.max_bytes * 0.9)
+        cursor = self._con.execute("SELECT rowid, bytes FROM embeddings ORDER BY last_used ASC")
+        doomed, freed = [], 0
+        for rowid, size in cursor:
+            if self._disk_bytes - freed <= target:
+                break
+            doomed.append((rowid,))
+            freed += size
+        self._con.executemany("DELETE FROM embeddings WHERE rowid = ?", doomed)
+        self._con.commit()
+        self._disk_bytes -= freed
+        logger.info(f"Embedding cache: evicted {len(doomed)} vectors ({freed} bytes)")
+
+    def stats(self) -> dict:
+        """Hit/miss counters since process start plus current cache sizes."""
+        with self._lock:
+            stats = dict(self._stats)
+            stats["memory_items"] = len(self._lru)
+            stats["disk_bytes"] = self._disk_bytes
+        lookups = stats["memory_hits"] + stats["disk_hits"] + stats["misses"]
+        stats["hit_rate"] = (stats["memory_hits"] + stats["disk_hits"]) / lookups if lookups else 0.0
+        return stats
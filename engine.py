@@ -1,104 +1,81 @@
 import os
 import re
-import pandas as pd
+import asyncio
 import json
 import time
+import hashlib
 import logging
-import sqlite3
+import threading
 from datetime import datetime
-from typing import Dict
+from collections import OrderedDict
+from typing import Dict, TYPE_CHECKING
 from dotenv import load_dotenv
-from docx import Document
-from docx.shared import Pt, Inches, RGBColor
-from docx.enum.text import WD_ALIGN_PARAGRAPH
-from langchain_ollama import OllamaEmbeddings
-from langchain_chroma import Chroma
-from langchain_core.prompts import ChatPromptTemplate
-from langchain_ollama.llms import OllamaLLM
-from langchain_core.output_parsers import StrOutputParser
+from repository import Repository, ConnectionPool, SQLiteBackend, PostgresBackend
+from migrations import migrate, LATEST_VERSION
+from prompt_budget import PROMPT_TOKEN_BUDGET, allocate_budget, estimate_tokens, fit_context, fit_history
+
+# Heavy dependencies (pandas, python-docx, langchain_*, chromadb) are imported inside the functions that use
+# them, and model clients are built on first use, so importing engine (dashboard, CLIs, jobs) stays cheap.
+if TYPE_CHECKING:
+    from langchain_core.prompts import ChatPromptTemplate
 
 # Define Folders
 load_dotenv()
-DB_NAME = "gaia.db"
+DB_NAME = os.getenv("DB_NAME", "gaia.db") # SQLite Database
+DB_BACKEND = os.getenv("DB_BACKEND", "sqlite") # sqlite | postgres
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "8")) # Max pooled connections per process
+MESSAGE_COMPRESS_MIN_BYTES = int(os.getenv("MESSAGE_COMPRESS_MIN_BYTES", "2048")) # 0 disables message compression
 UPLOAD_DIR = os.getenv("UPLOAD_DIR", "./uploaded_pdfs") # Documents Dir
 PERSIST_DIR = os.getenv("PERSIST_DIR", "./chroma_store") # Vector Data Dir
 REPORTS_DIR = os.getenv("REPORTS_DIR", "./reports") # Reports Dir
+KB_CHECK_INTERVAL = float(os.getenv("KB_CHECK_INTERVAL", "10")) # Seconds between index version checks
+RETRIEVER_BACKEND = os.getenv("RETRIEVER_BACKEND", "chroma") # chroma | memmap (exact top-k over a memory-mapped snapshot)
+KB_SNAPSHOT_DIR = os.getenv("KB_SNAPSHOT_DIR", os.path.join(PERSIST_DIR, "kb_snapshot")) # Memmap snapshots
+EMBED_CACHE_PATH = os.getenv("EMBED_CACHE_PATH", os.path.join(PERSIST_DIR, "embedding_cache.db")) # Embedding Cache
+EMBED_CACHE_MAX_MB = int(os.getenv("EMBED_CACHE_MAX_MB", "512"))
+RESPONSE_CACHE_PATH = os.getenv("RESPONSE_CACHE_PATH", os.path.join(PERSIST_DIR, "response_cache.db")) # LLM Response Cache
+RESPONSE_CACHE_MAX_MB = int(os.getenv("RESPONSE_CACHE_MAX_MB", "256"))
+RESPONSE_CACHE_TTL = float(os.getenv("RESPONSE_CACHE_TTL", str(7 * 24 * 3600))) # Seconds an answer may be reused
+SEMANTIC_CACHE_THRESHOLD = float(os.getenv("SEMANTIC_CACHE_THRESHOLD", "0.95")) # Cosine similarity to answer a TUTORING question from the cache
+SEMANTIC_CACHE_DRAFT_THRESHOLD = float(os.getenv("SEMANTIC_CACHE_DRAFT_THRESHOLD", "0.88")) # Similarity to use a cached answer as draft context
+SEMANTIC_CACHE_MAX_ITEMS = int(os.getenv("SEMANTIC_CACHE_MAX_ITEMS", "5000")) # 0 disables the semantic cache
+RESPONSE_CACHE_PHASES = [p.strip() for p in os.getenv("RESPONSE_CACHE_PHASES", "GREETING,TUTORING,ROLEPLAY,GRADING").split(",") if p.strip()] # Empty disables the cache
 os.makedirs(REPORTS_DIR, exist_ok=True)
 os.makedirs(UPLOAD_DIR, exist_ok=True)
+os.makedirs(PERSIST_DIR, exist_ok=True)
+
+# Embedding & LLM Models (clients are built lazily, see get_embeddings / get_llm)
+EMBED_MODEL = "mxbai-embed-large"
 
-# Embedding & LLM Models
-embeddings = OllamaEmbeddings(model="mxbai-embed-large")
-llm = OllamaLLM(model="qwen3-vl:235b-cloud", base_url="http://localhost:11434")
+# Data Access Layer (pooled connections, same pragmas everywhere)
+if DB_BACKEND == "postgres":
+    _db_backend = PostgresBackend(os.environ["DATABASE_URL"])
+else:
+    _db_backend = SQLiteBackend(DB_NAME)
+repo = Repository(ConnectionPool(_db_backend, size=DB_POOL_SIZE), compress_min_bytes=MESSAGE_COMPRESS_MIN_BYTES)
 
 # Initialize DB
-def init_db():
-  """Initializes the SQLite database with the sessions table."""
-  con = sqlite3.connect(DB_NAME, timeout=30, check_same_thread=False)
-  # improve concurrency
-  con.execute("PRAGMA journal_mode=WAL;")
-  con.execute("PRAGMA synchronous=NORMAL;")
-  c = con.cursor()
-  # Table: Roles (Categories)
-  c.execute('''CREATE TABLE IF NOT EXISTS roles (
-      role_id TEXT PRIMARY KEY,
-      role_name TEXT
-  )''')
-
-  # Table: Scenarios (The Content Pairs)
-  # Linked to Role. Stores the Prompts.
-  c.execute('''CREATE TABLE IF NOT EXISTS scenarios (
-      scenario_id TEXT PRIMARY KEY,
-      role_id TEXT,
-      topic TEXT,
-      mentor_persona TEXT,
-      simulation_persona TEXT,
-      scenario_details TEXT,
-      FOREIGN KEY(role_id) REFERENCES roles(role_id)
-  )''')
-
-  # Table: Grading Rubrics (Prompt Parameters)
-  # Stores the criteria list for the AI.
-  c.execute('''CREATE TABLE IF NOT EXISTS grading_rubrics (
-      rubric_id INTEGER PRIMARY KEY AUTOINCREMENT,
-      scenario_id TEXT,
-      criteria TEXT,
-      description TEXT,
-      FOREIGN KEY(scenario_id) REFERENCES scenarios(scenario_id)
-  )''')
-
-  # Table: Sessions (Header)
-  # Replaced 'user_id' with 'trainee_name' for simple tracking.
-  c.execute('''CREATE TABLE IF NOT EXISTS sessions (
-      session_id TEXT PRIMARY KEY,
-      trainee_name TEXT,
-      scenario_id TEXT,
-      date TEXT,
-      total_score INTEGER,
-      readiness TEXT,
-      chat_log TEXT,
-      report_path TEXT,
-      FOREIGN KEY(scenario_id) REFERENCES scenarios(scenario_id)
-  )''')
-
-  # Table: Session Grades (Detail)
-  # Stores specific scores/feedback per criteria.
-  c.execute('''CREATE TABLE IF NOT EXISTS session_grades (
-      grade_id INTEGER PRIMARY KEY AUTOINCREMENT,
-      session_id TEXT,
-      criteria TEXT,
-      score INTEGER,
-      evidence TEXT,
-      feedback TEXT,
-      FOREIGN KEY(session_id) REFERENCES sessions(session_id)
-  )''')
-
-  con.commit()
+_db_init_lock = threading.Lock()
+_db_ready = False
 
+def init_db():
+  """
+  Brings the schema up to date (versioned steps in migrations.py) and seeds an empty database.
+  Runs once per process; later calls return immediately.
+  """
+  global _db_ready
+  with _db_init_lock:
+    if _db_ready:
+      return
+    applied = migrate(repo)
+    if applied:
+      logger.info(f"Schema migrated to version {LATEST_VERSION} (applied {applied})")
+    _seed_if_empty()
+    _db_ready = True
+
+def _seed_if_empty():
   # CHECK DATA EXISTENCE
-  c.execute("SELECT count(*) FROM roles")
-  data_count = c.fetchone()[0]
-  
-  con.close()
+  data_count = repo.count_roles()
 
   # Only seed if roles table is empty
   if data_count == 0:
@@ -107,108 +84,120 @@ def init_db():
   else:
       logger.info("Database already contains data. Skipping seed.")
 
+  # Seeded sessions bypass save_session, so build their rollups here
+  if not repo.kpis_populated() and repo.count_sessions():
+      logger.info("Building KPI rollups...")
+      repo.rebuild_kpis()
+
 def seed_db():
     """
     Populates the DB with initial Role/Scenario data AND Dummy Sessions
     to ensure the Dashboard functions correctly out-of-the-box.
     """
-    con = sqlite3.connect(DB_NAME, timeout=30, check_same_thread=False)
-    con.execute("PRAGMA journal_mode=WAL;")
-    con.execute("PRAGMA synchronous=NORMAL;")
-    c = con.cursor()
+    seeded_transcripts = []
+    with repo.pool.transaction() as con:
+        c = con.cursor()
 
-    # Check if roles exist to avoid duplicates
-    c.execute("SELECT count(*) FROM roles")
-    if c.fetchone()[0] == 0:
-        print("Seeding Core Data (Roles, Scenarios, Rubrics)...")
+        # Check if roles exist to avoid duplicates
+        c.execute("SELECT count(*) FROM roles")
+        if c.fetchone()[0] == 0:
+            print("Seeding Core Data (Roles, Scenarios, Rubrics)...")
         
-        # 1. Insert Roles
-        roles = [
-            ("CS", "Customer Service"),
-            ("TELLER", "Bank Teller")
-        ]
-        c.executemany("INSERT INTO roles VALUES (?,?)", roles)
-
-        # 2. Insert Scenarios
-        scenarios = [
-            (
-                "TELLER_CASH", "TELLER", 
-                "Penanganan Uang Meragukan (Counterfeit) pada Nasabah Prioritas",
-                "Anda adalah Senior Head Teller bernama 'Pak Teguh'. Anda adalah perwujudan dari 'Zero Tolerance Policy'.", 
-                "Anda adalah 'Bapak Hartono', nasabah Prioritas (Solitaire) pemilik jaringan ritel terbesar di kota ini.", 
-                "Bapak Hartono menyetor Rp 200 Juta tunai hasil penjualan toko. Mesin hitung menolak (reject) 2 lembar pecahan Rp 100.000."
-            ),
-            (
-                "CS_COMPLAINT", "CS", 
-                "Handling Panic Customer: Indikasi Social Engineering (Fraud)",
-                "Anda adalah Service Quality Manager bernama 'Ibu Sari'. Anda fokus pada 'Customer Journey' dan 'Empathy'.",
-                "Anda adalah 'Ibu Lina', seorang pengusaha katering. Anda baru saja menerima telepon yang mengaku dari pihak bank.", 
-                "Nasabah datang dengan histeris karena saldonya terkuras setelah mengklik file .APK undangan pernikahan (Phishing)."
-            ),
-            (
-                "CS_WARKAT", "CS", 
-                "Layanan Warkat (Edukasi Nasabah Awam)",
-                "Anda adalah Senior CS Officer. Fokus Anda adalah 'Customer Education' dan 'Communication Skill'. Anda ingin melihat apakah Trainee bisa menjelaskan istilah perbankan yang rumit (seperti SLA, Cut-off, Autodebet) menjadi bahasa manusiawi yang mudah dimengerti oleh orang awam.",
-                "Anda adalah 'Pak Santoso', seorang pensiunan yang baru mencoba membuka usaha toko kelontong. Gaya bicara Anda sangat sopan, pelan, dan kebapakan. Anda sangat awam soal bank. Anda berpikir mengambil buku Cek itu sama seperti membeli buku tulis di toko: Bayar uangnya di kasir, lalu barangnya langsung dibawa pulang saat itu juga.", 
-                "Pak Santoso menyerahkan resi dan uang tunai Rp 275.000 di meja. Beliau meminta buku cek-nya sekarang karena mau dipakai bayar supplier nanti sore. Beliau tidak marah, hanya benar-benar bingung kenapa 'beli buku' saja harus menunggu besok dan tidak bisa bayar tunai. Tantangan: Jelaskan prosedur tanpa membuat nasabah merasa bodoh."
-            ),
-            (
-                "CSO_Giro_Tapres", "CS", 
-                "Layanan Cetak Mutasi & Info Produk (Giro & Tapres)",
-                "Anda adalah Customer Service Professional. Fokus utama Anda adalah akurasi data dan 'Product Knowledge'. Anda harus menghafal biaya layanan (Mutasi) dan syarat pembukaan rekening (Giro/Tapres) di luar kepala. Pastikan Anda selalu melakukan verifikasi identitas (KTP & Kartu ATM) sebelum memproses permintaan cetak dokumen. Nada bicara ramah namun lugas.",
-                "Anda adalah 'Bapak Budi', seorang nasabah lama yang ingin mencetak mutasi rekening Tapres untuk transaksi minggu lalu (Senin-Jumat). Anda juga seorang pemilik usaha kecil yang sedang menjajaki pembukaan rekening Giro. Anda cukup detail mengenai biaya-biaya administrasi (per lembar) dan ingin tahu modal awal (setoran) untuk buka Giro.", 
-                "Nasabah ingin cetak mutasi Tapres periode Senin-Jumat minggu lalu. Nasabah juga bertanya biaya cetak per lembar dan persyaratan setoran awal untuk pembukaan rekening Giro Rupiah. Tantangan: Berikan informasi biaya yang akurat (Rp 2.500) dan setoran awal Giro (Rp 1 Juta)."
-            ),
-        ]
-        c.executemany("INSERT INTO scenarios VALUES (?,?,?,?,?,?)", scenarios)
-
-        # 3. Insert Rubrics
-        rubrics = [
-            ("TELLER_CASH", "Sikap Profesional & Tenang", "Trainee tidak boleh terlihat gugup."),
-            ("TELLER_CASH", "Pemilihan Kata (Euphemism)", "DILARANG menggunakan kata 'PALSU' sebelum verifikasi."),
-            ("CS_COMPLAINT", "Immediate Security Action", "Langkah pertama Trainee HARUS melakukan pemblokiran."),
-            ("CS_COMPLAINT", "Empati Tanpa Menjanjikan", "Mengucapkan keprihatinan mendalam tanpa janji palsu."),
-            ("CS_WARKAT", "Informasi SLA (Waktu)", "Menjelaskan waktu pengambilan (H+1/H+2) dengan bahasa halus. Contoh: 'Mohon ditunggu ya Pak, karena bukunya perlu kami cetak khusus atas nama Bapak, jadi baru siap besok'."),
-            ("CS_WARKAT", "Edukasi Pembayaran (Non-Tunai)", "Menolak pembayaran tunai dengan sopan dan menjelaskan sistem Autodebet. Contoh: 'Untuk biayanya Bapak tidak perlu repot bayar tunai disini, nanti otomatis terpotong dari saldo tabungan Bapak'."),
-            ("CSO_Giro_Tapres", "Kepatuhan Prosedur (Procedural Compliance)", "Trainee harus mampu menjalankan seluruh prosedur layanan dengan tepat (sesuai SOP) dan menjawab semua pertanyaan yang diajukan nasabah dengan benar dan akurat."),
-            ("CSO_Giro_Tapres", "Product Knowledge (Giro)", "Menjelaskan dengan tepat bahwa setoran awal untuk pembukaan rekening Giro Rupiah adalah Rp 1.000.000."),
-            ("CSO_Giro_Tapres", "Standar Layanan & Personalisasi", "Trainee wajib memberikan sambutan yang hangat (warm greeting), dan menyebut nama nasabah minimal 3 kali selama proses pelayanan berlangsung."),
-            ("CSO_Giro_Tapres", "Akhir Layanan (Closing)", "Pada akhir interaksi, Trainee harus melakukan 3 hal: Menawarkan bantuan lain ('Ada lagi yang bisa dibantu?'), mengucapkan salam penutup yang sesuai standar, dan wajib mengucapkan 'Magic Word' (Terima Kasih)."),
-        ]
-        c.executemany("INSERT INTO grading_rubrics (scenario_id, criteria, description) VALUES (?,?,?)", rubrics)
-
-    # 4. Insert Dummy Sessions (For Dashboard Visualization)
-    c.execute("SELECT count(*) FROM sessions")
-    if c.fetchone()[0] == 0:
-        print("Seeding Dummy Session Data...")
+            # 1. Insert Roles
+            roles = [
+                ("CS", "Customer Service"),
+                ("TELLER", "Bank Teller")
+            ]
+            c.executemany("INSERT INTO roles VALUES (?,?)", roles)
+
+            # 2. Insert Scenarios
+            scenarios = [
+                (
+                    "TELLER_CASH", "TELLER", 
+                    "Penanganan Uang Meragukan (Counterfeit) pada Nasabah Prioritas",
+                    "Anda adalah Senior Head Teller bernama 'Pak Teguh'. Anda adalah perwujudan dari 'Zero Tolerance Policy'.", 
+                    "Anda adalah 'Bapak Hartono', nasabah Prioritas (Solitaire) pemilik jaringan ritel terbesar di kota ini.", 
+                    "Bapak Hartono menyetor Rp 200 Juta tunai hasil penjualan toko. Mesin hitung menolak (reject) 2 lembar pecahan Rp 100.000."
+                ),
+                (
+                    "CS_COMPLAINT", "CS", 
+                    "Handling Panic Customer: Indikasi Social Engineering (Fraud)",
+                    "Anda adalah Service Quality Manager bernama 'Ibu Sari'. Anda fokus pada 'Customer Journey' dan 'Empathy'.",
+                    "Anda adalah 'Ibu Lina', seorang pengusaha katering. Anda baru saja menerima telepon yang mengaku dari pihak bank.", 
+                    "Nasabah datang dengan histeris karena saldonya terkuras setelah mengklik file .APK undangan pernikahan (Phishing)."
+                ),
+                (
+                    "CS_WARKAT", "CS", 
+                    "Layanan Warkat (Edukasi Nasabah Awam)",
+                    "Anda adalah Senior CS Officer. Fokus Anda adalah 'Customer Education' dan 'Communication Skill'. Anda ingin melihat apakah Trainee bisa menjelaskan istilah perbankan yang rumit (seperti SLA, Cut-off, Autodebet) menjadi bahasa manusiawi yang mudah dimengerti oleh orang awam.",
+                    "Anda adalah 'Pak Santoso', seorang pensiunan yang baru mencoba membuka usaha toko kelontong. Gaya bicara Anda sangat sopan, pelan, dan kebapakan. Anda sangat awam soal bank. Anda berpikir mengambil buku Cek itu sama seperti membeli buku tulis di toko: Bayar uangnya di kasir, lalu barangnya langsung dibawa pulang saat itu juga.", 
+                    "Pak Santoso menyerahkan resi dan uang tunai Rp 275.000 di meja. Beliau meminta buku cek-nya sekarang karena mau dipakai bayar supplier nanti sore. Beliau tidak marah, hanya benar-benar bingung kenapa 'beli buku' saja harus menunggu besok dan tidak bisa bayar tunai. Tantangan: Jelaskan prosedur tanpa membuat nasabah merasa bodoh."
+                ),
+                (
+                    "CSO_Giro_Tapres", "CS", 
+                    "Layanan Cetak Mutasi & Info Produk (Giro & Tapres)",
+                    "Anda adalah Customer Service Professional. Fokus utama Anda adalah akurasi data dan 'Product Knowledge'. Anda harus menghafal biaya layanan (Mutasi) dan syarat pembukaan rekening (Giro/Tapres) di luar kepala. Pastikan Anda selalu melakukan verifikasi identitas (KTP & Kartu ATM) sebelum memproses permintaan cetak dokumen. Nada bicara ramah namun lugas.",
+                    "Anda adalah 'Bapak Budi', seorang nasabah lama yang ingin mencetak mutasi rekening Tapres untuk transaksi minggu lalu (Senin-Jumat). Anda juga seorang pemilik usaha kecil yang sedang menjajaki pembukaan rekening Giro. Anda cukup detail mengenai biaya-biaya administrasi (per lembar) dan ingin tahu modal awal (setoran) untuk buka Giro.", 
+                    "Nasabah ingin cetak mutasi Tapres periode Senin-Jumat minggu lalu. Nasabah juga bertanya biaya cetak per lembar dan persyaratan setoran awal untuk pembukaan rekening Giro Rupiah. Tantangan: Berikan informasi biaya yang akurat (Rp 2.500) dan setoran awal Giro (Rp 1 Juta)."
+                ),
+            ]
+            c.executemany("INSERT INTO scenarios VALUES (?,?,?,?,?,?)", scenarios)
+
+            # 3. Insert Rubrics
+            rubrics = [
+                ("TELLER_CASH", "Sikap Profesional & Tenang", "Trainee tidak boleh terlihat gugup."),
+                ("TELLER_CASH", "Pemilihan Kata (Euphemism)", "DILARANG menggunakan kata 'PALSU' sebelum verifikasi."),
+                ("CS_COMPLAINT", "Immediate Security Action", "Langkah pertama Trainee HARUS melakukan pemblokiran."),
+                ("CS_COMPLAINT", "Empati Tanpa Menjanjikan", "Mengucapkan keprihatinan mendalam tanpa janji palsu."),
+                ("CS_WARKAT", "Informasi SLA (Waktu)", "Menjelaskan waktu pengambilan (H+1/H+2) dengan bahasa halus. Contoh: 'Mohon ditunggu ya Pak, karena bukunya perlu kami cetak khusus atas nama Bapak, jadi baru siap besok'."),
+                ("CS_WARKAT", "Edukasi Pembayaran (Non-Tunai)", "Menolak pembayaran tunai dengan sopan dan menjelaskan sistem Autodebet. Contoh: 'Untuk biayanya Bapak tidak perlu repot bayar tunai disini, nanti otomatis terpotong dari saldo tabungan Bapak'."),
+                ("CSO_Giro_Tapres", "Kepatuhan Prosedur (Procedural Compliance)", "Trainee harus mampu menjalankan seluruh prosedur layanan dengan tepat (sesuai SOP) dan menjawab semua pertanyaan yang diajukan nasabah dengan benar dan akurat."),
+                ("CSO_Giro_Tapres", "Product Knowledge (Giro)", "Menjelaskan dengan tepat bahwa setoran awal untuk pembukaan rekening Giro Rupiah adalah Rp 1.000.000."),
+                ("CSO_Giro_Tapres", "Standar Layanan & Personalisasi", "Trainee wajib memberikan sambutan yang hangat (warm greeting), dan menyebut nama nasabah minimal 3 kali selama proses pelayanan berlangsung."),
+                ("CSO_Giro_Tapres", "Akhir Layanan (Closing)", "Pada akhir interaksi, Trainee harus melakukan 3 hal: Menawarkan bantuan lain ('Ada lagi yang bisa dibantu?'), mengucapkan salam penutup yang sesuai standar, dan wajib mengucapkan 'Magic Word' (Terima Kasih)."),
+            ]
+            c.executemany("INSERT INTO grading_rubrics (scenario_id, criteria, description) VALUES (?,?,?)", rubrics)
+
+            # Retrieval scope: the role's manuals (uploaded_pdfs/<ROLE>/) plus shared documents
+            c.executemany("INSERT INTO scenario_documents (scenario_id, doc_set) VALUES (?,?)",
+                          [(s[0], doc_set) for s in scenarios for doc_set in (s[1], "general")])
+
+        # 4. Insert Dummy Sessions (For Dashboard Visualization)
+        c.execute("SELECT count(*) FROM sessions")
+        if c.fetchone()[0] == 0:
+            print("Seeding Dummy Session Data...")
         
-        # Format: session_id, trainee_name, scenario_id, date, total_score, readiness, chat_log
-        dummy_sessions = [
-            ("SES-101", "Andi Saputra", "TELLER_CASH", "2024-10-01 09:30", 88, "SIAP TERJUN", "System: Welcome...", "Unavailable"),
-            ("SES-102", "Budi Santoso", "CS_COMPLAINT", "2024-10-02 10:15", 55, "BELUM SIAP", "System: Welcome...", "Unavailable"),
-            ("SES-103", "Citra Lestari", "TELLER_CASH", "2024-10-03 11:00", 92, "SIAP TERJUN", "System: Welcome...", "Unavailable"),
-            ("SES-104", "Dewi Persik", "CS_COMPLAINT", "2024-10-04 13:45", 76, "BUTUH LATIHAN", "System: Welcome...", "Unavailable"),
-            ("SES-105", "Eko Patrio", "TELLER_CASH", "2024-10-05 14:30", 65, "BUTUH LATIHAN", "System: Welcome...", "Unavailable"),
-            ("SES-106", "Fajar Hadi", "CS_COMPLAINT", "2024-10-06 15:00", 40, "BELUM SIAP", "System: Welcome...", "Unavailable"),
-            ("SES-107", "Gita Gutawa", "TELLER_CASH", "2024-10-07 08:30", 95, "SIAP TERJUN", "System: Welcome...", "Unavailable"),
-            ("SES-108", "Hesti Purwadinata", "CS_COMPLAINT", "2024-10-07 09:00", 82, "SIAP TERJUN", "System: Welcome...", "Unavailable"),
-            ("SES-109", "Indra Bekti", "TELLER_CASH", "2024-10-08 10:45", 70, "BUTUH LATIHAN", "System: Welcome...", "Unavailable"),
-            ("SES-110", "Joko Anwar", "CS_COMPLAINT", "2024-10-08 11:30", 89, "SIAP TERJUN", "System: Welcome...", "Unavailable")
-        ]
-        c.executemany("INSERT INTO sessions VALUES (?,?,?,?,?,?,?,?)", dummy_sessions)
-
-        # 5. Insert Dummy Grades (Linked to Sessions)
-        # Format: session_id, criteria, score, evidence, feedback
-        dummy_grades = [
-            ("SES-101", "Sikap Profesional & Tenang", 90, "Nasabah marah, trainee tetap senyum", "Good job maintaining composure."),
-            ("SES-101", "Pemilihan Kata (Euphemism)", 85, "Menggunakan istilah 'diragukan'", "Tepat sekali."),
-            ("SES-102", "Immediate Security Action", 20, "Hanya mendengarkan curhat nasabah", "Fatal: Lupa blokir rekening."),
-            ("SES-102", "Empati Tanpa Menjanjikan", 90, "Saya turut prihatin bu", "Empati bagus."),
-        ]
-        c.executemany("INSERT INTO session_grades (session_id, criteria, score, evidence, feedback) VALUES (?,?,?,?,?)", dummy_grades)
+            # Format: session_id, trainee_name, scenario_id, date, total_score, readiness, chat_log
+            dummy_sessions = [
+                ("SES-101", "Andi Saputra", "TELLER_CASH", "2024-10-01 09:30", 88, "SIAP TERJUN", "System: Welcome...", "Unavailable"),
+                ("SES-102", "Budi Santoso", "CS_COMPLAINT", "2024-10-02 10:15", 55, "BELUM SIAP", "System: Welcome...", "Unavailable"),
+                ("SES-103", "Citra Lestari", "TELLER_CASH", "2024-10-03 11:00", 92, "SIAP TERJUN", "System: Welcome...", "Unavailable"),
+                ("SES-104", "Dewi Persik", "CS_COMPLAINT", "2024-10-04 13:45", 76, "BUTUH LATIHAN", "System: Welcome...", "Unavailable"),
+                ("SES-105", "Eko Patrio", "TELLER_CASH", "2024-10-05 14:30", 65, "BUTUH LATIHAN", "System: Welcome...", "Unavailable"),
+                ("SES-106", "Fajar Hadi", "CS_COMPLAINT", "2024-10-06 15:00", 40, "BELUM SIAP", "System: Welcome...", "Unavailable"),
+                ("SES-107", "Gita Gutawa", "TELLER_CASH", "2024-10-07 08:30", 95, "SIAP TERJUN", "System: Welcome...", "Unavailable"),
+                ("SES-108", "Hesti Purwadinata", "CS_COMPLAINT", "2024-10-07 09:00", 82, "SIAP TERJUN", "System: Welcome...", "Unavailable"),
+                ("SES-109", "Indra Bekti", "TELLER_CASH", "2024-10-08 10:45", 70, "BUTUH LATIHAN", "System: Welcome...", "Unavailable"),
+                ("SES-110", "Joko Anwar", "CS_COMPLAINT", "2024-10-08 11:30", 89, "SIAP TERJUN", "System: Welcome...", "Unavailable")
+            ]
+            c.executemany("INSERT INTO sessions (session_id, trainee_name, scenario_id, date, total_score, readiness, report_path) VALUES (?,?,?,?,?,?,?)",
+                          [row[:6] + row[7:] for row in dummy_sessions])
+            seeded_transcripts = [(row[0], row[6]) for row in dummy_sessions]
+
+            # 5. Insert Dummy Grades (Linked to Sessions)
+            # Format: session_id, criteria, score, evidence, feedback
+            dummy_grades = [
+                ("SES-101", "Sikap Profesional & Tenang", 90, "Nasabah marah, trainee tetap senyum", "Good job maintaining composure."),
+                ("SES-101", "Pemilihan Kata (Euphemism)", 85, "Menggunakan istilah 'diragukan'", "Tepat sekali."),
+                ("SES-102", "Immediate Security Action", 20, "Hanya mendengarkan curhat nasabah", "Fatal: Lupa blokir rekening."),
+                ("SES-102", "Empati Tanpa Menjanjikan", 90, "Saya turut prihatin bu", "Empati bagus."),
+            ]
+            c.executemany("INSERT INTO session_grades (session_id, criteria, score, evidence, feedback) VALUES (?,?,?,?,?)", dummy_grades)
+
+    # Transcripts live in the message store (one row per turn)
+    for session_id, text in seeded_transcripts:
+        repo.append_message(session_id, "GREETING", "system", text)
 
-    con.commit()
-    con.close()
     print("Database seeding complete.")
 
 # Logger
@@ -234,18 +223,15 @@ def setup_logger(name="gaia"):
 logger = setup_logger()
 
 def format_chat_history(messages: list) -> str:
-  formatted_history = ""
-  for msg in messages:
-    role = msg["role"].upper()
-    content = msg["content"]
-    formatted_history += f"{role}: {content}\n"
-  return formatted_history
+  """Full, unbudgeted transcript (reports, GRADING prompts). Other prompts use prompt_budget.fit_history."""
+  return "".join(f"{msg['role'].upper()}: {msg['content']}\n" for msg in messages)
 
 # Load the vectors
 def load_vectors():
+    from langchain_chroma import Chroma
     vectorstore = Chroma(
         persist_directory=PERSIST_DIR,
-        embedding_function=embeddings,
+        embedding_function=get_embeddings(),
         collection_name="knowledge_base"
     )
 
@@ -255,6 +241,145 @@ def load_vectors():
 def get_retriever(vectorstore, k=3):
     return vectorstore.as_retriever(search_kwargs={"k": k})
 
+# ---------------------------------------------------------
+# SHARED RESOURCES (one instance per process, shared by every session)
+# ---------------------------------------------------------
+_resources = {}
+_resources_lock = threading.RLock() # Re-entrant: the retriever factory builds the vector store
+_kb_state = {"version": None, "checked_at": 0.0}
+
+def _build_llm(backend: str):
+    # Backends, timeouts and failover order are configured in llm_backends.py (LLM_BACKENDS / LLM_CONFIG_FILE)
+    from llm_backends import RoutedLLM, build_client
+    if backend == "auto":
+        return RoutedLLM(get_client=get_llm)
+    return build_client(backend)
+
+def _build_embeddings():
+    from langchain_ollama import OllamaEmbeddings
+    from embedding_cache import CachedEmbeddings
+    return CachedEmbeddings(
+        OllamaEmbeddings(model=EMBED_MODEL),
+        model_name=EMBED_MODEL,
+        path=EMBED_CACHE_PATH,
+        max_bytes=EMBED_CACHE_MAX_MB * 1024 * 1024
+    )
+
+def _build_response_cache():
+    from response_cache import ResponseCache
+    return ResponseCache(
+        RESPONSE_CACHE_PATH,
+        ttl=RESPONSE_CACHE_TTL,
+        max_bytes=RESPONSE_CACHE_MAX_MB * 1024 * 1024,
+        phases=RESPONSE_CACHE_PHASES
+    )
+
+def _build_semantic_cache():
+    from semantic_cache import SemanticCache
+    return SemanticCache(SEMANTIC_CACHE_THRESHOLD, SEMANTIC_CACHE_DRAFT_THRESHOLD, SEMANTIC_CACHE_MAX_ITEMS)
+
+def _build_kb_index():
+    # Snapshots are normally exported by ingest.py; a missing or stale one is re-exported from Chroma here
+    from vector_index import MemmapIndex, export_snapshot
+    index = MemmapIndex.open(KB_SNAPSHOT_DIR)
+    if index is None or index.stale(_kb_state["version"]):
+        logger.info(f"KB snapshot missing or stale, exporting v{_kb_state['version']} from Chroma")
+        export_snapshot(get_vectorstore(), KB_SNAPSHOT_DIR, kb_version=_kb_state["version"])
+        index = MemmapIndex.open(KB_SNAPSHOT_DIR)
+    return index
+
+def _build_retriever(k: int):
+    if RETRIEVER_BACKEND == "memmap":
+        from vector_index import MemmapRetriever
+        return MemmapRetriever(index=_get_resource("kb_index", _build_kb_index), embeddings=get_embeddings(), k=k)
+    return get_retriever(get_vectorstore(), k=k)
+
+def _get_resource(name: str, factory):
+    # Fast path without the lock; the lock only guards first construction
+    resource = _resources.get(name)
+    if resource is None:
+        with _resources_lock:
+            resource = _resources.get(name)
+            if resource is None:
+                logger.info(f"Initializing shared resource: {name}")
+                resource = factory()
+                _resources[name] = resource
+    return resource
+
+def _check_kb_version():
+    """Reloads the vector resources when ingestion bumped the Knowledge Base version."""
+    now = time.monotonic()
+    if now - _kb_state["checked_at"] < KB_CHECK_INTERVAL:
+        return
+    _kb_state["checked_at"] = now
+
+    from ingest import kb_version
+    version = kb_version()
+    if _kb_state["version"] is not None and version != _kb_state["version"]:
+        logger.info(f"Knowledge Base changed (v{_kb_state['version']} -> v{version}), reloading vector store")
+        reload_resources("vectorstore", "kb_index", "retriever", "semantic_cache")
+    _kb_state["version"] = version
+
+def get_vectorstore():
+    """Process-wide Chroma instance."""
+    _check_kb_version()
+    return _get_resource("vectorstore", load_vectors)
+
+def get_shared_retriever(k: int = 3):
+    """Process-wide retriever over the shared vector store (or its memory-mapped snapshot, see RETRIEVER_BACKEND)."""
+    _check_kb_version()
+    return _get_resource(f"retriever:{k}", lambda: _build_retriever(k))
+
+def get_llm(backend: str = "auto", create: bool = True):
+    """
+    Process-wide LLM client (connection pool) for the given backend.
+    "auto" is the router over every configured backend (retries + latency-aware failover).
+    With create=False returns None until something in this process has used it.
+    """
+    if not create:
+        return _resources.get(f"llm:{backend}")
+    return _get_resource(f"llm:{backend}", lambda: _build_llm(backend))
+
+def get_embeddings(create: bool = True):
+    """
+    Process-wide embedding client (Ollama behind the persistent embedding cache).
+    With create=False returns None until something in this process has used it.
+    """
+    if not create:
+        return _resources.get("embeddings")
+    return _get_resource("embeddings", _build_embeddings)
+
+def get_response_cache(create: bool = True):
+    """Process-wide exact-match LLM response cache (None when RESPONSE_CACHE_PHASES is empty)."""
+    if not RESPONSE_CACHE_PHASES or not create:
+        return _resources.get("response_cache")
+    return _get_resource("response_cache", _build_response_cache)
+
+def get_semantic_cache(create: bool = True):
+    """Process-wide semantic TUTORING answer cache (None when SEMANTIC_CACHE_MAX_ITEMS is 0)."""
+    if SEMANTIC_CACHE_MAX_ITEMS <= 0 or not create:
+        return _resources.get("semantic_cache")
+    return _get_resource("semantic_cache", _build_semantic_cache)
+
+def __getattr__(name: str):
+    # Former module-level clients (`engine.embeddings`, `engine.llm`), now built on first access
+    if name == "embeddings":
+        return get_embeddings()
+    if name == "llm":
+        return get_llm("ollama")
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+def reload_resources(*names: str):
+    """
+    Drops shared resources so the next getter rebuilds them.
+    A name also matches its variants ("llm" -> "llm:auto", "llm:gemini", "llm:ollama").
+    Without arguments every resource is dropped (e.g. after a full re-index).
+    """
+    with _resources_lock:
+        for key in list(_resources):
+            if not names or any(key == n or key.startswith(f"{n}:") for n in names):
+                _resources.pop(key, None)
+
 # NOTE: NOT USED
 DUMMY_DB = [  
   {
@@ -316,125 +441,129 @@ def fetch_roleplay_data(scenario_id: str) -> Dict:
         raise ValueError(f"Scenario ID {scenario_id} not found.")
     return role_data
 
+class ScenarioCache:
+  """
+  In-memory copy of every scenario + rubric.
+  - Loaded in bulk on first use.
+  - Every SCENARIO_CACHE_TTL seconds one single-row read of config_version tells whether anything changed;
+    in between, lookups do no database work at all.
+  - On change, scenario_revisions identifies the edited scenarios and only those are reloaded.
+  - Every entry carries its content hash (`config["hash"]`), computed once per load, to key memoized prompts.
+  """
+
+  def __init__(self, ttl: float):
+      self.ttl = ttl
+      self._configs = {}
+      self._revisions = {}
+      self._version = None
+      self._checked_at = None
+      self._lock = threading.Lock()
+
+  def get(self, scenario_id):
+      self._refresh()
+      config = self._configs.get(scenario_id)
+      if config is None:
+          # Possibly created a moment ago: re-check right away instead of waiting for the TTL
+          self._refresh(force=True)
+          config = self._configs.get(scenario_id)
+      if config is None:
+          return None
+      # Callers get their own copy, the cached entry stays pristine
+      return dict(config, success_criteria=[dict(r) for r in config["success_criteria"]])
+
+  def invalidate(self):
+      with self._lock:
+          self._version = None
+          self._checked_at = None
+
+  def _refresh(self, force: bool = False):
+      now = time.monotonic()
+      if not force and self._checked_at is not None and now - self._checked_at < self.ttl:
+          return
+
+      with self._lock:
+          if not force and self._checked_at is not None and now - self._checked_at < self.ttl:
+              return
+          # None = change tracking not installed (init_db not run): always reload
+          version = repo.get_config_version()
+
+          if self._version is None or version is None:
+              self._configs = _with_hashes(repo.load_scenarios())
+              self._revisions = repo.get_scenario_revisions() if version is not None else {}
+              logger.info(f"Scenario cache loaded ({len(self._configs)} scenarios)")
+          elif version != self._version:
+              revisions = repo.get_scenario_revisions()
+              changed = [sid for sid, rev in revisions.items() if self._revisions.get(sid) != rev]
+              if changed:
+                  fresh = _with_hashes(repo.load_scenarios(changed))
+                  configs = dict(self._configs)
+                  for sid in changed:
+                      if sid in fresh:
+                          configs[sid] = fresh[sid]
+                      else:
+                          configs.pop(sid, None) # Deleted scenario
+                  self._configs = configs
+              self._revisions = revisions
+              logger.info(f"Scenario cache refreshed: {changed}")
+
+          self._version = version
+          self._checked_at = time.monotonic()
+
+def _with_hashes(configs: dict) -> dict:
+  for config in configs.values():
+      config["hash"] = scenario_hash(config)
+  return configs
+
+SCENARIO_CACHE_TTL = float(os.getenv("SCENARIO_CACHE_TTL", "5")) # Seconds between change checks
+scenario_cache = ScenarioCache(ttl=SCENARIO_CACHE_TTL)
+
 def get_scenario_config(scenario_id):
   """
   Retrieves the full configuration (Personas + Rubrics) for the AI Engine.
-  Replacing 'fetch_roleplay_data' logic.
+  Served from the in-memory scenario cache; the database is only consulted when it changed.
   """
-  con = sqlite3.connect(DB_NAME)
-  con.row_factory = sqlite3.Row
-  c = con.cursor()
-
-  # 1. Get Main Scenario Data
-  c.execute("SELECT * FROM scenarios WHERE scenario_id = ?", (scenario_id,))
-  row = c.fetchone()
-
-  if not row:
-    con.close()
-    return None
-  
-  scenario_data = dict(row)
-
-  # 2. Get Rubrics List
-  c.execute("SELECT criteria, description FROM grading_rubrics WHERE scenario_id = ?", (scenario_id,))
-  rubrics = [dict(r) for r in c.fetchall()]
-
-  con.close()
-
-  return {
-      "role_name": scenario_data["scenario_id"],
-      "topic": scenario_data["topic"],
-      "mentor_persona": scenario_data["mentor_persona"],
-      "simulation_persona_text": scenario_data["simulation_persona"],
-      "scenario_details_text": scenario_data["scenario_details"],
-      "success_criteria": rubrics
-  }
+  return scenario_cache.get(scenario_id)
 
-def save_full_session(session_data, grade_list):
+def save_full_session(session_data, grade_list, queue_report=False):
     """
     Transactional Save: Stores the Session Header AND the Detailed Grades.
+    With queue_report=True the session is stored with a 'pending' report and a report job is
+    queued in the same transaction; jobs.ReportWorker renders the .docx in the background.
     """
-    con = sqlite3.connect(DB_NAME)
-    c = con.cursor()
-
-    # 1. Save Session Header
     try:
-        c.execute('''INSERT INTO sessions
-            (session_id, trainee_name, scenario_id, date, total_score, readiness, chat_log, report_path)
-            VALUES (?, ?, ?, ?, ?, ?, ?, ?)''',
-            (
-                session_data['session_id'],     
-                session_data['trainee_name'],     
-                session_data['scenario_id'],     
-                session_data['date'],     
-                session_data['total_score'],
-                session_data['readiness'],     
-                str(session_data['chat_log']),
-                session_data.get('report_path', '')
-            )
-        )
-
-        # 2. Save Detailed Grades
-        for grade in grade_list:
-            c.execute('''INSERT INTO session_grades
-                (session_id, criteria, score, evidence, feedback)
-                VALUES (?, ?, ?, ?, ?)''',
-                (
-                    session_data['session_id'],
-                    grade['criteria'],
-                    grade['score'],
-                    grade['evidence'],
-                    grade['feedback'],
-                )
-            )
-        con.commit()
+        repo.save_session(session_data, grade_list, queue_report=queue_report)
     except Exception as e:
         print(f"Error saving session: {e}")
-        con.rollback()
         raise
-    finally:
-        con.close()
 
 def fetch_all_sessions():
     """
     Returns all session headers for the Dashboard Table.
     Joins with Scenarios to get Topic names.
     """
-    con = sqlite3.connect(DB_NAME)
-    query = '''
-        SELECT
-            s.session_id,
-            s.trainee_name,
-            sc.topic as Role,
-            s.date,
-            s.total_score as Score,
-            s.readiness,
-            sc.role_id,
-            s.report_path
-        FROM sessions s
-        JOIN scenarios sc ON s.scenario_id = sc.scenario_id
-        ORDER BY s.date DESC
-    '''
-    try:
-        df = pd.read_sql_query(query, con)
-
-        # Data Cleaning & Feature Engineering
-        if not df.empty:
-            # 1. Create Status Column based on 'Score'
-            df['Status'] = df['Score'].apply(lambda x: "Passed" if x >= 80 else "Failed")
-
-            # 2. Handle data formatting
-            df['date'] = pd.to_datetime(df['date'])
-            # 3. Duration Placeholder
-            df['Duration (Mins)'] = 15
-    except ImportError:
-        # Fallback if pandas is not installed (returns list of dicts)
-        con.row_factory = sqlite3.Row
-        c = con.cursor()
-        c.execute(query)
-        df = [dict(row) for row in c.fetchall()]
-    finally:
-        con.close()
+    return _sessions_frame(repo.list_sessions())
+
+def fetch_sessions_page(filters=None, page_size=50, after=None):
+    """
+    One filtered page of session headers for the Dashboard Table (filtering/paging done in SQL).
+    Returns (DataFrame, next_cursor); pass next_cursor as `after` to get the following page.
+    """
+    rows, next_cursor = repo.page_sessions(filters, limit=page_size, after=after)
+    return _sessions_frame(rows), next_cursor
+
+def _sessions_frame(rows):
+    import pandas as pd
+    df = pd.DataFrame(rows, columns=["session_id", "trainee_name", "Role", "date", "Score", "readiness", "role_id", "report_path", "report_status"])
+
+    # Data Cleaning & Feature Engineering
+    if not df.empty:
+        # 1. Create Status Column based on 'Score'
+        df['Status'] = df['Score'].apply(lambda x: "Passed" if x >= 80 else "Failed")
+
+        # 2. Handle data formatting
+        df['date'] = pd.to_datetime(df['date'])
+        # 3. Duration Placeholder
+        df['Duration (Mins)'] = 15
 
     return df
 
@@ -442,15 +571,7 @@ def fetch_session_details(session_id):
     """
     Fetches the Grade Breakdown for a specific session (Drill Down)
     """
-    con = sqlite3.connect(DB_NAME)
-    con.row_factory = sqlite3.Row
-    c = con.cursor()
-
-    c.execute("SELECT * FROM session_grades WHERE session_id = ?", (session_id,))
-    grades = [dict(row) for row in c.fetchall()]
-
-    con.close()
-    return grades
+    return repo.get_session_grades(session_id)
 
 def build_system_prompt(phase: str, data: dict) -> str:
     """
@@ -602,66 +723,396 @@ def build_system_prompt(phase: str, data: dict) -> str:
 
     return mentor_persona
 
+# ---------------------------------------------------------
+# PROMPT REGISTRY (compile once, render once per scenario + phase)
+# ---------------------------------------------------------
+# Static parts first: instructions + guidelines form a byte-identical prefix per (scenario, phase),
+# so provider-side prompt caching can reuse it. Per-turn parts (context, history, input) come last.
+CHAT_TEMPLATE = """
+    {role_instruction}
+
+    [STRICT GUIDELINES]
+    1. You are strictly prohibited from answering questions that are NOT related to the [CONTEXT/KNOWLEDGE BASE] or [CHAT HISTORY].
+    2. If the user asks a question outside of the provided scope, you must politely decline and state that you can only answer questions related to the specific context provided.
+    3. Do not use outside knowledge or general training data to answer unrelated queries.
+    4. ALWAYS RESPOND IN BAHASA INDONESIA
+
+    [CONTEXT/KNOWLEDGE BASE]: {knowledgeBase}
+
+    [CHAT HISTORY]: {history}
+
+    [USER INPUT]: {question}
+    """
+
+SYSTEM_PROMPT_CACHE_SIZE = 256
+_prompt_lock = threading.RLock()
+_chat_prompt = None
+_chains = {} # id(llm) -> (llm, chain); keeps the llm alive so the id cannot be reused
+_system_prompts = OrderedDict() # (scenario_hash, phase) -> rendered system prompt
+
+def scenario_hash(data: dict) -> str:
+    """Content hash of a scenario configuration; changes whenever the scenario or its rubric changes."""
+    return hashlib.sha256(json.dumps(data, sort_keys=True, ensure_ascii=False).encode("utf-8")).hexdigest()
+
+def get_chat_prompt() -> "ChatPromptTemplate":
+    """The main chat template, compiled once per process."""
+    global _chat_prompt
+    if _chat_prompt is None:
+        with _prompt_lock:
+            if _chat_prompt is None:
+                from langchain_core.prompts import ChatPromptTemplate
+                _chat_prompt = ChatPromptTemplate.from_template(CHAT_TEMPLATE)
+    return _chat_prompt
+
+def get_chain(llm):
+    """
+    `prompt | llm | StrOutputParser()` built once per LLM client.
+    The LLM is wrapped in the exact-match response cache (response_cache.CachedLLM) unless it is disabled.
+    """
+    entry = _chains.get(id(llm))
+    if entry is None or entry[0] is not llm:
+        from langchain_core.output_parsers import StrOutputParser
+        cache = get_response_cache()
+        if cache is not None:
+            from response_cache import CachedLLM
+            model = CachedLLM(llm, cache)
+        else:
+            model = llm
+        with _prompt_lock:
+            entry = (llm, get_chat_prompt() | model | StrOutputParser())
+            _chains[id(llm)] = entry
+    return entry[1]
+
+def get_system_prompt(phase: str, data: dict) -> str:
+    """
+    Memoized build_system_prompt keyed by (scenario content hash, phase).
+    An edited scenario row hashes differently, so stale prompts are never served. Cached scenarios carry
+    their hash (ScenarioCache), so only configs built elsewhere are hashed here.
+    """
+    key = (data.get("hash") or scenario_hash(data), phase)
+    with _prompt_lock:
+        prompt = _system_prompts.get(key)
+        if prompt is not None:
+            _system_prompts.move_to_end(key)
+            return prompt
+
+    prompt = build_system_prompt(phase, data)
+    with _prompt_lock:
+        _system_prompts[key] = prompt
+        while len(_system_prompts) > SYSTEM_PROMPT_CACHE_SIZE:
+            _system_prompts.popitem(last=False)
+    return prompt
+
+def clear_prompt_cache():
+    """Drops memoized system prompts and compiled chains (e.g. after editing build_system_prompt at runtime)."""
+    with _prompt_lock:
+        _system_prompts.clear()
+        _chains.clear()
+
 # Chain Query
-def query_chain(retriever, llm, user_input: str, role_id: str, current_phase: str, chat_history: list):
+def _static_knowledge_base(current_phase: str) -> str:
+    # Optimization: Only retrieve docs in 'TUTORING'. In 'ROLEPLAY', context is the scenario.
+    if current_phase == "GREETING":
+        return "Session Initiated."
+    return "Refer to Scenario Details in System Prompt."
+
+def _retrieval_filter(role_data: dict):
+    """Chroma metadata pre-filter limiting TUTORING retrieval to the scenario's document sets (None = whole collection)."""
+    doc_sets = role_data.get("doc_sets")
+    return {"doc_set": {"$in": doc_sets}} if doc_sets else None
+
+def _search(retriever, user_input: str, query_vector, k: int = None, filter: dict = None):
+    # A precomputed query vector goes straight to the vector search, the retriever does not embed the question again
+    if query_vector is not None and hasattr(retriever, "vectorstore"): # Chroma (VectorStoreRetriever)
+        return retriever.vectorstore.similarity_search_by_vector(query_vector, k=k or retriever.search_kwargs.get("k", 4), filter=filter)
+    if query_vector is not None and hasattr(retriever, "similarity_search_by_vector"): # MemmapRetriever
+        return retriever.similarity_search_by_vector(query_vector, k=k, filter=filter)
+    return retriever.invoke(user_input, filter=filter, **({"k": k} if k else {}))
+
+def _retrieve_context(retriever, user_input: str, role_data: dict, query_vector=None):
     """
-    Orchestrates the entire flow: Data -> Prompt -> RAG -> LLM
+    TUTORING retrieval: over-fetches CONTEXT_FETCH_K chunks of the scenario's document sets, then compacts them.
+    The question is embedded once (or `query_vector` is reused) for both the vector search and the compaction.
+    """
+    from context_compactor import CONTEXT_FETCH_K, compact_documents
+    if query_vector is None:
+        query_vector = get_embeddings().embed_query(user_input)
+    if CONTEXT_FETCH_K <= 0:
+        return _search(retriever, user_input, query_vector, filter=_retrieval_filter(role_data))
+    docs = _search(retriever, user_input, query_vector, k=CONTEXT_FETCH_K, filter=_retrieval_filter(role_data))
+    return compact_documents(docs, user_input, get_embeddings(), query_vector=query_vector)
+
+def _assemble_chain(llm, role_data: dict, current_phase: str, knowledge_base_content, user_input: str, chat_history: list, lane: str = None):
+    """
+    Builds the (chain, inputs) pair from already fetched scenario data and context.
+    Context and history are fitted into PROMPT_TOKEN_BUDGET (see prompt_budget.py); GRADING keeps the full transcript.
+    `lane` overrides the governor lane derived from the phase (e.g. "prefetch").
     """
 
-    try:
-        logger.info(f"--- Starting Chain: {role_id} | Phase: {current_phase} ---")
+    # Dynamic System Prompt (memoized per scenario content + phase)
+    system_instructions = get_system_prompt(current_phase, role_data)
 
-        # Fetch Data from DB
-        role_data = fetch_roleplay_data(role_id)
+    # Token Budget: instructions stay whole, context and history share what is left
+    context_tokens, history_tokens = allocate_budget(system_instructions, user_input)
+    knowledge_base_content, used_context = fit_context(knowledge_base_content, context_tokens)
+    if current_phase == "GRADING":
+        history_text = format_chat_history(chat_history) # The grader scores the whole roleplay, never a compacted one
+    else:
+        history_text = fit_history(chat_history, history_tokens + (context_tokens - used_context))
 
-        # Build Dynamic System Prompt
-        system_instructions = build_system_prompt(current_phase, role_data)
+    prompt_tokens = estimate_tokens(system_instructions) + used_context + estimate_tokens(history_text) + estimate_tokens(user_input)
+    logger.debug(f"Prompt ~{prompt_tokens} tokens (budget {PROMPT_TOKEN_BUDGET}, history messages {len(chat_history)})")
 
-        # Update History
-        history_text = format_chat_history(chat_history)
+    # Compiled Chain (built once per LLM client), tagged with its phase (response cache) and governor lane
+    lane = lane or ("grading" if current_phase == "GRADING" else "interactive")
+    chain = get_chain(llm).with_config(metadata={"llm_phase": current_phase, "llm_lane": lane})
 
-        # Optimization: Only retrieve docs in 'TUTORING'. In 'ROLEPLAY', context is the scenario.
-        if current_phase == "TUTORING":
-            knowledge_base_content = retriever.invoke(user_input)
-        elif current_phase == "GREETING":
-            knowledge_base_content = "Session Initiated."
-        else:
-            knowledge_base_content = "Refer to Scenario Details in System Prompt."
+    inputs = {"role_instruction": system_instructions, "knowledgeBase": knowledge_base_content, "history": history_text, "question": user_input}
+    return chain, inputs
 
-        # Prompt Template
-        template = """
-        {role_instruction}
+def _preceding_answer_key(chat_history: list, user_input: str) -> str:
+    """Hash of the assistant turn the question follows (the current question may already be the last message)."""
+    history = list(chat_history or [])
+    if history and history[-1].get("role") == "user" and history[-1].get("content") == user_input:
+        history.pop()
+    previous = next((m["content"] for m in reversed(history) if m.get("role") == "assistant"), "")
+    return hashlib.sha256(previous.encode("utf-8")).hexdigest()
 
-        [CONTEXT/KNOWLEDGE BASE]: {knowledgeBase}
+def _semantic_probe(role_id: str, current_phase: str, user_input: str, chat_history: list):
+    """
+    Semantic cache lookup for a TUTORING question, scoped to (scenario, Knowledge Base version, preceding answer).
+    The preceding assistant turn keeps follow-ups ("Berapa biayanya?") from matching another trainee's
+    conversation: the first question after the (response-cached, identical) opener shares a scope across
+    trainees, later ones only match the same answer chain.
+    Returns (probe, kind, match): `probe` is passed to _semantic_store once the answer is known (None when
+    the cache does not apply), `kind` is "answer" | "draft" | None.
+    """
+    if current_phase != "TUTORING" or user_input.startswith("[SYSTEM_"):
+        return None, None, None
+    _check_kb_version() # First: a re-ingested Knowledge Base replaces the cache
+    cache = get_semantic_cache()
+    if cache is None:
+        return None, None, None
+    scope = (role_id, _kb_state["version"], _preceding_answer_key(chat_history, user_input))
+    # Embedded once: on a miss the vector is handed on to the retrieval (see _probe_vector)
+    vector = get_embeddings().embed_query(user_input)
+    kind, match = cache.lookup(scope, vector)
+    if kind:
+        logger.info(f"Semantic cache {kind} (similarity {match['similarity']:.3f}): {match['question'][:60]}")
+    return (cache, scope, user_input, vector), kind, match
+
+def _semantic_store(probe, kind, answer: str):
+    # Drafted answers are not stored: they were generated without the retrieved context
+    if probe and kind is None:
+        cache, scope, question, vector = probe
+        cache.add(scope, question, vector, answer)
+
+def _probe_vector(probe):
+    """The question embedding computed by _semantic_probe (None when the cache did not apply)."""
+    return probe[3] if probe else None
+
+def _draft_context(match: dict) -> str:
+    return f"Draft answer to a similar earlier question (\"{match['question']}\"):\n{match['answer']}"
+
+def _prepare_chain(retriever, llm, user_input: str, role_id: str, current_phase: str, chat_history: list, draft: dict = None, lane: str = None,
+                   query_vector=None):
+    """
+    Builds the (chain, inputs) pair shared by query_chain and stream_query_chain:
+    Data -> Prompt -> RAG -> LLM
+    A semantic-cache `draft` replaces the TUTORING retrieval; `query_vector` (the question already embedded
+    by the semantic probe) is reused by the retrieval instead of embedding the question again.
+    """
+    logger.info(f"--- Starting Chain: {role_id} | Phase: {current_phase} ---")
 
-        [CHAT HISTORY]: {history}
+    # Fetch Data from DB
+    role_data = fetch_roleplay_data(role_id)
 
-        [USER INPUT]: {question}
+    if current_phase == "TUTORING" and draft:
+        knowledge_base_content = _draft_context(draft)
+    elif current_phase == "TUTORING":
+        knowledge_base_content = _retrieve_context(retriever, user_input, role_data, query_vector)
+    else:
+        knowledge_base_content = _static_knowledge_base(current_phase)
 
-        [STRICT GUIDELINES]
-        1. You are strictly prohibited from answering questions that are NOT related to the [CONTEXT/KNOWLEDGE BASE] or [CHAT HISTORY].
-        2. If the user asks a question outside of the provided scope, you must politely decline and state that you can only answer questions related to the specific context provided.
-        3. Do not use outside knowledge or general training data to answer unrelated queries.
-        4. ALWAYS RESPOND IN BAHASA INDONESIA
-        """
+    return _assemble_chain(llm, role_data, current_phase, knowledge_base_content, user_input, chat_history, lane=lane)
 
-        # Build the Chain
-        prompt = ChatPromptTemplate.from_template(template)
-        chain = prompt | llm | StrOutputParser()
+async def _aprepare_chain(retriever, llm, user_input: str, role_id: str, current_phase: str, chat_history: list, draft: dict = None,
+                         query_vector=None):
+    """
+    Async _prepare_chain: the retrieval (embedding + vector search) awaits without blocking the event loop.
+    Without a `query_vector` from the semantic probe, the question is embedded while the scenario is fetched;
+    the filtered vector search follows with that vector.
+    """
+    logger.info(f"--- Starting Async Chain: {role_id} | Phase: {current_phase} ---")
+
+    # Blocking clients (database driver, embedding cache / Ollama, Chroma) run in worker threads
+    if current_phase == "TUTORING" and not draft:
+        # The scenario's document sets scope the search, so only the question embedding can overlap the lookup
+        if query_vector is None:
+            role_data, query_vector = await asyncio.gather(
+                asyncio.to_thread(fetch_roleplay_data, role_id),
+                asyncio.to_thread(get_embeddings().embed_query, user_input)
+            )
+        else:
+            role_data = await asyncio.to_thread(fetch_roleplay_data, role_id)
+        knowledge_base_content = await asyncio.to_thread(_retrieve_context, retriever, user_input, role_data, query_vector)
+    else:
+        role_data = await asyncio.to_thread(fetch_roleplay_data, role_id)
+        knowledge_base_content = _draft_context(draft) if current_phase == "TUTORING" else _static_knowledge_base(current_phase)
+
+    return _assemble_chain(llm, role_data, current_phase, knowledge_base_content, user_input, chat_history)
+
+def query_chain(retriever, llm, user_input: str, role_id: str, current_phase: str, chat_history: list):
+    """
+    Orchestrates the entire flow: Data -> Prompt -> RAG -> LLM
+    """
+
+    try:
+        probe, kind, match = _semantic_probe(role_id, current_phase, user_input, chat_history)
+        if kind == "answer":
+            return match["answer"]
+        chain, inputs = _prepare_chain(retriever, llm, user_input, role_id, current_phase, chat_history, draft=match, query_vector=_probe_vector(probe))
 
         # Invoke
-        result = chain.invoke({"role_instruction": system_instructions, "knowledgeBase": knowledge_base_content, "history": history_text, "question": user_input})
+        result = chain.invoke(inputs)
+        _semantic_store(probe, kind, result)
         return result
     except Exception as e:
         logger.exception("Error querying the chain")
         raise
 
+def stream_query_chain(retriever, llm, user_input: str, role_id: str, current_phase: str, chat_history: list, lane: str = None):
+    """
+    Streaming variant of query_chain: yields text chunks as the LLM produces them.
+    `lane` overrides the LLM governor lane (prefetch.py passes "prefetch").
+    """
+
+    try:
+        probe, kind, match = _semantic_probe(role_id, current_phase, user_input, chat_history)
+        if kind == "answer":
+            yield match["answer"]
+            return
+        chain, inputs = _prepare_chain(retriever, llm, user_input, role_id, current_phase, chat_history, draft=match, lane=lane, query_vector=_probe_vector(probe))
+
+        started = time.perf_counter()
+        first_token = True
+        parts = []
+        for chunk in chain.stream(inputs):
+            if first_token:
+                logger.info(f"Time to first token: {time.perf_counter() - started:.2f}s")
+                first_token = False
+            parts.append(chunk)
+            yield chunk
+        _semantic_store(probe, kind, "".join(parts))
+    except Exception as e:
+        logger.exception("Error streaming the chain")
+        raise
+
+async def aquery_chain(retriever, llm, user_input: str, role_id: str, current_phase: str, chat_history: list, timeout: float = None):
+    """
+    Async query_chain for servers multiplexing many sessions on one event loop.
+    Cancelling the awaiting task (or hitting `timeout` seconds) aborts the in-flight retrieval / LLM call.
+    """
+
+    try:
+        probe, kind, match = await asyncio.to_thread(_semantic_probe, role_id, current_phase, user_input, chat_history)
+        if kind == "answer":
+            return match["answer"]
+        chain, inputs = await _aprepare_chain(retriever, llm, user_input, role_id, current_phase, chat_history, draft=match, query_vector=_probe_vector(probe))
+        result = await asyncio.wait_for(chain.ainvoke(inputs), timeout=timeout)
+        _semantic_store(probe, kind, result)
+        return result
+    except asyncio.CancelledError:
+        logger.info(f"Chain cancelled: {role_id} | Phase: {current_phase}")
+        raise
+    except Exception as e:
+        logger.exception("Error querying the async chain")
+        raise
+
+async def astream_query_chain(retriever, llm, user_input: str, role_id: str, current_phase: str, chat_history: list):
+    """
+    Async streaming variant: yields text chunks as the LLM produces them.
+    Closing the generator (or cancelling its consumer) stops the generation.
+    """
+
+    try:
+        probe, kind, match = await asyncio.to_thread(_semantic_probe, role_id, current_phase, user_input, chat_history)
+        if kind == "answer":
+            yield match["answer"]
+            return
+        chain, inputs = await _aprepare_chain(retriever, llm, user_input, role_id, current_phase, chat_history, draft=match, query_vector=_probe_vector(probe))
+        parts = []
+        async for chunk in chain.astream(inputs):
+            parts.append(chunk)
+            yield chunk
+        _semantic_store(probe, kind, "".join(parts))
+    except asyncio.CancelledError:
+        logger.info(f"Stream cancelled: {role_id} | Phase: {current_phase}")
+        raise
+    except Exception as e:
+        logger.exception("Error streaming the async chain")
+        raise
+
+JSON_SEPARATOR = "|||JSON_DATA|||"
+
+# Reports queue behind chat turns and grading in the LLM concurrency governor (llm_governor.py)
+REPORT_LLM_CONFIG = {"metadata": {"llm_lane": "report"}}
+
+class GradingStreamFilter:
+    """
+    Wraps a token stream for display: yields the human-readable text and holds back
+    everything from the |||JSON_DATA||| separator onwards (the GRADING payload).
+    The complete raw response (including the JSON) is available as `.raw` afterwards.
+    """
+
+    def __init__(self, chunks):
+        self.chunks = chunks
+        self._raw = []
+        self.json_started = False
+
+    @property
+    def raw(self) -> str:
+        return "".join(self._raw)
+
+    def __iter__(self):
+        pending = ""
+        for chunk in self.chunks:
+            self._raw.append(chunk)
+            if self.json_started:
+                continue
+
+            pending += chunk
+            idx = pending.find(JSON_SEPARATOR)
+            if idx != -1:
+                if pending[:idx]:
+                    yield pending[:idx]
+                pending = ""
+                self.json_started = True
+                continue
+
+            # Hold back a tail that could be the beginning of a separator split across chunks
+            keep = 0
+            for size in range(min(len(pending), len(JSON_SEPARATOR) - 1), 0, -1):
+                if JSON_SEPARATOR.startswith(pending[-size:]):
+                    keep = size
+                    break
+            if len(pending) > keep:
+                yield pending[:len(pending) - keep]
+                pending = pending[len(pending) - keep:]
+
+        if pending and not self.json_started:
+            yield pending
+
 def create_individual_report(session_data, grades_list, chat_history, llm):
     """
     Generates a full performance report.
     - Uses the LLM to generate a qualitative 'Readiness Assessment'.
     - Creates a Word Document with: Meta Data -> AI Insight -> Grading Matrix -> Transcript.
+    chat_history may be any iterable of {'role', 'content'} (e.g. repo.iter_messages); it is read once.
     """
+    from docx import Document
+    from docx.shared import Pt, RGBColor
+    from docx.enum.text import WD_ALIGN_PARAGRAPH
 
     doc = Document()
 
@@ -691,7 +1142,7 @@ def create_individual_report(session_data, grades_list, chat_history, llm):
 
         # Invoke LLM (Handle different response types safely)
         try:
-            response = llm.invoke(template)
+            response = llm.invoke(template, config=REPORT_LLM_CONFIG)
             # Normalize response -> always a string for docx
             if hasattr(response, "content"):
                 content = response.content
@@ -846,12 +1297,19 @@ def create_individual_report(session_data, grades_list, chat_history, llm):
 def create_executive_summary(overall_stats, data_summary, llm):
     """
     Generates a Word doc for the PIC with aggregate insights.
+    data_summary is the fixed-size statistics digest from analytics.format_digest(), not raw rows.
     """
+    from docx import Document
+    from docx.enum.text import WD_ALIGN_PARAGRAPH
+    from langchain_core.prompts import ChatPromptTemplate
+    from langchain_core.output_parsers import StrOutputParser
+
     doc = Document()
     # Generate AI Summary
     try:
-        template = f"""
-        You are a Senior Training Consultant. Analyze the following training data CSV:
+        template = """
+        You are a Senior Training Consultant. Analyze the following training statistics digest
+        (all numbers are pre-aggregated over every recorded session):
         {data_summary}
         
         Write an Executive Summary (3-5 paragraphs) covering:
@@ -865,7 +1323,7 @@ def create_executive_summary(overall_stats, data_summary, llm):
         prompt = ChatPromptTemplate.from_template(template)
         chain = prompt | llm | StrOutputParser()
 
-        result = chain.invoke({"data_summary": data_summary})
+        result = chain.invoke({"data_summary": data_summary}, config=REPORT_LLM_CONFIG)
 
         # --- HEADER ---
         title = doc.add_heading("Executive Training Summary", 0)
@@ -0,0 +1,259 @@
+"""
+Knowledge Base Ingestion: UPLOAD_DIR (PDF manuals) -> Chroma 'knowledge_base' collection.
+
+Incremental by design:
+- Every file is hashed; unchanged files are skipped without being parsed.
+- Every chunk is hashed; only chunks that are not indexed yet are embedded.
+- Vectors belonging to removed (or shrunk) files are deleted.
+- Every chunk is tagged with its document set (`doc_set`: top-level folder under UPLOAD_DIR), the
+  unit scenarios declare in the scenario_documents table to scope retrieval.
+
+Usage:
+    python ingest.py             # incremental refresh
+    python ingest.py --full      # drop everything and rebuild
+"""
+import os
+import json
+import time
+import hashlib
+import argparse
+import logging
+from concurrent.futures import ProcessPoolExecutor
+from engine import UPLOAD_DIR, PERSIST_DIR, RETRIEVER_BACKEND, KB_SNAPSHOT_DIR, load_vectors
+
+logger = logging.getLogger("gaia")
+
+# Ingestion Settings
+CHUNK_SIZE = int(os.getenv("INGEST_CHUNK_SIZE", "1000"))
+CHUNK_OVERLAP = int(os.getenv("INGEST_CHUNK_OVERLAP", "150"))
+EMBED_BATCH_SIZE = int(os.getenv("INGEST_EMBED_BATCH", "64")) # Chunks per embedding call
+INGEST_WORKERS = int(os.getenv("INGEST_WORKERS", str(os.cpu_count() or 2))) # PDF parsing processes
+MANIFEST_PATH = os.path.join(PERSIST_DIR, "ingest_manifest.json")
+VERSION_PATH = os.path.join(PERSIST_DIR, "kb_version") # Published KB version only, polled by the app
+DEFAULT_DOC_SET = "general" # Document set of files directly in UPLOAD_DIR
+
+def _sha256_file(path: str) -> str:
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1024 * 1024), b""):
+            h.update(block)
+    return h.hexdigest()
+
+def _chunk_id(source: str, text: str) -> str:
+    """Content-addressed chunk ID: same source + same text -> same vector ID."""
+    return hashlib.sha256(f"{source}\x00{text}".encode("utf-8")).hexdigest()
+
+def doc_set_of(source: str) -> str:
+    """Document set of a source: its top-level folder under UPLOAD_DIR (e.g. 'TELLER/sop_uang.pdf' -> 'TELLER')."""
+    parts = source.replace(os.sep, "/").split("/")
+    return parts[0] if len(parts) > 1 else DEFAULT_DOC_SET
+
+def _parse_pdf(path: str) -> list:
+    """
+    Worker (runs in a child process): PDF -> list of (chunk_text, page_number).
+    Imports live here so the parent process does not pay for them twice.
+    """
+    from langchain_community.document_loaders import PyPDFLoader
+    from langchain_text_splitters import RecursiveCharacterTextSplitter
+
+    pages = PyPDFLoader(path).load()
+    splitter = RecursiveCharacterTextSplitter(chunk_size=CHUNK_SIZE, chunk_overlap=CHUNK_OVERLAP)
+    chunks = []
+    for doc in splitter.split_documents(pages):
+        text = doc.page_content.strip()
+        if text:
+            chunks.append((text, doc.metadata.get("page", 0)))
+    return chunks
+
+def load_manifest() -> dict:
+    """
+    Returns the ingestion manifest ({'version': int, 'files': {source: {...}}}).
+    'in_progress' is set while a run has changed the index but not published the new version yet.
+    """
+    if not os.path.exists(MANIFEST_PATH):
+        return {"version": 0, "files": {}}
+    with open(MANIFEST_PATH, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+def _write_atomic(path: str, text: str):
+    os.makedirs(PERSIST_DIR, exist_ok=True)
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        f.write(text)
+    os.replace(tmp_path, path) # Atomic swap, readers never see a half-written file
+
+def save_manifest(manifest: dict):
+    _write_atomic(MANIFEST_PATH, json.dumps(manifest, indent=2))
+
+def publish_version(version: int):
+    _write_atomic(VERSION_PATH, str(version))
+
+_version_cache = {"stamp": None, "version": 0} # (path, mtime) -> parsed version
+
+def kb_version() -> int:
+    """
+    Monotonic Knowledge Base version, published once at the end of every ingestion run that changed the index.
+    Polled on the request path: re-read only when the version file's mtime changed.
+    """
+    for path in (VERSION_PATH, MANIFEST_PATH): # The manifest holds the version for indexes ingested before the version file existed
+        try:
+            stamp = (path, os.stat(path).st_mtime_ns)
+        except FileNotFoundError:
+            continue
+        if stamp != _version_cache["stamp"]:
+            if path == VERSION_PATH:
+                with open(path, "r", encoding="utf-8") as f:
+                    version = int(f.read().strip() or 0)
+            else:
+                version = load_manifest().get("version", 0)
+            _version_cache.update(stamp=stamp, version=version)
+        return _version_cache["version"]
+    return 0
+
+def scan_documents(upload_dir: str = UPLOAD_DIR) -> dict:
+    """Returns {source (path relative to upload_dir): absolute path} for every PDF."""
+    found = {}
+    for root, _, files in os.walk(upload_dir):
+        for name in files:
+            if name.lower().endswith(".pdf"):
+                path = os.path.join(root, name)
+                source = os.path.relpath(path, upload_dir).replace(os.sep, "/")
+                found[source] = path
+    return found
+
+def _add_in_batches(vectorstore, texts: list, metadatas: list, ids: list, batch_size: int):
+    for start in range(0, len(texts), batch_size):
+        end = start + batch_size
+        vectorstore.add_texts(texts=texts[start:end], metadatas=metadatas[start:end], ids=ids[start:end])
+
+def _retag(vectorstore, ids: list, doc_set: str, batch_size: int):
+    """Sets the doc_set metadata of already indexed chunks (no re-embedding)."""
+    for start in range(0, len(ids), batch_size):
+        batch = vectorstore._collection.get(ids=ids[start:start + batch_size], include=["metadatas"])
+        vectorstore._collection.update(ids=batch["ids"], metadatas=[{**(m or {}), "doc_set": doc_set} for m in batch["metadatas"]])
+
+def ingest_directory(upload_dir: str = UPLOAD_DIR, vectorstore=None, workers: int = INGEST_WORKERS,
+                     batch_size: int = EMBED_BATCH_SIZE, full: bool = False) -> dict:
+    """
+    Synchronizes the 'knowledge_base' collection with the PDFs in upload_dir.
+    Returns run statistics (files scanned/skipped/indexed/removed, chunks added/deleted).
+    """
+    started = time.perf_counter()
+    vectorstore = vectorstore or load_vectors()
+    manifest = load_manifest()
+    indexed = manifest["files"]
+    stats = {"scanned": 0, "skipped": 0, "indexed": 0, "removed": 0, "failed": 0, "retagged": 0,
+             "chunks_added": 0, "chunks_deleted": 0}
+    base_version = manifest.get("version", 0)
+
+    def mark_changed():
+        # Recorded in the checkpoints, so a resumed run still publishes the bump; the version itself is
+        # only published at the end, app workers never cache answers against a half-updated index
+        manifest["in_progress"] = True
+
+    if full:
+        stats["chunks_deleted"] += sum(len(entry["chunks"]) for entry in indexed.values())
+        vectorstore.reset_collection() # Also clears vectors the manifest does not know about
+        indexed.clear()
+        mark_changed()
+
+    on_disk = scan_documents(upload_dir)
+    stats["scanned"] = len(on_disk)
+
+    # 1. Removed files -> delete their vectors
+    for source in [s for s in indexed if s not in on_disk]:
+        ids = indexed.pop(source)["chunks"]
+        if ids:
+            vectorstore.delete(ids=ids)
+        mark_changed()
+        stats["removed"] += 1
+        stats["chunks_deleted"] += len(ids)
+        logger.info(f"Ingest: removed {source} ({len(ids)} chunks)")
+
+    # 2. Hash files, skip the unchanged ones
+    pending = {}
+    for source, path in on_disk.items():
+        file_hash = _sha256_file(path)
+        entry = indexed.get(source, {})
+        if entry.get("sha256") == file_hash:
+            stats["skipped"] += 1
+            if entry.get("doc_set") != doc_set_of(source): # Indexed before chunks carried a doc_set
+                _retag(vectorstore, entry["chunks"], doc_set_of(source), batch_size)
+                entry["doc_set"] = doc_set_of(source)
+                mark_changed()
+                stats["retagged"] += 1
+        else:
+            pending[source] = (path, file_hash)
+
+    # 3. Parse changed files in parallel, embed only unseen chunks
+    if pending:
+        with ProcessPoolExecutor(max_workers=max(1, min(workers, len(pending)))) as pool:
+            futures = {source: pool.submit(_parse_pdf, path) for source, (path, _) in pending.items()}
+            for source, future in futures.items():
+                path, file_hash = pending[source]
+                try:
+                    chunks = future.result()
+                except Exception:
+                    logger.exception(f"Ingest: failed to parse {source}")
+                    stats["failed"] += 1
+                    continue
+
+                old_ids = set(indexed.get(source, {}).get("chunks", []))
+                new_ids, seen, texts, metadatas, add_ids = [], set(), [], [], []
+                for text, page in chunks:
+                    cid = _chunk_id(source, text)
+                    if cid in seen:
+                        continue # Duplicate chunk inside the same file
+                    seen.add(cid)
+                    new_ids.append(cid)
+                    if cid not in old_ids:
+                        add_ids.append(cid)
+                        texts.append(text)
+                        metadatas.append({
+                            "source": source,
+                            "page": page,
+                            "doc_set": doc_set_of(source),
+                            "chunk_hash": hashlib.sha256(text.encode("utf-8")).hexdigest(),
+                        })
+
+                stale_ids = list(old_ids - seen)
+                if stale_ids or add_ids:
+                    mark_changed()
+                if stale_ids:
+                    vectorstore.delete(ids=stale_ids)
+                if add_ids:
+                    _add_in_batches(vectorstore, texts, metadatas, add_ids, batch_size)
+                kept_ids = [cid for cid in new_ids if cid in old_ids]
+                if kept_ids and indexed[source].get("doc_set") != doc_set_of(source):
+                    _retag(vectorstore, kept_ids, doc_set_of(source), batch_size)
+
+                indexed[source] = {"sha256": file_hash, "chunks": new_ids, "doc_set": doc_set_of(source), "ingested_at": time.time()}
+                save_manifest(manifest) # Checkpoint per file, an interrupted run resumes where it stopped
+                stats["indexed"] += 1
+                stats["chunks_added"] += len(add_ids)
+                stats["chunks_deleted"] += len(stale_ids)
+                logger.info(f"Ingest: {source} -> +{len(add_ids)} / -{len(stale_ids)} chunks")
+
+    if manifest.pop("in_progress", False):
+        manifest["version"] = base_version + 1
+        if RETRIEVER_BACKEND == "memmap":
+            # Exported before the version is published, so app workers find it instead of each re-exporting
+            from vector_index import export_snapshot
+            stats["snapshot_chunks"] = export_snapshot(vectorstore, KB_SNAPSHOT_DIR, kb_version=manifest["version"])["count"]
+    save_manifest(manifest)
+    publish_version(manifest["version"])
+
+    stats["kb_version"] = manifest["version"]
+    stats["seconds"] = round(time.perf_counter() - started, 2)
+    logger.info(f"Ingest complete: {stats}")
+    return stats
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Index UPLOAD_DIR PDFs into the knowledge_base collection.")
+    parser.add_argument("--dir", default=UPLOAD_DIR, help="Documents directory (default: UPLOAD_DIR)")
+    parser.add_argument("--workers", type=int, default=INGEST_WORKERS, help="PDF parsing processes")
+    parser.add_argument("--batch-size", type=int, default=EMBED_BATCH_SIZE, help="Chunks per embedding call")
+    parser.add_argument("--full", action="store_true", help="Drop all indexed vectors and rebuild")
+    args = parser.parse_args()
+
+    print(json.dumps(ingest_directory(args.dir, workers=args.workers, batch_size=args.batch_size, full=args.full), indent=2))
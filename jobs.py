@@ -0,0 +1,95 @@
+"""
+Background Report Jobs.
+
+"🏁 Finish the Session" only saves the session (report_status 'pending') and queues a row in
+report_jobs. ReportWorker (a daemon thread, one per process) claims pending jobs and renders the
+individual .docx report: the extra LLM call + python-docx never block the trainee's page.
+"""
+import os
+import time
+import logging
+import threading
+from engine import repo, get_llm, create_individual_report
+
+logger = logging.getLogger("gaia")
+
+REPORT_JOB_POLL_SECONDS = float(os.getenv("REPORT_JOB_POLL_SECONDS", "2")) # Idle poll interval
+REPORT_JOB_MAX_ATTEMPTS = int(os.getenv("REPORT_JOB_MAX_ATTEMPTS", "3"))
+REPORT_JOB_STALE_SECONDS = float(os.getenv("REPORT_JOB_STALE_SECONDS", "600")) # 'running' longer than this = crashed worker
+
+class ReportWorker(threading.Thread):
+    """Claims report jobs one by one and renders them."""
+
+    def __init__(self, llm_backend: str = "auto"):
+        super().__init__(name="gaia-report-worker", daemon=True)
+        self.llm_backend = llm_backend
+        self._wakeup = threading.Event()
+        self._stopping = threading.Event()
+
+    def notify(self):
+        """Wakes the worker right away instead of waiting for the next poll."""
+        self._wakeup.set()
+
+    def stop(self):
+        self._stopping.set()
+        self._wakeup.set()
+
+    def run(self):
+        requeued = repo.requeue_stale_report_jobs(REPORT_JOB_STALE_SECONDS)
+        if requeued:
+            logger.info(f"Report worker: requeued {requeued} stale job(s)")
+
+        while not self._stopping.is_set():
+            try:
+                job = repo.claim_report_job()
+            except Exception:
+                logger.exception("Report worker: could not claim a job")
+                job = None
+
+            if job is None:
+                self._wakeup.wait(REPORT_JOB_POLL_SECONDS)
+                self._wakeup.clear()
+                continue
+
+            self._process(job)
+
+    def _process(self, job: dict):
+        session_id = job["session_id"]
+        started = time.perf_counter()
+        try:
+            session = repo.get_session(session_id)
+            if session is None:
+                raise ValueError(f"Session {session_id} not found")
+            grades = [
+                {k: g[k] for k in ("criteria", "score", "evidence", "feedback")}
+                for g in repo.get_session_grades(session_id)
+            ]
+            # Streamed from the message store while the appendix is written (never fully in memory)
+            chat_history = ({"role": m["role"], "content": m["content"]} for m in repo.iter_messages(session_id))
+
+            report_path = create_individual_report(session, grades, chat_history, get_llm(self.llm_backend))
+            repo.complete_report_job(job["job_id"], session_id, report_path)
+            logger.info(f"Report worker: {session_id} ready in {time.perf_counter() - started:.1f}s")
+        except Exception as e:
+            retry = job["attempts"] < REPORT_JOB_MAX_ATTEMPTS
+            logger.exception(f"Report worker: {session_id} failed (attempt {job['attempts']}, retry={retry})")
+            repo.fail_report_job(job["job_id"], session_id, str(e), retry=retry)
+            if retry:
+                self._stopping.wait(REPORT_JOB_POLL_SECONDS * job["attempts"]) # Back off before the next attempt
+
+_worker = None
+_worker_lock = threading.Lock()
+
+def start_report_worker() -> ReportWorker:
+    """Starts the process-wide report worker once; later calls return the running instance."""
+    global _worker
+    with _worker_lock:
+        if _worker is None or not _worker.is_alive():
+            _worker = ReportWorker()
+            _worker.start()
+    return _worker
+
+def queue_report(session_id: str):
+    """Re-queues a report (e.g. after a failure) and wakes the worker."""
+    repo.enqueue_report_job(session_id)
+    start_report_worker().notify()
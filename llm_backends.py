@@ -0,0 +1,330 @@
+"""
+LLM backend layer: one pooled client per backend and a router with retries and latency-aware failover.
+
+Backends are tried in `LLM_BACKENDS` order (e.g. "gemini,ollama"). Per-backend settings come from the
+defaults below, optionally overridden by a JSON file (`LLM_CONFIG_FILE`):
+
+    {
+      "order": ["gemini", "vllm", "ollama"],
+      "backends": {
+        "gemini": {"timeout": 30, "p95_ms": 6000, "params": {"temperature": 0.7}},
+        "vllm": {"kind": "openai", "base_url": "http://gpu-box:8000/v1", "model": "qwen2.5-14b-instruct"}
+      }
+    }
+
+Clients are built once per process by engine.get_llm(name), so every session reuses the same HTTP
+connection pool. `RoutedLLM` (engine.get_llm()) is a LangChain Runnable and drops into
+`prompt | llm | parser` and `llm.invoke(...)`.
+"""
+import os
+import json
+import time
+import random
+import asyncio
+import logging
+import threading
+from collections import deque
+from langchain_core.runnables import Runnable
+from llm_governor import governor as default_governor, lane_of
+from prompt_budget import estimate_tokens
+
+logger = logging.getLogger("gaia")
+
+# Config
+LLM_BACKENDS = os.getenv("LLM_BACKENDS", "") # Failover order, e.g. "gemini,ollama" (default: file order or gemini,ollama)
+LLM_CONFIG_FILE = os.getenv("LLM_CONFIG_FILE", "") # Optional JSON with per-backend settings
+LLM_TIMEOUT = float(os.getenv("LLM_TIMEOUT", "60")) # Seconds per request
+LLM_MAX_RETRIES = int(os.getenv("LLM_MAX_RETRIES", "2")) # Retries on the same backend before failing over
+LLM_RETRY_BASE_DELAY = float(os.getenv("LLM_RETRY_BASE_DELAY", "0.5")) # Seconds; doubled per retry, full jitter
+LLM_P95_FAILOVER_MS = float(os.getenv("LLM_P95_FAILOVER_MS", "8000")) # Demote a backend whose p95 latency exceeds this (0 = never)
+LLM_LATENCY_WINDOW = int(os.getenv("LLM_LATENCY_WINDOW", "50")) # Latency samples kept per backend
+LLM_LATENCY_TTL = float(os.getenv("LLM_LATENCY_TTL", "300")) # Seconds a sample counts; lets a demoted backend recover
+LLM_FAILURE_COOLDOWN = float(os.getenv("LLM_FAILURE_COOLDOWN", "30")) # Seconds a backend that exhausted its retries is tried last
+LLM_MIN_SAMPLES = 5 # Samples needed before p95 can demote a backend
+
+GEMINI_MODEL = os.getenv("GEMINI_MODEL", "gemini-3-flash-preview") # Chat Model
+OLLAMA_MODEL = os.getenv("OLLAMA_MODEL", "qwen3-vl:235b-cloud")
+OLLAMA_BASE_URL = os.getenv("OLLAMA_BASE_URL", "http://localhost:11434")
+OPENAI_MODEL = os.getenv("OPENAI_MODEL", "gpt-4o-mini") # Any OpenAI-compatible server (vLLM, LM Studio, ...)
+OPENAI_BASE_URL = os.getenv("OPENAI_BASE_URL", "")
+
+DEFAULT_BACKENDS = {
+    "gemini": {"kind": "gemini", "model": GEMINI_MODEL},
+    "ollama": {"kind": "ollama", "model": OLLAMA_MODEL, "base_url": OLLAMA_BASE_URL},
+    "openai": {"kind": "openai", "model": OPENAI_MODEL, "base_url": OPENAI_BASE_URL or None},
+}
+
+# ---------------------------------------------------------
+# CONFIG
+# ---------------------------------------------------------
+def _config_file() -> dict:
+    if not LLM_CONFIG_FILE:
+        return {}
+    with open(LLM_CONFIG_FILE, encoding="utf-8") as f:
+        return json.load(f)
+
+def backend_configs() -> dict:
+    """name -> settings (kind, model, base_url, timeout, max_retries, p95_ms, params), file overrides applied."""
+    overrides = _config_file().get("backends", {})
+    configs = {}
+    for name in set(DEFAULT_BACKENDS) | set(overrides):
+        cfg = {"timeout": LLM_TIMEOUT, "max_retries": LLM_MAX_RETRIES, "p95_ms": LLM_P95_FAILOVER_MS}
+        cfg.update(DEFAULT_BACKENDS.get(name, {}))
+        cfg.update(overrides.get(name, {}))
+        if "kind" not in cfg:
+            raise ValueError(f"LLM backend '{name}' needs a 'kind' (gemini | ollama | openai)")
+        configs[name] = cfg
+    return configs
+
+def backend_order() -> list:
+    """Backends in failover order (first = preferred)."""
+    order = LLM_BACKENDS or ",".join(_config_file().get("order", ["gemini", "ollama"]))
+    return [name.strip() for name in order.split(",") if name.strip()]
+
+# ---------------------------------------------------------
+# CLIENTS (built lazily; each keeps its own HTTP connection pool)
+# ---------------------------------------------------------
+def _gemini_client(cfg: dict):
+    from langchain_google_genai import ChatGoogleGenerativeAI
+    # Retries are done by the router, so a slow backend can be left instead of retried in place
+    return ChatGoogleGenerativeAI(model=cfg["model"], timeout=cfg["timeout"], max_retries=0, **cfg.get("params", {}))
+
+def _ollama_client(cfg: dict):
+    from langchain_ollama.llms import OllamaLLM
+    return OllamaLLM(model=cfg["model"], base_url=cfg["base_url"], client_kwargs={"timeout": cfg["timeout"]},
+                     **cfg.get("params", {}))
+
+def _openai_client(cfg: dict):
+    from langchain_openai import ChatOpenAI
+    api_key = os.getenv(cfg.get("api_key_env", "OPENAI_API_KEY")) or "not-needed" # Local servers ignore the key
+    return ChatOpenAI(model=cfg["model"], base_url=cfg.get("base_url"), api_key=api_key,
+                      timeout=cfg["timeout"], max_retries=0, **cfg.get("params", {}))
+
+CLIENT_BUILDERS = {
+    "gemini": _gemini_client,
+    "ollama": _ollama_client,
+    "openai": _openai_client,
+}
+
+def build_client(name: str):
+    """Creates the LangChain client of a configured backend."""
+    configs = backend_configs()
+    if name not in configs:
+        raise ValueError(f"Unknown LLM backend '{name}' (configured: {', '.join(sorted(configs))})")
+    cfg = configs[name]
+    return CLIENT_BUILDERS[cfg["kind"]](cfg)
+
+# ---------------------------------------------------------
+# ROUTER
+# ---------------------------------------------------------
+def _text(value) -> str:
+    """Text of a prompt / answer / chunk (str, PromptValue or message) for token accounting."""
+    if isinstance(value, str):
+        return value
+    if hasattr(value, "to_string"):
+        return value.to_string()
+    content = getattr(value, "content", "")
+    return content if isinstance(content, str) else str(content)
+
+TRANSIENT_STATUS = {408, 429} # Plus every 5xx
+TRANSIENT_ERROR_TYPES = {"TransportError", "TimeoutException", "APIConnectionError", "APITimeoutError", "Timeout"} # httpx / openai / requests, matched by name so no SDK is imported
+
+def is_transient(error: Exception) -> bool:
+    """
+    True for errors another attempt can fix: timeouts, connection failures, 429 and 5xx responses.
+    SDK wrappers are unwrapped through the exception chain (e.g. ChatGoogleGenerativeAIError from a genai APIError).
+    """
+    seen = set()
+    while error is not None and id(error) not in seen:
+        seen.add(id(error))
+        if isinstance(error, (TimeoutError, ConnectionError)):
+            return True
+        if TRANSIENT_ERROR_TYPES & {cls.__name__ for cls in type(error).__mro__}:
+            return True
+        for status in (getattr(error, "status_code", None), getattr(error, "code", None),
+                       getattr(getattr(error, "response", None), "status_code", None)):
+            if isinstance(status, int) and not isinstance(status, bool):
+                return status in TRANSIENT_STATUS or 500 <= status < 600
+        error = error.__cause__ or error.__context__
+    return False
+
+class BackendHealth:
+    """Rolling latency window and failure cooldown of one backend."""
+
+    def __init__(self, p95_ms: float):
+        self.p95_threshold = p95_ms
+        self.samples = deque(maxlen=LLM_LATENCY_WINDOW) # (monotonic time, latency ms)
+        self.cooldown_until = 0.0
+        self.failures = 0
+        self.lock = threading.Lock()
+
+    def record(self, latency_ms: float):
+        with self.lock:
+            self.samples.append((time.monotonic(), latency_ms))
+            self.failures = 0
+
+    def fail(self):
+        with self.lock:
+            self.failures += 1
+
+    def cool_down(self):
+        with self.lock:
+            self.cooldown_until = time.monotonic() + LLM_FAILURE_COOLDOWN
+
+    def p95(self):
+        """p95 latency (ms) over the recent samples, None while there are too few."""
+        horizon = time.monotonic() - LLM_LATENCY_TTL
+        with self.lock:
+            recent = sorted(ms for t, ms in self.samples if t >= horizon)
+        if len(recent) < LLM_MIN_SAMPLES:
+            return None
+        return recent[min(len(recent) - 1, int(len(recent) * 0.95))]
+
+    def degraded(self) -> bool:
+        if time.monotonic() < self.cooldown_until:
+            return True
+        p95 = self.p95()
+        return bool(self.p95_threshold) and p95 is not None and p95 > self.p95_threshold
+
+class RoutedLLM(Runnable):
+    """
+    Calls the first healthy backend; retries it with jittered exponential back-off, then fails over.
+    Only transient errors (is_transient) are retried; anything else (bad request, auth, content policy)
+    is raised right away, every backend would reject it the same way.
+    A backend is demoted (tried after the healthy ones) while its p95 latency is above its `p95_ms`
+    or for LLM_FAILURE_COOLDOWN seconds after it exhausted its retries.
+    Streams only fail over before the first chunk; latency of a stream is its time to first chunk.
+    Every attempt first takes a slot from the concurrency governor (llm_governor.py) in the lane named by
+    the config metadata `llm_lane`; queueing time is not counted as backend latency.
+    """
+
+    def __init__(self, get_client, order: list = None, configs: dict = None, governor=None):
+        self.get_client = get_client # name -> pooled client (engine.get_llm)
+        self.governor = governor or default_governor
+        self.configs = configs or backend_configs()
+        self.order = order or backend_order()
+        unknown = [name for name in self.order if name not in self.configs]
+        if unknown:
+            raise ValueError(f"Unknown LLM backend(s) in LLM_BACKENDS: {', '.join(unknown)}")
+        self.health = {name: BackendHealth(self.configs[name]["p95_ms"]) for name in self.order}
+
+    def _plan(self):
+        """Yields (backend, delay before the call): healthy backends first, retries before failing over."""
+        healthy = [name for name in self.order if not self.health[name].degraded()]
+        demoted = [name for name in self.order if name not in healthy]
+        for position, name in enumerate(healthy + demoted):
+            if position:
+                logger.warning(f"LLM failover -> {name}")
+            for attempt in range(self.configs[name]["max_retries"] + 1):
+                yield name, random.uniform(0, LLM_RETRY_BASE_DELAY * 2 ** (attempt - 1)) if attempt else 0.0
+            self.health[name].cool_down()
+
+    def _succeeded(self, name: str, started: float):
+        self.health[name].record((time.perf_counter() - started) * 1000)
+
+    def _failed(self, name: str, error: Exception):
+        self.health[name].fail()
+        logger.warning(f"LLM backend {name} failed: {type(error).__name__}: {error}")
+
+    def invoke(self, input, config=None, **kwargs):
+        lane, prompt_tokens = lane_of(config), estimate_tokens(_text(input))
+        error = None
+        for name, delay in self._plan():
+            time.sleep(delay)
+            with self.governor.slot(lane, prompt_tokens) as usage:
+                started = time.perf_counter()
+                try:
+                    result = self.get_client(name).invoke(input, config, **kwargs)
+                except Exception as e:
+                    if not is_transient(e):
+                        raise
+                    error = e
+                    self._failed(name, e)
+                    continue
+                self._succeeded(name, started)
+                usage["completion_tokens"] = estimate_tokens(_text(result))
+                return result
+        raise RuntimeError("All LLM backends failed") from error
+
+    async def ainvoke(self, input, config=None, **kwargs):
+        lane, prompt_tokens = lane_of(config), estimate_tokens(_text(input))
+        error = None
+        for name, delay in self._plan():
+            await asyncio.sleep(delay)
+            async with self.governor.aslot(lane, prompt_tokens) as usage:
+                started = time.perf_counter()
+                try:
+                    result = await self.get_client(name).ainvoke(input, config, **kwargs)
+                except Exception as e:
+                    if not is_transient(e):
+                        raise
+                    error = e
+                    self._failed(name, e)
+                    continue
+                self._succeeded(name, started)
+                usage["completion_tokens"] = estimate_tokens(_text(result))
+                return result
+        raise RuntimeError("All LLM backends failed") from error
+
+    def stream(self, input, config=None, **kwargs):
+        lane, prompt_tokens = lane_of(config), estimate_tokens(_text(input))
+        error = None
+        for name, delay in self._plan():
+            time.sleep(delay)
+            # The slot is held until the stream ends or the consumer closes it
+            with self.governor.slot(lane, prompt_tokens) as usage:
+                started = time.perf_counter()
+                streaming = False
+                try:
+                    for chunk in self.get_client(name).stream(input, config, **kwargs):
+                        if not streaming:
+                            self._succeeded(name, started)
+                            streaming = True
+                        usage["completion_tokens"] += len(_text(chunk)) / 4 # Same ~4 chars/token rate as estimate_tokens, without per-chunk rounding
+                        yield chunk
+                except Exception as e:
+                    if streaming or not is_transient(e):
+                        raise # Part of the answer is already out; switching backends would garble it
+                    error = e
+                    self._failed(name, e)
+                    continue
+                if not streaming:
+                    self._succeeded(name, started)
+                return
+        raise RuntimeError("All LLM backends failed") from error
+
+    async def astream(self, input, config=None, **kwargs):
+        lane, prompt_tokens = lane_of(config), estimate_tokens(_text(input))
+        error = None
+        for name, delay in self._plan():
+            await asyncio.sleep(delay)
+            async with self.governor.aslot(lane, prompt_tokens) as usage:
+                started = time.perf_counter()
+                streaming = False
+                try:
+                    async for chunk in self.get_client(name).astream(input, config, **kwargs):
+                        if not streaming:
+                            self._succeeded(name, started)
+                            streaming = True
+                        usage["completion_tokens"] += len(_text(chunk)) / 4 # Same ~4 chars/token rate as estimate_tokens, without per-chunk rounding
+                        yield chunk
+                except Exception as e:
+                    if streaming or not is_transient(e):
+                        raise
+                    error = e
+                    self._failed(name, e)
+                    continue
+                if not streaming:
+                    self._succeeded(name, started)
+                return
+        raise RuntimeError("All LLM backends failed") from error
+
+    def cache_identity(self) -> list:
+        """Backends with their model and sampling params, in failover order (part of the response-cache key)."""
+        return [[name, self.configs[name]["kind"], self.configs[name]["model"], self.configs[name].get("params", {})]
+                for name in self.order]
+
+    def stats(self) -> dict:
+        """Per-backend p95 latency (ms), consecutive failures and demotion state, in failover order."""
+        return {name: {"p95_ms": self.health[name].p95(), "failures": self.health[name].failures,
+                       "degraded": self.health[name].degraded()} for name in self.order}
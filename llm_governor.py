@@ -0,0 +1,177 @@
+"""
+Process-wide LLM concurrency governor. Every LLM call made by RoutedLLM (llm_backends.py) takes a slot here.
+
+- At most LLM_MAX_CONCURRENCY calls are in flight per process.
+- LLM_TOKENS_PER_MINUTE (0 = unlimited) is a token bucket: the estimated prompt tokens are charged when
+  the call starts and the answer's tokens when it ends.
+- Waiting calls are served by lane, FIFO within a lane:
+  interactive (chat turns) > grading > prefetch (speculative phase openers, prefetch.py)
+  > report (individual reports, executive summary).
+
+Callers choose the lane with LangChain config metadata, e.g. `chain.invoke(inputs, config={"metadata": {"llm_lane": "grading"}})`.
+`governor.stats()` reports queue depth and wait times per lane for capacity planning.
+"""
+import os
+import time
+import heapq
+import asyncio
+import itertools
+import threading
+from collections import deque
+from contextlib import contextmanager, asynccontextmanager
+
+# Config
+LLM_MAX_CONCURRENCY = int(os.getenv("LLM_MAX_CONCURRENCY", "8")) # In-flight LLM calls per process
+LLM_TOKENS_PER_MINUTE = int(os.getenv("LLM_TOKENS_PER_MINUTE", "0")) # Provider TPM budget (0 = unlimited)
+LANES = {"interactive": 0, "grading": 1, "prefetch": 2, "report": 3} # Lower is served first
+DEFAULT_LANE = "interactive"
+WAIT_SAMPLES = 200 # Wait-time samples kept per lane
+ASYNC_POLL_SECONDS = 0.05 # Async waiters poll instead of blocking the event loop
+
+def lane_of(config) -> str:
+    """Lane requested in a LangChain config (`metadata.llm_lane`), DEFAULT_LANE if missing or unknown."""
+    lane = ((config or {}).get("metadata") or {}).get("llm_lane", DEFAULT_LANE)
+    return lane if lane in LANES else DEFAULT_LANE
+
+class LLMGovernor:
+    def __init__(self, max_concurrency: int = LLM_MAX_CONCURRENCY, tokens_per_minute: int = LLM_TOKENS_PER_MINUTE):
+        self.max_concurrency = max_concurrency
+        self.tokens_per_minute = tokens_per_minute
+        self.tokens = float(tokens_per_minute)
+        self.refilled_at = time.monotonic()
+        self.in_flight = 0
+        self.queue = [] # heap of (lane priority, arrival, lane)
+        self.arrivals = itertools.count()
+        self.waits = {lane: deque(maxlen=WAIT_SAMPLES) for lane in LANES}
+        self.served = {lane: 0 for lane in LANES}
+        self.cond = threading.Condition()
+
+    def _refill(self):
+        if self.tokens_per_minute:
+            now = time.monotonic()
+            self.tokens = min(self.tokens_per_minute, self.tokens + (now - self.refilled_at) * self.tokens_per_minute / 60)
+            self.refilled_at = now
+
+    def _enqueue(self, lane: str, prompt_tokens: int):
+        # A prompt larger than the whole budget still runs once the bucket is full
+        cost = min(prompt_tokens, self.tokens_per_minute)
+        ticket = (LANES[lane], next(self.arrivals), lane)
+        with self.cond:
+            heapq.heappush(self.queue, ticket)
+        return ticket, cost
+
+    def _try_start(self, ticket, cost: int):
+        """Under self.cond: starts the call if it is next in line and capacity allows; else seconds to wait (None = until notified)."""
+        self._refill()
+        if self.queue[0] is not ticket or self.in_flight >= self.max_concurrency:
+            return None
+        if self.tokens_per_minute and self.tokens < cost:
+            return (cost - self.tokens) * 60 / self.tokens_per_minute
+        heapq.heappop(self.queue)
+        self.in_flight += 1
+        if self.tokens_per_minute:
+            self.tokens -= cost
+        self.cond.notify_all() # The next in line may be able to start as well
+        return 0
+
+    def _started(self, ticket, waited: float):
+        lane = ticket[2]
+        with self.cond:
+            self.waits[lane].append(waited)
+            self.served[lane] += 1
+
+    def _abandon(self, ticket):
+        with self.cond:
+            if ticket in self.queue:
+                self.queue.remove(ticket)
+                heapq.heapify(self.queue)
+            self.cond.notify_all()
+
+    def acquire(self, lane: str, prompt_tokens: int = 0) -> float:
+        """Blocks until the call may start; returns the seconds spent waiting."""
+        ticket, cost = self._enqueue(lane, prompt_tokens)
+        started = time.monotonic()
+        try:
+            with self.cond:
+                while True:
+                    timeout = self._try_start(ticket, cost)
+                    if timeout == 0:
+                        break
+                    self.cond.wait(timeout)
+        except BaseException:
+            self._abandon(ticket)
+            raise
+        waited = time.monotonic() - started
+        self._started(ticket, waited)
+        return waited
+
+    async def aacquire(self, lane: str, prompt_tokens: int = 0) -> float:
+        """acquire() for coroutines; cancelling the waiter leaves the queue."""
+        ticket, cost = self._enqueue(lane, prompt_tokens)
+        started = time.monotonic()
+        try:
+            while True:
+                with self.cond:
+                    timeout = self._try_start(ticket, cost)
+                if timeout == 0:
+                    break
+                await asyncio.sleep(min(timeout or ASYNC_POLL_SECONDS, ASYNC_POLL_SECONDS))
+        except BaseException:
+            self._abandon(ticket)
+            raise
+        waited = time.monotonic() - started
+        self._started(ticket, waited)
+        return waited
+
+    def release(self, completion_tokens: int = 0):
+        with self.cond:
+            self.in_flight -= 1
+            if self.tokens_per_minute:
+                self._refill()
+                self.tokens -= completion_tokens # May go negative: later calls wait until it is paid back
+            self.cond.notify_all()
+
+    @contextmanager
+    def slot(self, lane: str, prompt_tokens: int = 0):
+        """Holds a slot for the block; set usage["completion_tokens"] to charge the answer."""
+        self.acquire(lane, prompt_tokens)
+        usage = {"completion_tokens": 0}
+        try:
+            yield usage
+        finally:
+            self.release(usage["completion_tokens"])
+
+    @asynccontextmanager
+    async def aslot(self, lane: str, prompt_tokens: int = 0):
+        await self.aacquire(lane, prompt_tokens)
+        usage = {"completion_tokens": 0}
+        try:
+            yield usage
+        finally:
+            self.release(usage["completion_tokens"])
+
+    def stats(self) -> dict:
+        """In-flight calls, token bucket level and per-lane queue depth / wait times (ms)."""
+        with self.cond:
+            self._refill()
+            queued = {lane: 0 for lane in LANES}
+            for _, _, lane in self.queue:
+                queued[lane] += 1
+            lanes = {}
+            for lane in LANES:
+                waits = sorted(self.waits[lane])
+                lanes[lane] = {
+                    "queued": queued[lane],
+                    "served": self.served[lane],
+                    "avg_wait_ms": sum(waits) / len(waits) * 1000 if waits else 0.0,
+                    "p95_wait_ms": waits[min(len(waits) - 1, int(len(waits) * 0.95))] * 1000 if waits else 0.0,
+                }
+            return {
+                "in_flight": self.in_flight,
+                "max_concurrency": self.max_concurrency,
+                "tokens_available": round(self.tokens) if self.tokens_per_minute else None,
+                "lanes": lanes,
+            }
+
+# Shared by every session / worker thread of the process
+governor = LLMGovernor()
@@ -2,24 +2,25 @@ import os
 import re
 import uuid
 import json
-import pandas as pd
 import streamlit as st
-import altair as alt
 from datetime import datetime
 from dotenv import load_dotenv
-from engine import query_chain, load_vectors, get_retriever, create_executive_summary, create_individual_report, fetch_all_sessions, init_db, save_full_session, _extract_json_from_text
-from langchain_ollama.llms import OllamaLLM
-from langchain_google_genai import ChatGoogleGenerativeAI
+from engine import query_chain, stream_query_chain, GradingStreamFilter, get_shared_retriever, get_llm, create_executive_summary, fetch_sessions_page, init_db, save_full_session, _extract_json_from_text, get_embeddings, get_response_cache, get_semantic_cache, repo
+from jobs import start_report_worker, queue_report
+from analytics import build_training_digest, format_digest, kpi_snapshot
+from repository import SCORE_BANDS
+from llm_governor import governor
+from prefetch import prefetcher, roleplay_ended
 
 st.set_page_config(page_title="GAIA", layout="wide")
 
 load_dotenv()
-# Init DB only once per session to avoid repeated heavy work
-if "db_initialized" not in st.session_state:
-    with st.spinner("Initializing database..."):
-        init_db()
-    st.session_state.db_initialized = True
+# Schema migrations + seeding (runs once per process; a no-op on every later rerun)
+init_db()
+# Background report renderer (one per process)
+report_worker = start_report_worker()
 GEMINI_API_KEY = os.environ.get("GEMINI_API_KEY")
+DASHBOARD_PAGE_SIZE = int(os.getenv("DASHBOARD_PAGE_SIZE", "50")) # Rows per dashboard table page
 
 def render_advisor_grid(data):
     num_cols = 3
@@ -164,13 +165,10 @@ def cxo_page():
         st.session_state.phase = "GREETING"
         st.session_state.trigger_ai_greeting = True # Set the AI to speak first on page load
 
-    # Cache AI Variables
-    if "retriever" not in st.session_state:
-        with st.spinner("Initializing AI..."):
-            vs = load_vectors()
-            st.session_state.retriever = get_retriever(vs)
-            st.session_state.llm = ChatGoogleGenerativeAI(model="gemini-3-flash-preview")
-            # st.session_state.llm = OllamaLLM(model="qwen3-vl:235b-cloud", base_url="http://localhost:11434")
+    # Shared AI Resources (created once per process, not per session)
+    with st.spinner("Initializing AI..."):
+        retriever = get_shared_retriever()
+        llm = get_llm() # Routed: preferred backend with failover (LLM_BACKENDS)
 
     # ==========================================
     # 2. RENDER HISTORY
@@ -197,8 +195,8 @@ def cxo_page():
         with st.chat_message("assistant"):
             with st.spinner("AI is preparing..."):
                 response_text = query_chain(
-                    retriever=st.session_state.retriever,
-                    llm=st.session_state.llm,
+                    retriever=retriever,
+                    llm=llm,
                     user_input="[SYSTEM_TRIGGER_START]",
                     role_id=role_id, 
                     current_phase=st.session_state.phase,
@@ -225,8 +223,8 @@ def cxo_page():
         with st.chat_message("assistant"):
             with st.spinner("Thinking..."):
                 response_text = query_chain(
-                    retriever=st.session_state.retriever,
-                    llm=st.session_state.llm,
+                    retriever=retriever,
+                    llm=llm,
                     user_input=user_input,
                     role_id=role_id,
                     current_phase=st.session_state.phase,
@@ -260,10 +258,60 @@ def cxo_page():
                 st.rerun()
             # st.error("Simulation in progress")
 
+def record_message(role, content, meta=None):
+    """Adds a chat turn to the on-screen history and appends it to the message store right away."""
+    st.session_state.messages.append({"role": role, "content": content})
+    if st.session_state.get("session_id"):
+        repo.append_message(st.session_state.session_id, st.session_state.phase, role, content, meta)
+
+def restore_session(session_id):
+    """Rebuilds the chat state of an unfinished session (browser refresh / reconnect) from the message store."""
+    history = list(repo.iter_messages(session_id))
+    if not history:
+        return False
+
+    simulation = ("ROLEPLAY", "GRADING") # Phases shown on a fresh screen after "Start Roleplay"
+    phase = history[-1]["phase"] or "TUTORING"
+    tutoring = [{"role": m["role"], "content": m["content"]} for m in history if m["phase"] not in simulation]
+    roleplay = [{"role": m["role"], "content": m["content"]} for m in history if m["phase"] in simulation]
+
+    st.session_state.session_id = session_id
+    st.session_state.phase = phase
+    st.session_state.trigger_ai_greeting = False
+    if phase in simulation:
+        st.session_state.messages_record, st.session_state.messages = tutoring, roleplay
+    else:
+        st.session_state.messages_record, st.session_state.messages = [], tutoring
+    st.session_state.tutoring_counter = sum(1 for m in history if m["phase"] == "TUTORING" and m["role"] == "user")
+    for m in history:
+        if m["meta"] and "grading_result" in m["meta"]:
+            st.session_state.grading_result = m["meta"]["grading_result"]
+    return True
+
+def prefetch_opener(phase, messages, retriever, llm, role_id):
+    """Starts generating the opener of `phase` in the background; the transition collects it with prefetcher.take()."""
+    history = [dict(m) for m in messages]
+    prefetcher.start(st.session_state.session_id, phase, history, lambda: stream_query_chain(
+        retriever=retriever,
+        llm=llm,
+        user_input="[SYSTEM_TRIGGER_START]",
+        role_id=role_id,
+        current_phase=phase,
+        chat_history=history,
+        lane="prefetch"
+    ))
+
 def new_cxo_page():
     # ==========================================
     # 1. INITIALIZE SESSION STATE
     # ==========================================
+    # Resume an interrupted session: every turn is persisted, the id travels in the URL (?session=...)
+    if "session_id" not in st.session_state:
+        st.session_state.session_id = None
+        resume_id = st.query_params.get("session")
+        if resume_id and not repo.session_exists(resume_id):
+            restore_session(resume_id)
+
     if "messages" not in st.session_state:
         st.session_state.messages = []
 
@@ -275,13 +323,10 @@ def new_cxo_page():
         st.session_state.phase = "START"
         st.session_state.trigger_ai_greeting = False # Set the AI to speak first on page load
 
-    # Cache AI Variables
-    if "retriever" not in st.session_state:
-        with st.spinner("Initializing AI..."):
-            vs = load_vectors()
-            st.session_state.retriever = get_retriever(vs)
-            st.session_state.llm = ChatGoogleGenerativeAI(model="gemini-3-flash-preview")
-            # st.session_state.llm = OllamaLLM(model="qwen3-vl:235b-cloud", base_url="http://localhost:11434")
+    # Shared AI Resources (created once per process, not per session)
+    with st.spinner("Initializing AI..."):
+        retriever = get_shared_retriever()
+        llm = get_llm() # Routed: preferred backend with failover (LLM_BACKENDS)
 
     # Initialize Tutor Counter
     if "tutoring_counter" not in st.session_state:
@@ -310,36 +355,39 @@ def new_cxo_page():
     role_id = "CSO_Giro_Tapres" # Change the variable into the respective role
     if st.session_state.get("trigger_ai_greeting"):
         with st.chat_message("assistant"):
-            # 1. Call the AI
-            with st.spinner("AI is preparing..."):
-                response_text = query_chain(
-                    retriever=st.session_state.retriever,
-                    llm=st.session_state.llm,
+            # 1. Stream the AI response (the |||JSON_DATA||| tail is held back from display)
+            # A prefetched opener (started while the previous phase was running) is replayed instantly
+            source = prefetcher.take(st.session_state.session_id, st.session_state.phase, st.session_state.messages)
+            if source is None:
+                source = stream_query_chain(
+                    retriever=retriever,
+                    llm=llm,
                     user_input="[SYSTEM_TRIGGER_START]",
                     role_id=role_id, 
                     current_phase=st.session_state.phase,
                     chat_history=st.session_state.messages
                 )
+            stream = GradingStreamFilter(source)
+            st.write_stream(stream)
+            response_text = stream.raw
+
+            # --- robust extraction: try to parse JSON and store it ---
+            # Try to capture grading JSON from any assistant message and persist immediately
+            meta = None
+            try:
+                metrics_obj = _extract_json_from_text(response_text)
+                if metrics_obj is not None:
+                    st.session_state.grading_result = json.dumps(metrics_obj, ensure_ascii=False)
+                    meta = {"grading_result": st.session_state.grading_result}
+            except Exception:
+                pass
+            
+            # Remove separator and any trailing JSON for display/history
+            display_text = re.sub(r"\|\|\|JSON_DATA\|\|\|.*$", "", response_text, flags=re.S).strip()
 
-                # --- robust extraction: try to parse JSON and store it ---
-                # st.session_state.messages.append({"role": "assistant", "content": response_text})
-                # Try to capture grading JSON from any assistant message and persist immediately
-                try:
-                    metrics_obj = _extract_json_from_text(response_text)
-                    if metrics_obj is not None:
-                        st.session_state.grading_result = json.dumps(metrics_obj, ensure_ascii=False)
-                except Exception:
-                    pass
-                
-                # Remove separator and any trailing JSON for display/history
-                display_text = re.sub(r"\|\|\|JSON_DATA\|\|\|.*$", "", response_text, flags=re.S).strip()
-
-                # 3. Render & Save only the CLEAN text to history
-                st.markdown(display_text)
-                st.session_state.messages.append({"role": "assistant", "content": display_text})
-                # st.markdown(response_text)
-                # st.session_state.messages.append({"role": "assistant", "content": response_text})
-                st.session_state.trigger_ai_greeting = False
+            # 2. Save only the CLEAN text to history (the grading JSON rides along as message metadata)
+            record_message("assistant", display_text, meta)
+            st.session_state.trigger_ai_greeting = False
     
     # ==========================================
     # 4. MAIN CHAT INTERFACE
@@ -351,27 +399,25 @@ def new_cxo_page():
     if user_input:
         # Show user input
         st.chat_message("user").markdown(user_input)
-        st.session_state.messages.append({"role": "user", "content": user_input})
+        record_message("user", user_input)
 
         # Track interaction on Tutoring Phase
         if st.session_state.phase == "TUTORING":
             st.session_state.tutoring_counter += 1
 
-        # Generate API Response
+        # Generate API Response (streamed token by token)
         with st.chat_message("assistant"):
-            with st.spinner("Thinking..."):
-                response_text = query_chain(
-                    retriever=st.session_state.retriever,
-                    llm=st.session_state.llm,
-                    user_input=user_input,
-                    role_id=role_id,
-                    current_phase=st.session_state.phase,
-                    chat_history=st.session_state.messages
-                )
-
-                # response = response_text.json()
-                st.markdown(response_text)
-                st.session_state.messages.append({"role": "assistant", "content": response_text})
+            stream = GradingStreamFilter(stream_query_chain(
+                retriever=retriever,
+                llm=llm,
+                user_input=user_input,
+                role_id=role_id,
+                current_phase=st.session_state.phase,
+                chat_history=st.session_state.messages
+            ))
+            st.write_stream(stream)
+            response_text = re.sub(r"\|\|\|JSON_DATA\|\|\|.*$", "", stream.raw, flags=re.S).strip()
+            record_message("assistant", response_text)
 
     # ==========================================
     # 5. BUTTON CONTROLS
@@ -405,6 +451,10 @@ def new_cxo_page():
             """)
             st.divider()
             if st.button("📖 Start Session", key="start_session"):
+                # The id is fixed up front so every turn can be persisted as it happens
+                prefetcher.cancel(st.session_state.session_id)
+                st.session_state.session_id = f"SES-{uuid.uuid4().hex[:8].upper()}"
+                st.query_params["session"] = st.session_state.session_id
                 st.session_state.phase = "TUTORING"
                 st.session_state.trigger_ai_greeting = True
                 st.session_state.tutoring_counter = 0
@@ -418,6 +468,8 @@ def new_cxo_page():
         elif st.session_state.phase == "TUTORING":
             REQUIRED_INTERACTIONS = 1
             if st.session_state.tutoring_counter >= REQUIRED_INTERACTIONS:
+                # Eligible to advance: the roleplay opener (empty history) is generated while the trainee reads
+                prefetch_opener("ROLEPLAY", [], retriever, llm, role_id)
                 if st.button("🚀 Start Roleplay", key="start_roleplay"):
                     st.session_state.phase = "ROLEPLAY"
                     st.session_state.messages_record = st.session_state.messages[:]
@@ -426,6 +478,9 @@ def new_cxo_page():
                     st.rerun()
             # st.info("Ask questions to deepen understanding")
         elif st.session_state.phase == "ROLEPLAY":
+            # Speculative grading only once the persona closed the simulation (each speculation is a billed call)
+            if roleplay_ended(st.session_state.messages):
+                prefetch_opener("GRADING", st.session_state.messages, retriever, llm, role_id)
             if st.button("💯 Finish & Grade", key="finish_grade"):
                 st.session_state.phase = "GRADING"
                 st.session_state.trigger_ai_greeting = True
@@ -462,7 +517,7 @@ def new_cxo_page():
 
                     # 2. Prepare Data Objects
                     # Header Data
-                    session_id = f"SES-{uuid.uuid4().hex[:8].upper()}"
+                    session_id = st.session_state.session_id or f"SES-{uuid.uuid4().hex[:8].upper()}"
                     session_data = {
                         "session_id": session_id,
                         "trainee_name": "Filbert Sembiring M.",
@@ -470,20 +525,20 @@ def new_cxo_page():
                         "date": datetime.now().strftime("%Y-%m-%d %H:%M"),
                         "total_score": metrics.get("total_score", 0),
                         "readiness": metrics.get("readiness", "Undetected"),
-                        "chat_log": json.dumps(st.session_state.messages_record)
                     }
 
                     # Detailed Grades List
                     grades_list = metrics.get("grades", [])
                     
-                    # 3. Generate Report
-                    report_path = create_individual_report(session_data, grades_list, st.session_state.messages_record, st.session_state.llm)
+                    # 3. Save to DB (report_status 'pending') + queue the report job in one transaction
+                    save_full_session(session_data, grades_list, queue_report=True)
 
-                    # 4. Save to DB
-                    session_data["report_path"] = report_path
-                    save_full_session(session_data, grades_list)
+                    # 4. The .docx is rendered in the background by the report worker
+                    report_worker.notify()
 
-                    # 5. Transition
+                    # 5. Transition (the transcript is already in the message store)
+                    st.query_params.pop("session", None)
+                    prefetcher.cancel(session_id)
                     st.session_state.phase = "FINISHED"
                     st.rerun()
 
@@ -493,6 +548,7 @@ def new_cxo_page():
         **Session Recorded Successfully.**
         
         Your performance data has been saved to the database. 
+        The detailed report is being generated in the background and will appear on the PIC Dashboard shortly.
         You can now start a new session or ask your PIC for the detailed report.
         """)
         st.divider()
@@ -500,6 +556,9 @@ def new_cxo_page():
         if st.button("🔄 Start New Session", type="primary"):
             st.session_state.phase = "START"
             st.session_state.messages = []
+            st.session_state.messages_record = []
+            st.session_state.session_id = None
+            st.session_state.pop("grading_result", None)
             st.rerun()
 
 def dashboard_data():
@@ -507,6 +566,7 @@ def dashboard_data():
     Generates dummy data to simulate the Trainee Database.
     In a real app, this would be a SQL Query: SELECT * FROM sessions
     """
+    import pandas as pd
     data = {
         "Session ID": [f"SES-{i:03d}" for i in range(101, 111)],
         "Trainee Name": [
@@ -530,31 +590,79 @@ def dashboard_data():
     
     return df
 
+def render_system_health():
+    """Sidebar panel with cache / runtime statistics for capacity planning."""
+    with st.expander("⚙️ System Health"):
+        st.caption("Embedding Cache")
+        embedder = get_embeddings(create=False) # Don't load the embedding stack just to show stats
+        if embedder is None:
+            st.write("Not loaded in this process yet")
+        else:
+            emb = embedder.stats()
+            st.write(f"Hit rate: **{emb['hit_rate'] * 100:.1f}%**")
+            st.write(f"Memory hits: {emb['memory_hits']} · Disk hits: {emb['disk_hits']} · Misses: {emb['misses']}")
+            st.write(f"Disk size: {emb['disk_bytes'] / (1024 * 1024):.1f} MB")
+        st.caption("LLM Backends")
+        router = get_llm(create=False)
+        if router is None:
+            st.write("Not loaded in this process yet")
+        else:
+            for name, health in router.stats().items():
+                p95 = "n/a" if health["p95_ms"] is None else f"{health['p95_ms']:.0f} ms"
+                st.write(f"{name}: p95 {p95} · failures {health['failures']}{' · demoted' if health['degraded'] else ''}")
+        st.caption("LLM Response Cache")
+        cache = get_response_cache(create=False)
+        if cache is None:
+            st.write("Not loaded in this process yet")
+        else:
+            resp = cache.stats()
+            st.write(f"Hit rate: **{resp['hit_rate'] * 100:.1f}%** · Hits: {resp['hits']} · Misses: {resp['misses']}")
+            st.write(" · ".join(f"{phase}: {c['hits']}/{c['hits'] + c['misses']}" for phase, c in resp["phases"].items()) or "No lookups yet")
+            st.write(f"Disk size: {resp['disk_bytes'] / (1024 * 1024):.1f} MB")
+        st.caption("Tutoring Semantic Cache")
+        semantic = get_semantic_cache(create=False)
+        if semantic is None:
+            st.write("Not loaded in this process yet")
+        else:
+            sem = semantic.stats()
+            st.write(f"Answered: **{sem['hit_rate'] * 100:.1f}%** · Hits: {sem['hits']} · Drafts: {sem['drafts']} · Misses: {sem['misses']}")
+            st.write(f"Cached answers: {sem['items']} in {sem['scopes']} scenarios · Evicted: {sem['evictions']}")
+        st.caption("LLM Queue")
+        queue = governor.stats()
+        st.write(f"In flight: {queue['in_flight']} / {queue['max_concurrency']}"
+                 + ("" if queue["tokens_available"] is None else f" · Tokens left this minute: {queue['tokens_available']}"))
+        for lane, lane_stats in queue["lanes"].items():
+            st.write(f"{lane}: queued {lane_stats['queued']} · served {lane_stats['served']} · "
+                     f"wait avg {lane_stats['avg_wait_ms']:.0f} ms / p95 {lane_stats['p95_wait_ms']:.0f} ms")
+        st.caption("Phase Prefetch")
+        pre = prefetcher.stats()
+        st.write(f"Hit rate: **{pre['hit_rate'] * 100:.1f}%** · Started: {pre['started']} · Used: {pre['used']} · "
+                 f"Cancelled: {pre['cancelled']} · Expired: {pre['expired']} · Pending: {pre['pending']}")
+        st.caption("Report Jobs")
+        st.write(repo.report_job_counts() or "No jobs yet")
+
 def dashboard():
+    # Charting/dataframe stack is only needed here; the chat page never loads it
+    import pandas as pd
+    import altair as alt
+
     st.header("PIC Dashboard")
     st.markdown("Monitor trainee performance, track active sessions, and generate audit reports.")
 
-    # Load Data
-    df = fetch_all_sessions()
-    if df.empty:
+    # Load KPI Rollups (O(1) reads; individual rows are only fetched page by page below)
+    stats = kpi_snapshot()
+    if not stats["total_sessions"]:
         st.info("No training sessions recorded yet")
         return
-    
-    # Initialize Session State
-    if "llm" not in st.session_state:
-        st.session_state.llm = ChatGoogleGenerativeAI(model="gemini-3-flash-preview")
 
     # ==========================================
     # 1. Key Performance Indicators (KPI)
     # ==========================================
     # Calculate Metrics
-    total_trainees = len(df)
-    avg_score = df["Score"].mean()
-    pass_rate = (df[df["Status"] == "Passed"].shape[0] / total_trainees) * 100
-    if "role_id" in df and not df["role_id"].dropna().empty:
-        active_roles = df["role_id"].value_counts().idxmax() # Most popular role
-    else:
-        active_roles = "N/A"
+    total_trainees = stats["total_sessions"]
+    avg_score = stats["avg_score"]
+    pass_rate = stats["pass_rate"]
+    active_roles = stats["most_active_role"] # Most popular role
 
     # Display Metrics in Columns
     kpi1, kpi2, kpi3, kpi4 = st.columns(4)
@@ -598,7 +706,7 @@ def dashboard():
     ''', unsafe_allow_html=True)
     
     with kpi1:
-        st.metric(label="Total Sessions", value=total_trainees, delta="2 New", border=True)
+        st.metric(label="Total Sessions", value=total_trainees, delta=f"{stats['recent_sessions']} in 7 days", border=True)
     with kpi2:
         st.metric(label="Average Score", value=f"{avg_score:.1f}", delta=f"{avg_score - 70:.1f} vs Target", border=True)
     with kpi3:
@@ -615,9 +723,10 @@ def dashboard():
         with st.container(border=True, height="stretch"):
             st.markdown("#### Score Distribution")
             # Altair Chart
-            chart = alt.Chart(df).mark_bar(size=30).encode(
-                x = alt.X("Score", bin=True),
-                y = 'count()',
+            histogram = pd.DataFrame(stats["score_histogram"]).rename(columns={"bucket": "Score", "status": "Status", "sessions": "Count"})
+            chart = alt.Chart(histogram).mark_bar(size=30).encode(
+                x = alt.X("Score:O", title="Score (binned)", axis=alt.Axis(labelAngle=0)),
+                y = alt.Y("Count:Q"),
                 color = alt.Color("Status").scale(range=["#e74c3c", "#2ecc71"])
             ).properties(height=300)
             st.altair_chart(chart, use_container_width=True)
@@ -625,9 +734,7 @@ def dashboard():
     with col_chart2:
         with st.container(border=True, height="stretch"):
             st.markdown("#### Readiness Level")
-            df["readiness"] = df["Score"].apply(lambda x: "Ready" if x > 80 else ("Training Needed" if x > 60 else "Not Ready"))
-            readiness_counts = df["readiness"].value_counts().reset_index()
-            readiness_counts.columns = ["Level", "Count"]
+            readiness_counts = pd.DataFrame(stats["readiness_levels"]).rename(columns={"level": "Level", "sessions": "Count"})
             domain = ["Not Ready", "Training Needed", "Ready"]
             chart2 = alt.Chart(readiness_counts).mark_bar(size=60).encode(
                 x = alt.X("Level:N", axis=alt.Axis(labelAngle=0), sort=domain),
@@ -639,35 +746,43 @@ def dashboard():
     # ==========================================
     # 3. Records
     # ==========================================
-    # Filter Toolbar
-    col_filter1, col_filter2 = st.columns([3, 1])
+    # Filter Toolbar (every filter is pushed down into SQL)
+    col_filter1, col_filter2, col_filter3, col_filter4, col_filter5 = st.columns([2, 1, 1, 1, 2])
 
     with col_filter1:
         # Search Bar
-        search_query = st.text_input("🔍 Search Trainee Name", placeholder="Type name...")
+        search_query = st.text_input("🔍 Search Trainee Name", placeholder="Name starts with...")
     with col_filter2:
-        # Button Generate Report
-        st.space()
-        csv_data = df.to_csv(index=False).encode('utf-8')
-        st.download_button(
-            label="📄 Export Report (CSV)",
-            data=csv_data,
-            file_name="trainee_performance_report.csv",
-            mime="text/csv",
-            type="primary",
-            use_container_width=True
-        )
-
-    # Filter Logic
-    if search_query:
-        filtered_df = df[df["trainee_name"].str.contains(search_query, case=False)]
-    else:
-        filtered_df = df
+        role_filter = st.selectbox("Roleplay", ["All"] + repo.list_roles())
+    with col_filter3:
+        readiness_filter = st.selectbox("Readiness", ["All"] + repo.list_readiness())
+    with col_filter4:
+        band_filter = st.selectbox("Score", ["All"] + list(SCORE_BANDS))
+    with col_filter5:
+        date_range = st.date_input("Date Range", value=())
+
+    filters = {
+        "name_prefix": search_query,
+        "role_id": None if role_filter == "All" else role_filter,
+        "readiness": None if readiness_filter == "All" else readiness_filter,
+        "score_band": None if band_filter == "All" else band_filter,
+    }
+    if len(date_range) == 2:
+        filters["date_from"], filters["date_to"] = date_range
+
+    # Keyset Pagination: a stack of page cursors, reset whenever the filters change
+    if st.session_state.get("dash_filters") != filters:
+        st.session_state.dash_filters = filters
+        st.session_state.dash_cursors = [None]
+        st.session_state.pop("dash_export", None)
+    page_no = len(st.session_state.dash_cursors)
+    filtered_df, next_cursor = fetch_sessions_page(filters, page_size=DASHBOARD_PAGE_SIZE, after=st.session_state.dash_cursors[-1])
+    total_matches = repo.count_filtered_sessions(filters)
 
     st.dataframe(
         data=filtered_df,
         use_container_width=True,
-        column_order=("session_id", "trainee_name", "role_id", "Role", "date", "Duration (Mins)", "readiness", "Status", "Score"),
+        column_order=("session_id", "trainee_name", "role_id", "Role", "date", "Duration (Mins)", "readiness", "Status", "Score", "report_status"),
         column_config={
             "Score": st.column_config.ProgressColumn(
                 "Score",
@@ -696,19 +811,69 @@ def dashboard():
             "role_id": st.column_config.TextColumn(
                 "Roleplay"
             ),
+            "report_status": st.column_config.TextColumn(
+                "Report"
+            ),
         }, hide_index=True
     )
 
+    # Pager + Export
+    first_row = (page_no - 1) * DASHBOARD_PAGE_SIZE + 1
+    col_page1, col_page2, col_page3, col_page4 = st.columns([1, 2, 1, 2])
+    with col_page1:
+        if st.button("◀ Prev", disabled=page_no == 1, use_container_width=True):
+            st.session_state.dash_cursors.pop()
+            st.rerun()
+    with col_page2:
+        if filtered_df.empty:
+            st.caption("No sessions match the current filters")
+        else:
+            st.caption(f"Page {page_no} · sessions {first_row}-{first_row + len(filtered_df) - 1} of {total_matches}")
+    with col_page3:
+        if st.button("Next ▶", disabled=next_cursor is None, use_container_width=True):
+            st.session_state.dash_cursors.append(next_cursor)
+            st.rerun()
+    with col_page4:
+        # The CSV is built on demand (streamed from SQL page by page), not on every rerun
+        if "dash_export" not in st.session_state:
+            if st.button("📄 Prepare Export (CSV)", use_container_width=True):
+                export_df = pd.DataFrame(repo.iter_sessions(filters))
+                st.session_state.dash_export = export_df.to_csv(index=False).encode('utf-8')
+                st.rerun()
+        else:
+            st.download_button(
+                label="📄 Export Report (CSV)",
+                data=st.session_state.dash_export,
+                file_name="trainee_performance_report.csv",
+                mime="text/csv",
+                type="primary",
+                use_container_width=True
+            )
+
+    # ==========================================
+    # 4. Full-Text Search
+    # ==========================================
+    st.write("")
+    st.markdown("#### 🗂️ Search Transcripts & Feedback")
+    text_query = st.text_input("Find sessions by what was said or written", placeholder='e.g. palsu, blokir, "kartu kredit", verif*')
+    if text_query:
+        hits = repo.search(text_query, limit=20)
+        if not hits:
+            st.caption("No matches")
+        for hit in hits:
+            where = "Transcript" if hit["source"] == "transcript" else f"Grading · {hit['criteria']}"
+            st.markdown(f"**{hit['trainee_name']}** · `{hit['session_id']}` · {hit['date']} · {where}  \n{hit['snippet']}")
+
     # ==========================================
-    # 4. Trainee Report
+    # 5. Trainee Report
     # ==========================================
     st.write("")
     st.markdown("#### 🔎 View Trainee Report")
 
-    selected_session = st.selectbox("Select Session ID to View Report:", df["session_id"])
+    selected_session = st.selectbox("Select Session ID to View Report:", filtered_df["session_id"])
 
     if selected_session:
-        session_data = df[df["session_id"] == selected_session].iloc[0]
+        session_data = filtered_df[filtered_df["session_id"] == selected_session].iloc[0]
         file_path = session_data["report_path"]
 
         with st.expander(f"Report for {session_data['trainee_name']} ({selected_session})", expanded=True):
@@ -725,7 +890,23 @@ def dashboard():
 
             st.divider()
 
-            if file_path and os.path.exists(file_path):
+            # Transcript: streamed from the message store only when asked for
+            if st.toggle("💬 Show Transcript", key=f"transcript_{selected_session}"):
+                with st.container(height=400):
+                    for msg in repo.iter_messages(selected_session):
+                        if "[SYSTEM_TRIGGER" not in msg["content"]:
+                            st.chat_message(msg["role"]).markdown(msg["content"])
+                st.divider()
+
+            report_status = session_data.get("report_status")
+            if report_status in ("pending", "running"):
+                st.info("⏳ The report is being generated in the background. Refresh in a moment.")
+            elif report_status == "failed":
+                st.error("❌ Report generation failed.")
+                if st.button("🔁 Retry Report", key=f"retry_report_{selected_session}"):
+                    queue_report(selected_session)
+                    st.rerun()
+            elif file_path and os.path.exists(file_path):
                 with open(file_path, "rb") as f:
                     st.download_button(
                         label="📥 Download Individual Report (.docx)",
@@ -744,17 +925,11 @@ def dashboard():
         if st.button("✨ Generate Report"):
             with st.spinner("AI is analyzing all training records..."):
                 
-                # Convert dataframe to a string summary for the LLM
-                data_summary = df.to_csv(index=False)
+                # Aggregate in SQL: the prompt gets a fixed-size digest, not every session row
+                data_summary = format_digest(build_training_digest())
                 
-                # 4. GENERATE DOCX
-                stats = {
-                    "total_sessions": len(df),
-                    "avg_score": df["Score"].mean(),
-                    "pass_rate": (df[df["Status"] == "Passed"].shape[0] / len(df)) * 100
-                }
-                
-                report_path = create_executive_summary(stats, data_summary, st.session_state.llm)
+                # 4. GENERATE DOCX (shared LLM client, built on first report)
+                report_path = create_executive_summary(stats, data_summary, get_llm())
                 st.session_state['exec_report_path'] = report_path
                 st.success("Executive Report Generated!")
 
@@ -767,6 +942,8 @@ def dashboard():
                     mime="application/vnd.openxmlformats-officedocument.wordprocessingml.document"
                 )
 
+        render_system_health()
+
 def test():
     st.title("Test")
 
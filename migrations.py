@@ -0,0 +1,395 @@
+"""
+Versioned Schema Migrations.
+
+Every schema change is an ordered step in MIGRATIONS. The `schema_version` table records which steps
+ran, so a process only executes the steps the database has not seen yet (normally none) instead of
+re-running every CREATE TABLE on each page load. migrate() runs at most once per process (lock +
+flag); concurrent processes are safe because a step first claims its version row, which takes the
+write lock, and a process that loses the race skips the step.
+
+Steps are written with IF NOT EXISTS so databases created by the old ad-hoc init_db adopt the
+versioned history without changes.
+"""
+import json
+import time
+import zlib
+import logging
+import threading
+from repository import Repository, SQLiteBackend, pack_message
+
+logger = logging.getLogger("gaia")
+
+SQL_SCHEMA_VERSION_TABLE = '''CREATE TABLE IF NOT EXISTS schema_version (
+    version INTEGER PRIMARY KEY,
+    name TEXT,
+    applied_at REAL
+)'''
+SQL_APPLIED_VERSIONS = "SELECT version FROM schema_version"
+SQL_CLAIM_VERSION = "INSERT INTO schema_version (version, name, applied_at) VALUES (?, ?, ?)"
+
+# ----- STEPS -----
+def _base_tables(c, sqlite):
+    # Table: Roles (Categories)
+    c.execute('''CREATE TABLE IF NOT EXISTS roles (
+        role_id TEXT PRIMARY KEY,
+        role_name TEXT
+    )''')
+
+    # Table: Scenarios (The Content Pairs)
+    # Linked to Role. Stores the Prompts.
+    c.execute('''CREATE TABLE IF NOT EXISTS scenarios (
+        scenario_id TEXT PRIMARY KEY,
+        role_id TEXT,
+        topic TEXT,
+        mentor_persona TEXT,
+        simulation_persona TEXT,
+        scenario_details TEXT,
+        FOREIGN KEY(role_id) REFERENCES roles(role_id)
+    )''')
+
+    # Table: Grading Rubrics (Prompt Parameters)
+    # Stores the criteria list for the AI.
+    c.execute('''CREATE TABLE IF NOT EXISTS grading_rubrics (
+        rubric_id INTEGER PRIMARY KEY AUTOINCREMENT,
+        scenario_id TEXT,
+        criteria TEXT,
+        description TEXT,
+        FOREIGN KEY(scenario_id) REFERENCES scenarios(scenario_id)
+    )''')
+
+    # Table: Sessions (Header)
+    # Replaced 'user_id' with 'trainee_name' for simple tracking.
+    c.execute('''CREATE TABLE IF NOT EXISTS sessions (
+        session_id TEXT PRIMARY KEY,
+        trainee_name TEXT,
+        scenario_id TEXT,
+        date TEXT,
+        total_score INTEGER,
+        readiness TEXT,
+        chat_log TEXT,
+        report_path TEXT,
+        FOREIGN KEY(scenario_id) REFERENCES scenarios(scenario_id)
+    )''')
+
+    # Table: Session Grades (Detail)
+    # Stores specific scores/feedback per criteria.
+    c.execute('''CREATE TABLE IF NOT EXISTS session_grades (
+        grade_id INTEGER PRIMARY KEY AUTOINCREMENT,
+        session_id TEXT,
+        criteria TEXT,
+        score INTEGER,
+        evidence TEXT,
+        feedback TEXT,
+        FOREIGN KEY(session_id) REFERENCES sessions(session_id)
+    )''')
+
+def _report_jobs(c, sqlite):
+    # Report Generation State (pending / running / ready / failed; NULL for legacy rows)
+    session_columns = [row[1] for row in c.execute("PRAGMA table_info(sessions)").fetchall()]
+    if "report_status" not in session_columns:
+        c.execute("ALTER TABLE sessions ADD COLUMN report_status TEXT")
+
+    # Table: Report Jobs (Background Queue)
+    # Persisted so queued reports survive a restart; processed by jobs.ReportWorker.
+    c.execute('''CREATE TABLE IF NOT EXISTS report_jobs (
+        job_id INTEGER PRIMARY KEY AUTOINCREMENT,
+        session_id TEXT,
+        status TEXT,
+        attempts INTEGER DEFAULT 0,
+        error TEXT,
+        created_at REAL,
+        updated_at REAL,
+        FOREIGN KEY(session_id) REFERENCES sessions(session_id)
+    )''')
+
+def _config_change_tracking(c, sqlite):
+    # Change Tracking for the Scenario Cache
+    # config_version: one counter bumped by any scenario/rubric edit (cheap "did anything change?" check)
+    # scenario_revisions: per-scenario counter, so only the edited scenarios are reloaded
+    c.execute('''CREATE TABLE IF NOT EXISTS config_version (
+        id INTEGER PRIMARY KEY CHECK (id = 1),
+        version INTEGER NOT NULL
+    )''')
+    c.execute("INSERT OR IGNORE INTO config_version VALUES (1, 0)")
+    c.execute('''CREATE TABLE IF NOT EXISTS scenario_revisions (
+        scenario_id TEXT PRIMARY KEY,
+        revision INTEGER NOT NULL
+    )''')
+    for table in ("scenarios", "grading_rubrics"):
+        for event, refs in (("INSERT", ("NEW",)), ("UPDATE", ("OLD", "NEW")), ("DELETE", ("OLD",))):
+            bumps = "".join(
+                f"INSERT INTO scenario_revisions VALUES ({ref}.scenario_id, 1) "
+                f"ON CONFLICT(scenario_id) DO UPDATE SET revision = revision + 1; "
+                for ref in refs
+            )
+            c.execute(f'''CREATE TRIGGER IF NOT EXISTS trg_{table}_{event.lower()}_version
+                AFTER {event} ON {table}
+                BEGIN
+                    {bumps}
+                    UPDATE config_version SET version = version + 1;
+                END''')
+
+def _full_text_search(c, sqlite):
+    # Full-Text Search (SQLite FTS5)
+    # transcripts_fts: copy of sessions.chat_log keyed by session_id (sessions has no stable integer rowid)
+    # grades_fts: external content over session_grades (evidence/feedback are not stored twice)
+    if not sqlite:
+        logger.warning("Full-text search tables are SQLite-only; skipped")
+        return
+    existing = {row[0] for row in c.execute("SELECT name FROM sqlite_master WHERE type = 'table'").fetchall()}
+    c.execute('''CREATE VIRTUAL TABLE IF NOT EXISTS transcripts_fts USING fts5(
+        session_id UNINDEXED, transcript, tokenize = 'unicode61 remove_diacritics 2'
+    )''')
+    c.execute('''CREATE VIRTUAL TABLE IF NOT EXISTS grades_fts USING fts5(
+        evidence, feedback, content = 'session_grades', content_rowid = 'grade_id',
+        tokenize = 'unicode61 remove_diacritics 2'
+    )''')
+    c.execute('''CREATE TRIGGER IF NOT EXISTS trg_sessions_fts_insert AFTER INSERT ON sessions BEGIN
+        INSERT INTO transcripts_fts (session_id, transcript) VALUES (NEW.session_id, NEW.chat_log);
+    END''')
+    c.execute('''CREATE TRIGGER IF NOT EXISTS trg_sessions_fts_update AFTER UPDATE OF chat_log ON sessions BEGIN
+        DELETE FROM transcripts_fts WHERE session_id = OLD.session_id;
+        INSERT INTO transcripts_fts (session_id, transcript) VALUES (NEW.session_id, NEW.chat_log);
+    END''')
+    c.execute('''CREATE TRIGGER IF NOT EXISTS trg_sessions_fts_delete AFTER DELETE ON sessions BEGIN
+        DELETE FROM transcripts_fts WHERE session_id = OLD.session_id;
+    END''')
+    c.execute('''CREATE TRIGGER IF NOT EXISTS trg_session_grades_fts_insert AFTER INSERT ON session_grades BEGIN
+        INSERT INTO grades_fts (rowid, evidence, feedback) VALUES (NEW.grade_id, NEW.evidence, NEW.feedback);
+    END''')
+    c.execute('''CREATE TRIGGER IF NOT EXISTS trg_session_grades_fts_update AFTER UPDATE ON session_grades BEGIN
+        INSERT INTO grades_fts (grades_fts, rowid, evidence, feedback) VALUES ('delete', OLD.grade_id, OLD.evidence, OLD.feedback);
+        INSERT INTO grades_fts (rowid, evidence, feedback) VALUES (NEW.grade_id, NEW.evidence, NEW.feedback);
+    END''')
+    c.execute('''CREATE TRIGGER IF NOT EXISTS trg_session_grades_fts_delete AFTER DELETE ON session_grades BEGIN
+        INSERT INTO grades_fts (grades_fts, rowid, evidence, feedback) VALUES ('delete', OLD.grade_id, OLD.evidence, OLD.feedback);
+    END''')
+    # Backfill rows saved before the index existed
+    if "transcripts_fts" not in existing:
+        c.execute("INSERT INTO transcripts_fts (session_id, transcript) SELECT session_id, chat_log FROM sessions")
+    if "grades_fts" not in existing:
+        c.execute("INSERT INTO grades_fts (grades_fts) VALUES ('rebuild')")
+
+def _kpi_rollups(c, sqlite):
+    # KPI Rollups (dashboard cards read these instead of scanning sessions)
+    # Updated by Repository.save_session in the same transaction as the session itself.
+    for table, key in (("kpi_daily", "day TEXT"), ("kpi_role", "role_id TEXT"), ("kpi_scenario", "scenario_id TEXT")):
+        c.execute(f'''CREATE TABLE IF NOT EXISTS {table} (
+            {key} PRIMARY KEY,
+            sessions INTEGER NOT NULL,
+            score_sum REAL NOT NULL,
+            pass_count INTEGER NOT NULL
+        )''')
+    c.execute('''CREATE TABLE IF NOT EXISTS kpi_criteria (
+        scenario_id TEXT,
+        criteria TEXT,
+        graded INTEGER NOT NULL,
+        score_sum REAL NOT NULL,
+        PRIMARY KEY (scenario_id, criteria)
+    )''')
+    c.execute('''CREATE TABLE IF NOT EXISTS kpi_scores (
+        score INTEGER PRIMARY KEY,
+        sessions INTEGER NOT NULL
+    )''')
+    # Backfill from existing sessions. Frozen copy of the rebuild as of this step (pass mark 80):
+    # repository.SQL_KPI_REBUILD may evolve with the schema, a released step must not
+    for table in ("kpi_daily", "kpi_role", "kpi_scenario", "kpi_criteria", "kpi_scores"):
+        c.execute(f"DELETE FROM {table}")
+    c.execute('''INSERT INTO kpi_daily (day, sessions, score_sum, pass_count)
+        SELECT substr(s.date, 1, 10), count(*), SUM(s.total_score), SUM(CASE WHEN s.total_score >= 80 THEN 1 ELSE 0 END)
+        FROM sessions s GROUP BY substr(s.date, 1, 10)''')
+    c.execute('''INSERT INTO kpi_role (role_id, sessions, score_sum, pass_count)
+        SELECT sc.role_id, count(*), SUM(s.total_score), SUM(CASE WHEN s.total_score >= 80 THEN 1 ELSE 0 END)
+        FROM sessions s JOIN scenarios sc ON s.scenario_id = sc.scenario_id GROUP BY sc.role_id''')
+    c.execute('''INSERT INTO kpi_scenario (scenario_id, sessions, score_sum, pass_count)
+        SELECT s.scenario_id, count(*), SUM(s.total_score), SUM(CASE WHEN s.total_score >= 80 THEN 1 ELSE 0 END)
+        FROM sessions s GROUP BY s.scenario_id''')
+    c.execute('''INSERT INTO kpi_criteria (scenario_id, criteria, graded, score_sum)
+        SELECT s.scenario_id, g.criteria, count(*), SUM(g.score)
+        FROM session_grades g JOIN sessions s ON g.session_id = s.session_id GROUP BY s.scenario_id, g.criteria''')
+    c.execute('''INSERT INTO kpi_scores (score, sessions)
+        SELECT CAST(ROUND(s.total_score) AS INTEGER), count(*) FROM sessions s GROUP BY CAST(ROUND(s.total_score) AS INTEGER)''')
+
+def _query_indexes(c, sqlite):
+    # Foreign-key lookups that were full scans
+    c.execute("CREATE INDEX IF NOT EXISTS idx_session_grades_session ON session_grades(session_id)")
+    c.execute("CREATE INDEX IF NOT EXISTS idx_grading_rubrics_scenario ON grading_rubrics(scenario_id, rubric_id)")
+    c.execute("CREATE INDEX IF NOT EXISTS idx_scenarios_role ON scenarios(role_id)")
+    c.execute("CREATE INDEX IF NOT EXISTS idx_report_jobs_status ON report_jobs(status, job_id)")
+
+    # Dashboard table: covering index in keyset order, so a page never touches the wide rows (chat_log)
+    c.execute("DROP INDEX IF EXISTS idx_sessions_date")
+    c.execute('''CREATE INDEX IF NOT EXISTS idx_sessions_listing ON sessions(
+        date, session_id, scenario_id, trainee_name, total_score, readiness, report_status, report_path
+    )''')
+    # Dashboard filters: name prefix, readiness (also the filter options), score band, per-scenario stats
+    c.execute("CREATE INDEX IF NOT EXISTS idx_sessions_trainee_lower ON sessions(lower(trainee_name))")
+    c.execute("CREATE INDEX IF NOT EXISTS idx_sessions_readiness ON sessions(readiness)")
+    c.execute("CREATE INDEX IF NOT EXISTS idx_sessions_scenario_score ON sessions(scenario_id, total_score)")
+    if sqlite:
+        c.execute("ANALYZE") # Planner statistics for the new indexes
+
+def _message_store(c, sqlite):
+    # Table: Messages (one row per chat turn, appended live; replaces the sessions.chat_log blob)
+    # No FK to sessions: the header row is only written when the session is finished.
+    c.execute('''CREATE TABLE IF NOT EXISTS messages (
+        session_id TEXT NOT NULL,
+        seq INTEGER NOT NULL,
+        phase TEXT,
+        role TEXT,
+        content TEXT,
+        content_z BLOB,
+        meta TEXT,
+        created_at REAL,
+        PRIMARY KEY (session_id, seq)
+    )''')
+
+    # Backfill: split legacy chat_log blobs into messages (non-JSON logs become one 'system' message)
+    backfill = []
+    for session_id, chat_log in c.execute("SELECT session_id, chat_log FROM sessions WHERE chat_log IS NOT NULL").fetchall():
+        try:
+            turns = json.loads(chat_log)
+        except ValueError:
+            turns = None
+        if not isinstance(turns, list):
+            turns = [{"role": "system", "content": chat_log}]
+        for seq, turn in enumerate(turns, start=1):
+            content = str(turn.get("content", "")) if isinstance(turn, dict) else str(turn)
+            role = turn.get("role", "system") if isinstance(turn, dict) else "system"
+            backfill.append((session_id, seq, role, content))
+    c.executemany(
+        "INSERT OR IGNORE INTO messages (session_id, seq, phase, role, content, content_z, meta, created_at) VALUES (?, ?, NULL, ?, ?, ?, NULL, NULL)",
+        [(sid, seq, role, *pack_message(content)) for sid, seq, role, content in backfill]
+    )
+
+    if not sqlite:
+        return
+    # Search now indexes individual messages (written by Repository.append_message) instead of chat_log
+    for event in ("insert", "update", "delete"):
+        c.execute(f"DROP TRIGGER IF EXISTS trg_sessions_fts_{event}")
+    c.execute("DROP TABLE IF EXISTS transcripts_fts")
+    c.execute('''CREATE VIRTUAL TABLE transcripts_fts USING fts5(
+        session_id UNINDEXED, seq UNINDEXED, transcript, tokenize = 'unicode61 remove_diacritics 2'
+    )''')
+    c.executemany("INSERT INTO transcripts_fts (session_id, seq, transcript) VALUES (?, ?, ?)",
+                  [(sid, seq, content) for sid, seq, _, content in backfill])
+    c.execute('''CREATE TRIGGER IF NOT EXISTS trg_sessions_delete_messages AFTER DELETE ON sessions BEGIN
+        DELETE FROM messages WHERE session_id = OLD.session_id;
+        DELETE FROM transcripts_fts WHERE session_id = OLD.session_id;
+    END''')
+
+def _scenario_documents(c, sqlite):
+    # Table: Scenario Documents (which Knowledge Base document sets a scenario retrieves from)
+    # doc_set = top-level folder under UPLOAD_DIR (files directly in UPLOAD_DIR are "general"), see ingest.doc_set_of
+    # A scenario without rows searches the whole collection.
+    c.execute('''CREATE TABLE IF NOT EXISTS scenario_documents (
+        scenario_id TEXT NOT NULL,
+        doc_set TEXT NOT NULL,
+        PRIMARY KEY (scenario_id, doc_set),
+        FOREIGN KEY(scenario_id) REFERENCES scenarios(scenario_id)
+    )''')
+
+    # Default: the scenario's role folder plus the shared documents
+    c.execute("INSERT OR IGNORE INTO scenario_documents (scenario_id, doc_set) SELECT scenario_id, role_id FROM scenarios")
+    c.execute("INSERT OR IGNORE INTO scenario_documents (scenario_id, doc_set) SELECT scenario_id, 'general' FROM scenarios")
+
+    # Editing the mapping invalidates the scenario cache like a scenario/rubric edit (see step 3)
+    for event, refs in (("INSERT", ("NEW",)), ("UPDATE", ("OLD", "NEW")), ("DELETE", ("OLD",))):
+        bumps = "".join(
+            f"INSERT INTO scenario_revisions VALUES ({ref}.scenario_id, 1) "
+            f"ON CONFLICT(scenario_id) DO UPDATE SET revision = revision + 1; "
+            for ref in refs
+        )
+        c.execute(f'''CREATE TRIGGER IF NOT EXISTS trg_scenario_documents_{event.lower()}_version
+            AFTER {event} ON scenario_documents
+            BEGIN
+                {bumps}
+                UPDATE config_version SET version = version + 1;
+            END''')
+
+def _message_search_triggers(c, sqlite):
+    # Transcript search is trigger-synced again (step 7 indexed in Repository.append_message only).
+    # A turn becomes searchable once its session header exists, i.e. when the session is finished: open or
+    # abandoned sessions have no header, could never be found (search joins sessions) and the delete
+    # trigger on sessions would never clean them up.
+    # Compressed bodies (content IS NULL, text only in content_z) cannot be decompressed in SQL; those rows
+    # are indexed by Repository.save_session / append_message.
+    if not sqlite:
+        return
+    c.execute('''CREATE TRIGGER IF NOT EXISTS trg_sessions_fts_index_messages AFTER INSERT ON sessions BEGIN
+        INSERT INTO transcripts_fts (session_id, seq, transcript)
+            SELECT session_id, seq, content FROM messages WHERE session_id = NEW.session_id AND content IS NOT NULL;
+    END''')
+    c.execute('''CREATE TRIGGER IF NOT EXISTS trg_messages_fts_insert AFTER INSERT ON messages
+        WHEN NEW.content IS NOT NULL AND EXISTS (SELECT 1 FROM sessions WHERE session_id = NEW.session_id)
+        BEGIN
+            INSERT INTO transcripts_fts (session_id, seq, transcript) VALUES (NEW.session_id, NEW.seq, NEW.content);
+        END''')
+
+    # Re-index finished sessions only, which also drops the rows of open / abandoned sessions
+    c.execute("DELETE FROM transcripts_fts")
+    c.execute('''INSERT INTO transcripts_fts (session_id, seq, transcript)
+        SELECT m.session_id, m.seq, m.content FROM messages m JOIN sessions s ON s.session_id = m.session_id
+        WHERE m.content IS NOT NULL''')
+    compressed = c.execute('''SELECT m.session_id, m.seq, m.content_z FROM messages m JOIN sessions s ON s.session_id = m.session_id
+        WHERE m.content IS NULL AND m.content_z IS NOT NULL''').fetchall()
+    c.executemany("INSERT INTO transcripts_fts (session_id, seq, transcript) VALUES (?, ?, ?)",
+                  [(sid, seq, zlib.decompress(blob).decode("utf-8")) for sid, seq, blob in compressed])
+
+# Ordered, append-only: never edit or renumber a released step, add a new one instead
+MIGRATIONS = [
+    (1, "base tables", _base_tables),
+    (2, "report jobs", _report_jobs),
+    (3, "scenario config change tracking", _config_change_tracking),
+    (4, "full-text search", _full_text_search),
+    (5, "kpi rollups", _kpi_rollups),
+    (6, "query indexes", _query_indexes),
+    (7, "message store", _message_store),
+    (8, "scenario documents", _scenario_documents),
+    (9, "message search triggers", _message_search_triggers),
+]
+LATEST_VERSION = MIGRATIONS[-1][0]
+
+# ----- RUNNER -----
+_migrate_lock = threading.Lock()
+_migrated = set() # id(repo) already at LATEST_VERSION in this process
+
+def applied_versions(repo: Repository) -> set:
+    with repo.pool.transaction() as con:
+        con.execute(SQL_SCHEMA_VERSION_TABLE)
+        return {row[0] for row in con.execute(repo.sql(SQL_APPLIED_VERSIONS)).fetchall()}
+
+def migrate(repo: Repository, target: int = LATEST_VERSION) -> list:
+    """
+    Applies the missing steps up to `target` (each in its own transaction) and returns their versions.
+    Cheap after the first call in a process.
+    """
+    if target == LATEST_VERSION and id(repo) in _migrated:
+        return []
+    with _migrate_lock:
+        if target == LATEST_VERSION and id(repo) in _migrated:
+            return []
+
+        sqlite = isinstance(repo.pool.backend, SQLiteBackend)
+        done = applied_versions(repo)
+        applied = []
+        for version, name, step in MIGRATIONS:
+            if version > target or version in done:
+                continue
+            started = time.perf_counter()
+            try:
+                with repo.pool.transaction() as con:
+                    # Claim first: opens the write transaction, so the DDL below commits or rolls back with it
+                    con.execute(repo.sql(SQL_CLAIM_VERSION), (version, name, time.time()))
+                    step(con.cursor(), sqlite)
+            except Exception:
+                if version in applied_versions(repo):
+                    logger.info(f"Migration {version} ({name}) applied by another process")
+                    continue
+                raise
+            applied.append(version)
+            logger.info(f"Migration {version} ({name}) applied in {time.perf_counter() - started:.2f}s")
+
+        if target == LATEST_VERSION:
+            _migrated.add(id(repo))
+        return applied
@@ -0,0 +1,189 @@
+"""
+Speculative next-phase prefetch.
+
+Once a session may advance (TUTORING reached REQUIRED_INTERACTIONS, or the roleplay persona closed the
+simulation with ROLEPLAY_END_MARKER), main.py starts generating the next phase's opener in a background thread. The job is keyed by (phase, history fingerprint): when the
+trainee clicks the button with the same history, take() hands over the job and the page streams it from
+its buffer (already finished = instant, still running = continues live). Any other key, or a job still
+queued behind other prefetches, is a miss and the page falls back to a normal (interactive lane) call.
+
+Stale jobs are cancelled: a newer job for the same phase, a take() for another phase, cancel(session)
+and PREFETCH_TTL expiry (abandoned browser tabs). Cancelling stops reading the LLM stream.
+Prefetch calls run in the governor's "prefetch" lane, behind chat turns and grading.
+"""
+import os
+import json
+import time
+import hashlib
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+logger = logging.getLogger("gaia")
+
+PREFETCH_WORKERS = int(os.getenv("PREFETCH_WORKERS", "2")) # Background prefetch threads per process (0 disables)
+PREFETCH_TTL = float(os.getenv("PREFETCH_TTL", "600")) # Seconds an unused prefetch is kept
+PREFETCH_PHASES = [p.strip() for p in os.getenv("PREFETCH_PHASES", "ROLEPLAY,GRADING").split(",") if p.strip()] # Phases whose opener is prefetched
+ROLEPLAY_END_MARKER = "SIMULATION ENDED" # Closing line the ROLEPLAY prompt makes the persona say; grading is only speculated after it
+
+def history_key(messages: list) -> str:
+    """Fingerprint of the chat history a phase opener is generated from."""
+    payload = json.dumps([(m.get("role"), m.get("content")) for m in messages], ensure_ascii=False)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+def roleplay_ended(messages: list) -> bool:
+    """True when the persona's last reply ended the simulation, i.e. "Finish & Grade" is the likely next click."""
+    last = next((m for m in reversed(messages) if m.get("role") == "assistant"), None)
+    return last is not None and ROLEPLAY_END_MARKER in last.get("content", "").upper()
+
+class _Job:
+    """One background generation; chunks are buffered so a late reader replays them, then follows live."""
+
+    def __init__(self, phase: str, key: str):
+        self.phase = phase
+        self.key = key
+        self.created = time.monotonic()
+        self.chunks = []
+        self.done = False
+        self.error = None
+        self.cancelled = threading.Event()
+        self.cond = threading.Condition()
+        self.future = None
+
+    def run(self, produce):
+        stream = None
+        try:
+            if self.cancelled.is_set():
+                return
+            stream = produce()
+            for chunk in stream:
+                if self.cancelled.is_set():
+                    break
+                with self.cond:
+                    self.chunks.append(chunk)
+                    self.cond.notify_all()
+        except Exception as e:
+            logger.warning(f"Prefetch of {self.phase} failed: {e}")
+            self.error = e
+        finally:
+            if hasattr(stream, "close"):
+                stream.close() # Stops the LLM stream when cancelled
+            with self.cond:
+                self.done = True
+                self.cond.notify_all()
+
+    def cancel(self):
+        self.cancelled.set()
+        if self.future is not None:
+            self.future.cancel() # Not started yet: never runs
+
+    def follow(self):
+        """Yields every chunk produced so far, then the rest as it arrives."""
+        index = 0
+        while True:
+            with self.cond:
+                while index >= len(self.chunks) and not self.done:
+                    self.cond.wait()
+                if index < len(self.chunks):
+                    chunk = self.chunks[index]
+                    index += 1
+                elif self.error is not None:
+                    raise self.error
+                else:
+                    return
+            yield chunk
+
+class Prefetcher:
+    def __init__(self, workers: int = PREFETCH_WORKERS, ttl: float = PREFETCH_TTL, phases=PREFETCH_PHASES):
+        self.workers = workers
+        self.ttl = ttl
+        self.phases = set(phases)
+        self._pool = None
+        self._jobs = {} # session id -> {phase: _Job}
+        self._lock = threading.Lock()
+        self._stats = {"started": 0, "used": 0, "cancelled": 0, "expired": 0}
+
+    def enabled(self, phase: str) -> bool:
+        return self.workers > 0 and phase in self.phases
+
+    def _expire(self):
+        """Under self._lock: cancels jobs nobody collected within the TTL."""
+        horizon = time.monotonic() - self.ttl
+        for session_id in list(self._jobs):
+            jobs = self._jobs[session_id]
+            for phase in [p for p, job in jobs.items() if job.created < horizon]:
+                jobs.pop(phase).cancel()
+                self._stats["expired"] += 1
+            if not jobs:
+                del self._jobs[session_id]
+
+    def start(self, session_id: str, phase: str, messages: list, produce) -> bool:
+        """
+        Starts generating `phase`'s opener from `messages` unless the same job already exists.
+        `produce()` returns the chunk iterator (e.g. stream_query_chain(...)). Returns True when a job was started.
+        """
+        if not session_id or not self.enabled(phase):
+            return False
+        key = history_key(messages)
+        with self._lock:
+            self._expire()
+            jobs = self._jobs.setdefault(session_id, {})
+            current = jobs.get(phase)
+            if current is not None and current.key == key and current.error is None:
+                return False
+            if current is not None:
+                current.cancel() # The history moved on
+                self._stats["cancelled"] += 1
+            if self._pool is None:
+                self._pool = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="prefetch")
+            job = jobs[phase] = _Job(phase, key)
+            job.future = self._pool.submit(job.run, produce)
+            self._stats["started"] += 1
+        logger.info(f"Prefetching {phase} opener for {session_id}")
+        return True
+
+    def take(self, session_id: str, phase: str, messages: list):
+        """
+        Hands over the prefetched opener of `phase` for exactly this history as a chunk iterator, or None.
+        Every other pending job of the session is cancelled (the session moved on).
+        """
+        if not session_id:
+            return None
+        key = history_key(messages)
+        with self._lock:
+            jobs = self._jobs.pop(session_id, {})
+            job = jobs.pop(phase, None)
+            for other in jobs.values():
+                other.cancel()
+                self._stats["cancelled"] += 1
+            if job is None:
+                return None
+            # Never started (workers busy): a direct call in the interactive lane beats waiting in the prefetch queue
+            queued = not job.future.running() and not job.future.done() and not job.chunks
+            if job.key != key or job.error is not None or job.future.cancelled() or queued:
+                job.cancel()
+                self._stats["cancelled"] += 1
+                return None
+            self._stats["used"] += 1
+        logger.info(f"Prefetch hit: {phase} opener for {session_id} ({'ready' if job.done else 'in flight'})")
+        return job.follow()
+
+    def cancel(self, session_id: str = None):
+        """Cancels the jobs of one session (or all)."""
+        with self._lock:
+            sessions = [session_id] if session_id else list(self._jobs)
+            for sid in sessions:
+                for job in self._jobs.pop(sid, {}).values():
+                    job.cancel()
+                    self._stats["cancelled"] += 1
+
+    def stats(self) -> dict:
+        """Started / used / cancelled / expired counters and jobs waiting to be collected."""
+        with self._lock:
+            stats = dict(self._stats)
+            stats["pending"] = sum(len(jobs) for jobs in self._jobs.values())
+        stats["hit_rate"] = stats["used"] / stats["started"] if stats["started"] else 0.0
+        return stats
+
+# Shared by every session of the process
+prefetcher = Prefetcher()
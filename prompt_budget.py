@@ -0,0 +1,107 @@
+"""
+Token-budgeted prompt assembly.
+
+The prompt is split into: system instructions (never trimmed), retrieved context, chat history and
+the user question. With a fixed total budget the per-turn prompt size stays flat no matter how long
+a session runs:
+- context gets at most CONTEXT_SHARE of what is left after instructions and question; retrieved documents
+  are rendered as plain text with a compact source tag (no Document repr / metadata),
+- history gets the rest (plus whatever context did not use),
+- history is kept verbatim while it fits; only an over-budget history keeps the most recent
+  RECENT_MESSAGES verbatim, compacts older ones and drops the oldest.
+GRADING is exempt (see engine._assemble_chain): the grader always gets the full transcript.
+"""
+import os
+
+PROMPT_TOKEN_BUDGET = int(os.getenv("PROMPT_TOKEN_BUDGET", "6000")) # Total tokens for one prompt
+CONTEXT_SHARE = float(os.getenv("PROMPT_CONTEXT_SHARE", "0.4")) # Share of the free budget for RAG context
+RECENT_MESSAGES = int(os.getenv("PROMPT_RECENT_MESSAGES", "6")) # Newest messages kept verbatim
+COMPACT_CHARS = int(os.getenv("PROMPT_COMPACT_CHARS", "160")) # Max chars kept from an older message
+MIN_HISTORY_TOKENS = 256 # History floor when the instructions alone eat the budget
+TEMPLATE_OVERHEAD_TOKENS = 200 # Section labels + strict guidelines of the prompt template
+
+def estimate_tokens(text: str) -> int:
+    """Cheap, model-agnostic estimate (~4 characters per token)."""
+    return (len(text) + 3) // 4
+
+def _truncate(text: str, max_tokens: int) -> str:
+    max_chars = max(0, max_tokens * 4)
+    if len(text) <= max_chars:
+        return text
+    return text[:max(0, max_chars - 1)].rstrip() + "…"
+
+def allocate_budget(system_text: str, question: str, budget: int = PROMPT_TOKEN_BUDGET):
+    """Returns (context_tokens, history_tokens) available for this turn."""
+    free = budget - estimate_tokens(system_text) - estimate_tokens(question) - TEMPLATE_OVERHEAD_TOKENS
+    free = max(free, MIN_HISTORY_TOKENS)
+    context_tokens = int(free * CONTEXT_SHARE)
+    return context_tokens, free - context_tokens
+
+def _source_tag(metadata: dict) -> str:
+    """'[sop_uang.pdf p.4]' from chunk metadata (PDF pages are stored 0-based)."""
+    source = os.path.basename(str(metadata.get("source", ""))) or "doc"
+    page = metadata.get("page")
+    return f"[{source} p.{page + 1}]" if isinstance(page, int) else f"[{source}]"
+
+def render_document(doc) -> str:
+    if not hasattr(doc, "page_content"):
+        return str(doc)
+    return f"{_source_tag(doc.metadata or {})} {doc.page_content.strip()}"
+
+def fit_context(context, max_tokens: int):
+    """
+    Trims retrieved context to max_tokens.
+    Returns (context_text, tokens_used); a list of documents keeps whole documents in rank order (the first
+    one is truncated rather than dropped when it alone exceeds the budget).
+    """
+    if isinstance(context, str):
+        text = _truncate(context, max_tokens)
+        return text, estimate_tokens(text)
+
+    blocks, used = [], 0
+    for doc in context:
+        block = render_document(doc)
+        cost = estimate_tokens(block) + 1 # + separator
+        if used + cost > max_tokens:
+            if not blocks and max_tokens > 0:
+                blocks.append(_truncate(block, max_tokens))
+            break
+        blocks.append(block)
+        used += cost
+    text = "\n\n".join(blocks)
+    return text, estimate_tokens(text)
+
+def _history_line(msg: dict, compact: bool) -> str:
+    content = msg["content"]
+    if compact and len(content) > COMPACT_CHARS:
+        content = content[:COMPACT_CHARS].rstrip() + "…"
+    return f"{msg['role'].upper()}: {content}\n"
+
+def fit_history(messages: list, max_tokens: int, recent: int = RECENT_MESSAGES) -> str:
+    """
+    Renders chat history into max_tokens: verbatim when it fits, otherwise newest-first with
+    the last `recent` messages verbatim, older ones compacted, the rest summarized as omitted.
+    """
+    verbatim = [_history_line(msg, compact=False) for msg in messages]
+    if sum(estimate_tokens(line) for line in verbatim) <= max_tokens:
+        return "".join(verbatim)
+
+    lines, used, omitted = [], 0, 0
+    total = len(messages)
+    for idx, msg in enumerate(reversed(messages)):
+        line = _history_line(msg, compact=idx >= recent)
+        cost = estimate_tokens(line)
+        if used + cost > max_tokens and idx < recent:
+            # A long recent message: fall back to its compact form before giving up
+            line = _history_line(msg, compact=True)
+            cost = estimate_tokens(line)
+        if used + cost > max_tokens:
+            omitted = total - idx
+            break
+        lines.append(line)
+        used += cost
+
+    lines.reverse()
+    if omitted:
+        lines.insert(0, f"[{omitted} earlier messages omitted]\n")
+    return "".join(lines)
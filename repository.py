@@ -0,0 +1,677 @@
+"""
+Data Access Layer for GAIA.
+
+- DatabaseBackend: how to open and configure a connection (SQLiteBackend today; a Postgres-compatible
+  backend only needs connect()/prepare() and can sit behind the same Repository).
+- ConnectionPool: bounded pool of long-lived connections. Connections keep their prepared-statement
+  cache, so every constant SQL string below is compiled once per connection, not once per call.
+- Repository: typed query methods. Callers never touch connections or SQL directly.
+"""
+import re
+import json
+import zlib
+import time
+import queue
+import sqlite3
+import logging
+import threading
+from contextlib import contextmanager
+from datetime import date, timedelta
+from typing import Dict, List, Optional, Tuple, TypedDict
+
+logger = logging.getLogger("gaia")
+
+# Typed Records
+class GradeRecord(TypedDict):
+    criteria: str
+    score: int
+    evidence: str
+    feedback: str
+
+class SessionFilter(TypedDict, total=False):
+    name_prefix: str
+    role_id: str
+    readiness: str
+    date_from: date
+    date_to: date
+    score_band: str # Key of SCORE_BANDS
+
+class SessionRecord(TypedDict, total=False):
+    session_id: str
+    trainee_name: str
+    scenario_id: str
+    date: str
+    total_score: int
+    readiness: str
+    chat_log: Optional[str] # Legacy; new sessions store their transcript in `messages`
+    report_path: str
+    report_status: str
+
+class ScenarioConfig(TypedDict):
+    role_name: str
+    topic: str
+    mentor_persona: str
+    simulation_persona_text: str
+    scenario_details_text: str
+    success_criteria: List[Dict[str, str]]
+    doc_sets: List[str] # Knowledge Base document sets to retrieve from (empty = all)
+
+# ---------------------------------------------------------
+# BACKENDS
+# ---------------------------------------------------------
+class DatabaseBackend:
+    """Interface every backend implements."""
+
+    def connect(self):
+        """Returns a new, fully configured DB-API 2.0 connection."""
+        raise NotImplementedError
+
+    def prepare(self, sql: str) -> str:
+        """Adapts repository SQL (qmark '?' placeholders) to the backend's dialect."""
+        return sql
+
+class SQLiteBackend(DatabaseBackend):
+    """SQLite with the same pragmas on every connection."""
+
+    def __init__(self, path: str, busy_timeout_ms: int = 5000, cache_size_kb: int = 20000,
+                 mmap_size: int = 256 * 1024 * 1024, cached_statements: int = 256):
+        self.path = path
+        self.busy_timeout_ms = busy_timeout_ms
+        self.cache_size_kb = cache_size_kb
+        self.mmap_size = mmap_size
+        self.cached_statements = cached_statements
+
+    def connect(self):
+        con = sqlite3.connect(
+            self.path,
+            timeout=self.busy_timeout_ms / 1000,
+            check_same_thread=False, # The pool hands a connection to one thread at a time
+            cached_statements=self.cached_statements
+        )
+        con.execute("PRAGMA journal_mode=WAL;")
+        con.execute("PRAGMA synchronous=NORMAL;")
+        con.execute(f"PRAGMA busy_timeout={int(self.busy_timeout_ms)};")
+        con.execute(f"PRAGMA cache_size=-{int(self.cache_size_kb)};") # Negative = KiB
+        con.execute(f"PRAGMA mmap_size={int(self.mmap_size)};")
+        return con
+
+class PostgresBackend(DatabaseBackend):
+    """
+    Postgres-compatible backend (psycopg 3). Not used by default; selected with DB_BACKEND=postgres.
+    The schema steps in migrations.py are SQLite flavoured and have to be provisioned separately.
+    """
+
+    def __init__(self, dsn: str):
+        self.dsn = dsn
+
+    def connect(self):
+        import psycopg
+        return psycopg.connect(self.dsn)
+
+    def prepare(self, sql: str) -> str:
+        return sql.replace("?", "%s")
+
+# ---------------------------------------------------------
+# POOL
+# ---------------------------------------------------------
+class ConnectionPool:
+    """Bounded pool: at most `size` connections, created lazily, reused LIFO (warm caches first)."""
+
+    def __init__(self, backend: DatabaseBackend, size: int = 5, acquire_timeout: float = 30):
+        self.backend = backend
+        self.size = size
+        self.acquire_timeout = acquire_timeout
+        self._idle = queue.LifoQueue()
+        self._created = 0
+        self._lock = threading.Lock()
+
+    def _acquire(self):
+        try:
+            return self._idle.get_nowait()
+        except queue.Empty:
+            pass
+        with self._lock:
+            if self._created < self.size:
+                self._created += 1
+                try:
+                    return self.backend.connect()
+                except Exception:
+                    self._created -= 1
+                    raise
+        try:
+            return self._idle.get(timeout=self.acquire_timeout)
+        except queue.Empty:
+            raise TimeoutError(f"No database connection available within {self.acquire_timeout}s (pool size {self.size})")
+
+    def _release(self, con, broken: bool = False):
+        if broken:
+            with self._lock:
+                self._created -= 1
+            try:
+                con.close()
+            except Exception:
+                pass
+            return
+        self._idle.put(con)
+
+    @contextmanager
+    def connection(self):
+        """Borrows a connection; uncommitted work is rolled back on error."""
+        con = self._acquire()
+        try:
+            yield con
+        except Exception:
+            try:
+                con.rollback()
+            except Exception:
+                self._release(con, broken=True)
+                raise
+            self._release(con)
+            raise
+        else:
+            if getattr(con, "in_transaction", False):
+                con.rollback() # Never hand out a connection with someone else's open transaction
+            self._release(con)
+
+    @contextmanager
+    def transaction(self):
+        """Borrows a connection and commits on success / rolls back on error."""
+        with self.connection() as con:
+            yield con
+            con.commit()
+
+    def close_all(self):
+        while True:
+            try:
+                con = self._idle.get_nowait()
+            except queue.Empty:
+                break
+            con.close()
+            with self._lock:
+                self._created -= 1
+
+# ---------------------------------------------------------
+# REPOSITORY
+# ---------------------------------------------------------
+SQL_SCENARIOS_ALL = "SELECT scenario_id, topic, mentor_persona, simulation_persona, scenario_details FROM scenarios"
+SQL_RUBRICS_ALL = "SELECT scenario_id, criteria, description FROM grading_rubrics ORDER BY rubric_id"
+SQL_SCENARIO_DOCUMENTS_ALL = "SELECT scenario_id, doc_set FROM scenario_documents ORDER BY doc_set"
+SQL_CONFIG_VERSION = "SELECT version FROM config_version WHERE id = 1"
+SQL_SCENARIO_REVISIONS = "SELECT scenario_id, revision FROM scenario_revisions"
+SQL_COUNT_ROLES = "SELECT count(*) FROM roles"
+SQL_COUNT_SESSIONS = "SELECT count(*) FROM sessions"
+SQL_INSERT_SESSION = '''INSERT INTO sessions
+    (session_id, trainee_name, scenario_id, date, total_score, readiness, chat_log, report_path, report_status)
+    VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)'''
+SQL_INSERT_GRADE = '''INSERT INTO session_grades
+    (session_id, criteria, score, evidence, feedback)
+    VALUES (?, ?, ?, ?, ?)'''
+SQL_SESSION_HEADERS = '''
+    SELECT
+        s.session_id,
+        s.trainee_name,
+        sc.topic as Role,
+        s.date,
+        s.total_score as Score,
+        s.readiness,
+        sc.role_id,
+        s.report_path,
+        s.report_status
+    FROM sessions s
+    JOIN scenarios sc ON s.scenario_id = sc.scenario_id
+'''
+SQL_LIST_SESSIONS = SQL_SESSION_HEADERS + "ORDER BY s.date DESC"
+SQL_ROLE_IDS = "SELECT DISTINCT role_id FROM scenarios ORDER BY role_id"
+SQL_READINESS_LABELS = "SELECT DISTINCT readiness FROM sessions WHERE readiness IS NOT NULL ORDER BY readiness"
+SQL_COUNT_SESSION_HEADERS = "SELECT count(*) FROM sessions s JOIN scenarios sc ON s.scenario_id = sc.scenario_id"
+SQL_SESSION_GRADES = "SELECT * FROM session_grades WHERE session_id = ?"
+SQL_SESSION_BY_ID = "SELECT * FROM sessions WHERE session_id = ?"
+SQL_SESSION_EXISTS = "SELECT 1 FROM sessions WHERE session_id = ?"
+SQL_ENQUEUE_REPORT = "INSERT INTO report_jobs (session_id, status, attempts, created_at, updated_at) VALUES (?, 'pending', 0, ?, ?)"
+SQL_SET_REPORT_STATUS = "UPDATE sessions SET report_status = ? WHERE session_id = ?"
+SQL_SET_REPORT_READY = "UPDATE sessions SET report_status = 'ready', report_path = ? WHERE session_id = ?"
+SQL_NEXT_PENDING_JOB = "SELECT job_id, session_id, attempts FROM report_jobs WHERE status = 'pending' ORDER BY job_id LIMIT 1"
+SQL_CLAIM_JOB = "UPDATE report_jobs SET status = 'running', attempts = attempts + 1, updated_at = ? WHERE job_id = ? AND status = 'pending'"
+SQL_FINISH_JOB = "UPDATE report_jobs SET status = ?, error = ?, updated_at = ? WHERE job_id = ?"
+SQL_REQUEUE_STALE_JOBS = "UPDATE report_jobs SET status = 'pending', updated_at = ? WHERE status = 'running' AND updated_at < ?"
+SQL_JOB_COUNTS = "SELECT status, count(*) FROM report_jobs GROUP BY status"
+
+# KPI Rollups: maintained incrementally by save_session (same transaction), rebuilt by rebuild_kpis()
+PASS_SCORE = 80 # total_score >= PASS_SCORE counts as passed
+
+SQL_KPI_UPSERT_DAILY = '''INSERT INTO kpi_daily (day, sessions, score_sum, pass_count) VALUES (?, 1, ?, ?)
+    ON CONFLICT(day) DO UPDATE SET sessions = sessions + 1, score_sum = score_sum + excluded.score_sum, pass_count = pass_count + excluded.pass_count'''
+SQL_KPI_UPSERT_ROLE = '''INSERT INTO kpi_role (role_id, sessions, score_sum, pass_count) SELECT role_id, 1, ?, ? FROM scenarios WHERE scenario_id = ?
+    ON CONFLICT(role_id) DO UPDATE SET sessions = sessions + 1, score_sum = score_sum + excluded.score_sum, pass_count = pass_count + excluded.pass_count'''
+SQL_KPI_UPSERT_SCENARIO = '''INSERT INTO kpi_scenario (scenario_id, sessions, score_sum, pass_count) VALUES (?, 1, ?, ?)
+    ON CONFLICT(scenario_id) DO UPDATE SET sessions = sessions + 1, score_sum = score_sum + excluded.score_sum, pass_count = pass_count + excluded.pass_count'''
+SQL_KPI_UPSERT_CRITERIA = '''INSERT INTO kpi_criteria (scenario_id, criteria, graded, score_sum) VALUES (?, ?, 1, ?)
+    ON CONFLICT(scenario_id, criteria) DO UPDATE SET graded = graded + 1, score_sum = score_sum + excluded.score_sum'''
+SQL_KPI_UPSERT_SCORE = '''INSERT INTO kpi_scores (score, sessions) VALUES (?, 1)
+    ON CONFLICT(score) DO UPDATE SET sessions = sessions + 1'''
+
+_PASSED = f"CASE WHEN s.total_score >= {PASS_SCORE} THEN 1 ELSE 0 END"
+SQL_KPI_REBUILD = [
+    "DELETE FROM kpi_daily",
+    "DELETE FROM kpi_role",
+    "DELETE FROM kpi_scenario",
+    "DELETE FROM kpi_criteria",
+    "DELETE FROM kpi_scores",
+    f'''INSERT INTO kpi_daily (day, sessions, score_sum, pass_count)
+        SELECT substr(s.date, 1, 10), count(*), SUM(s.total_score), SUM({_PASSED}) FROM sessions s GROUP BY substr(s.date, 1, 10)''',
+    f'''INSERT INTO kpi_role (role_id, sessions, score_sum, pass_count)
+        SELECT sc.role_id, count(*), SUM(s.total_score), SUM({_PASSED})
+        FROM sessions s JOIN scenarios sc ON s.scenario_id = sc.scenario_id GROUP BY sc.role_id''',
+    f'''INSERT INTO kpi_scenario (scenario_id, sessions, score_sum, pass_count)
+        SELECT s.scenario_id, count(*), SUM(s.total_score), SUM({_PASSED}) FROM sessions s GROUP BY s.scenario_id''',
+    '''INSERT INTO kpi_criteria (scenario_id, criteria, graded, score_sum)
+        SELECT s.scenario_id, g.criteria, count(*), SUM(g.score)
+        FROM session_grades g JOIN sessions s ON g.session_id = s.session_id GROUP BY s.scenario_id, g.criteria''',
+    '''INSERT INTO kpi_scores (score, sessions)
+        SELECT CAST(ROUND(s.total_score) AS INTEGER), count(*) FROM sessions s GROUP BY CAST(ROUND(s.total_score) AS INTEGER)''',
+]
+SQL_KPI_ROLES = "SELECT role_id, sessions, score_sum, pass_count FROM kpi_role ORDER BY sessions DESC"
+SQL_KPI_SCENARIOS = "SELECT scenario_id, sessions, score_sum, pass_count FROM kpi_scenario ORDER BY scenario_id"
+SQL_KPI_CRITERIA = "SELECT scenario_id, criteria, graded, score_sum FROM kpi_criteria ORDER BY scenario_id, criteria"
+SQL_KPI_SCORES = "SELECT score, sessions FROM kpi_scores ORDER BY score"
+SQL_KPI_POPULATED = "SELECT 1 FROM kpi_scores LIMIT 1"
+SQL_KPI_SESSIONS_SINCE = "SELECT COALESCE(SUM(sessions), 0) FROM kpi_daily WHERE day >= ?"
+
+# Message Store: one row per chat turn, appended as the conversation happens
+MESSAGE_COMPRESS_MIN_BYTES = 2048 # Bodies at least this large are stored zlib-compressed (content_z)
+
+SQL_APPEND_MESSAGE = '''INSERT INTO messages (session_id, seq, phase, role, content, content_z, meta, created_at)
+    SELECT ?, COALESCE(MAX(seq), 0) + 1, ?, ?, ?, ?, ?, ? FROM messages WHERE session_id = ?'''
+SQL_LAST_SEQ = "SELECT MAX(seq) FROM messages WHERE session_id = ?"
+# Search index: plain-text turns are indexed by triggers once the session header exists (migration 9);
+# compressed turns (text only in content_z) cannot be decompressed in SQL and are indexed here
+SQL_INDEX_MESSAGE = "INSERT INTO transcripts_fts (session_id, seq, transcript) VALUES (?, ?, ?)"
+SQL_COMPRESSED_MESSAGES = "SELECT seq, content_z FROM messages WHERE session_id = ? AND content IS NULL AND content_z IS NOT NULL"
+SQL_MESSAGES_PAGE = '''SELECT seq, phase, role, content, content_z, meta, created_at FROM messages
+    WHERE session_id = ? AND seq > ? ORDER BY seq LIMIT ?'''
+
+def pack_message(content: str, min_bytes: int = MESSAGE_COMPRESS_MIN_BYTES):
+    """(content, content_z): large bodies go compressed into content_z, when that actually saves space."""
+    raw = content.encode("utf-8")
+    if min_bytes and len(raw) >= min_bytes:
+        packed = zlib.compress(raw, 6)
+        if len(packed) < len(raw):
+            return None, packed
+    return content, None
+
+def unpack_message(content: Optional[str], content_z: Optional[bytes]) -> str:
+    if content_z is not None:
+        return zlib.decompress(content_z).decode("utf-8")
+    return content or ""
+
+# Full-text search over chat messages and grading evidence/feedback; rank = bm25 (lower is better)
+SQL_SEARCH = '''
+    SELECT hits.session_id, s.trainee_name, s.date, sc.topic, hits.source, hits.criteria, hits.snippet, hits.rank
+    FROM (
+        SELECT session_id, 'transcript' AS source, NULL AS criteria,
+               snippet(transcripts_fts, 2, ?, ?, '…', 12) AS snippet, bm25(transcripts_fts) AS rank
+        FROM transcripts_fts WHERE transcripts_fts MATCH ?
+        UNION ALL
+        SELECT g.session_id, 'grade' AS source, g.criteria,
+               snippet(grades_fts, -1, ?, ?, '…', 12) AS snippet, bm25(grades_fts) AS rank
+        FROM grades_fts JOIN session_grades g ON g.grade_id = grades_fts.rowid
+        WHERE grades_fts MATCH ?
+    ) hits
+    JOIN sessions s ON s.session_id = hits.session_id
+    JOIN scenarios sc ON s.scenario_id = sc.scenario_id
+    ORDER BY hits.rank
+    LIMIT ?
+'''
+
+def fts_query(text: str) -> str:
+    """
+    Turns free user input into a safe FTS5 expression: every word is quoted (no syntax errors from
+    quotes/operators) and all words must match; a trailing * keeps prefix search ("blok*").
+    """
+    terms = []
+    for word, star in re.findall(r"(\w+)(\*?)", text or ""):
+        terms.append(f'"{word}"{star}')
+    return " ".join(terms)
+
+# Score bands for dashboard filters: (min inclusive, max exclusive)
+SCORE_BANDS = {
+    "<60": (None, 60),
+    "60-79": (60, 80),
+    ">=80": (80, None),
+}
+
+def _session_filter(filters: SessionFilter):
+    """Builds the WHERE clause + params for a SessionFilter (every condition is index/SQL friendly)."""
+    clauses, params = [], []
+    prefix = (filters.get("name_prefix") or "").strip().lower()
+    if prefix:
+        # Range on lower(name) instead of LIKE '%..%': can use idx_sessions_trainee_lower
+        clauses.append("lower(s.trainee_name) >= ? AND lower(s.trainee_name) < ?")
+        params += [prefix, prefix[:-1] + chr(ord(prefix[-1]) + 1)]
+    if filters.get("role_id"):
+        clauses.append("sc.role_id = ?")
+        params.append(filters["role_id"])
+    if filters.get("readiness"):
+        clauses.append("s.readiness = ?")
+        params.append(filters["readiness"])
+    if filters.get("date_from"):
+        clauses.append("s.date >= ?")
+        params.append(filters["date_from"].isoformat())
+    if filters.get("date_to"):
+        clauses.append("s.date < ?") # Inclusive day: everything before the next midnight
+        params.append((filters["date_to"] + timedelta(days=1)).isoformat())
+    if filters.get("score_band"):
+        low, high = SCORE_BANDS[filters["score_band"]]
+        if low is not None:
+            clauses.append("s.total_score >= ?")
+            params.append(low)
+        if high is not None:
+            clauses.append("s.total_score < ?")
+            params.append(high)
+    return clauses, params
+
+def page_query(filters: SessionFilter, limit: int, after: Optional[Tuple[str, str]] = None):
+    """SQL + params for one newest-first page of session headers after the (date, session_id) cursor."""
+    clauses, params = _session_filter(filters)
+    if after is not None:
+        # Keyset on (date, session_id): a range seek on the listing index, unlike OFFSET it does not grow with the page number
+        clauses.append("(s.date, s.session_id) < (?, ?)")
+        params += [after[0], after[1]]
+    where = f"WHERE {' AND '.join(clauses)} " if clauses else ""
+    return f"{SQL_SESSION_HEADERS}{where}ORDER BY s.date DESC, s.session_id DESC LIMIT ?", (*params, limit)
+
+class Repository:
+    """Typed query methods over a ConnectionPool."""
+
+    def __init__(self, pool: ConnectionPool, compress_min_bytes: int = MESSAGE_COMPRESS_MIN_BYTES):
+        self.pool = pool
+        self.sql = pool.backend.prepare
+        self.compress_min_bytes = compress_min_bytes
+        self.full_text = isinstance(pool.backend, SQLiteBackend) # FTS5 tables exist only on SQLite
+
+    # --- helpers ---
+    @staticmethod
+    def _dicts(cursor) -> List[dict]:
+        columns = [d[0] for d in cursor.description]
+        return [dict(zip(columns, row)) for row in cursor.fetchall()]
+
+    def query(self, sql: str, params=()) -> List[dict]:
+        with self.pool.connection() as con:
+            return self._dicts(con.execute(self.sql(sql), params))
+
+    def scalar(self, sql: str, params=()):
+        with self.pool.connection() as con:
+            row = con.execute(self.sql(sql), params).fetchone()
+            return row[0] if row else None
+
+    # --- scenarios ---
+    def load_scenarios(self, scenario_ids: Optional[List[str]] = None) -> Dict[str, ScenarioConfig]:
+        """Bulk loads {scenario_id: config} for all (or the given) scenarios with three queries."""
+        with self.pool.connection() as con:
+            if scenario_ids is None:
+                scenario_rows = self._dicts(con.execute(self.sql(SQL_SCENARIOS_ALL)))
+                rubric_rows = self._dicts(con.execute(self.sql(SQL_RUBRICS_ALL)))
+                document_rows = con.execute(self.sql(SQL_SCENARIO_DOCUMENTS_ALL)).fetchall()
+            else:
+                marks = ",".join("?" * len(scenario_ids))
+                scenario_rows = self._dicts(con.execute(
+                    self.sql(f"{SQL_SCENARIOS_ALL} WHERE scenario_id IN ({marks})"), list(scenario_ids)))
+                rubric_rows = self._dicts(con.execute(
+                    self.sql(f"SELECT scenario_id, criteria, description FROM grading_rubrics WHERE scenario_id IN ({marks}) ORDER BY rubric_id"),
+                    list(scenario_ids)))
+                document_rows = con.execute(
+                    self.sql(f"SELECT scenario_id, doc_set FROM scenario_documents WHERE scenario_id IN ({marks}) ORDER BY doc_set"),
+                    list(scenario_ids)).fetchall()
+
+        rubrics = {}
+        for r in rubric_rows:
+            rubrics.setdefault(r["scenario_id"], []).append({"criteria": r["criteria"], "description": r["description"]})
+        doc_sets = {}
+        for scenario_id, doc_set in document_rows:
+            doc_sets.setdefault(scenario_id, []).append(doc_set)
+
+        return {
+            row["scenario_id"]: {
+                "role_name": row["scenario_id"],
+                "topic": row["topic"],
+                "mentor_persona": row["mentor_persona"],
+                "simulation_persona_text": row["simulation_persona"],
+                "scenario_details_text": row["scenario_details"],
+                "success_criteria": rubrics.get(row["scenario_id"], []),
+                "doc_sets": doc_sets.get(row["scenario_id"], [])
+            }
+            for row in scenario_rows
+        }
+
+    def get_config_version(self) -> Optional[int]:
+        """Scenario/rubric change counter, None when change tracking is not installed."""
+        try:
+            return self.scalar(SQL_CONFIG_VERSION)
+        except Exception: # Missing table (sqlite3.OperationalError / backend equivalent)
+            return None
+
+    def get_scenario_revisions(self) -> Dict[str, int]:
+        with self.pool.connection() as con:
+            return dict(con.execute(self.sql(SQL_SCENARIO_REVISIONS)).fetchall())
+
+    def count_roles(self) -> int:
+        return self.scalar(SQL_COUNT_ROLES)
+
+    def count_sessions(self) -> int:
+        return self.scalar(SQL_COUNT_SESSIONS)
+
+    # --- sessions ---
+    def save_session(self, session: SessionRecord, grades: List[GradeRecord], queue_report: bool = False):
+        """
+        Transactional Save: the Session Header AND the Detailed Grades, or nothing.
+        queue_report=True also enqueues a report job (report_status 'pending') in the same transaction.
+        """
+        if queue_report:
+            report_status = "pending"
+        else:
+            report_status = session.get('report_status') or ("ready" if session.get('report_path') else None)
+
+        with self.pool.transaction() as con:
+            con.execute(self.sql(SQL_INSERT_SESSION), (
+                session['session_id'],
+                session['trainee_name'],
+                session['scenario_id'],
+                session['date'],
+                session['total_score'],
+                session['readiness'],
+                session.get('chat_log'), # Legacy blob; transcripts now live in the messages table
+                session.get('report_path', ''),
+                report_status
+            ))
+            con.executemany(self.sql(SQL_INSERT_GRADE), [
+                (session['session_id'], g['criteria'], g['score'], g['evidence'], g['feedback'])
+                for g in grades
+            ])
+            self._bump_kpis(con, session, grades)
+            if self.full_text:
+                con.executemany(self.sql(SQL_INDEX_MESSAGE), [
+                    (session['session_id'], seq, unpack_message(None, blob))
+                    for seq, blob in con.execute(self.sql(SQL_COMPRESSED_MESSAGES), (session['session_id'],)).fetchall()
+                ])
+            if queue_report:
+                now = time.time()
+                con.execute(self.sql(SQL_ENQUEUE_REPORT), (session['session_id'], now, now))
+
+    # --- messages ---
+    def append_message(self, session_id: str, phase: Optional[str], role: str, content: str,
+                       meta: Optional[dict] = None) -> int:
+        """
+        Appends one chat turn (next seq for the session), in one transaction.
+        Called on every turn, so a crash or refresh loses nothing. Returns the message seq.
+        Turns become searchable when the session is saved (see SQL_INDEX_MESSAGE).
+        """
+        text, packed = pack_message(content, self.compress_min_bytes)
+        with self.pool.transaction() as con:
+            con.execute(self.sql(SQL_APPEND_MESSAGE), (
+                session_id, phase, role, text, packed,
+                json.dumps(meta, ensure_ascii=False) if meta is not None else None,
+                time.time(), session_id
+            ))
+            seq = con.execute(self.sql(SQL_LAST_SEQ), (session_id,)).fetchone()[0]
+            if self.full_text and packed is not None and con.execute(self.sql(SQL_SESSION_EXISTS), (session_id,)).fetchone():
+                con.execute(self.sql(SQL_INDEX_MESSAGE), (session_id, seq, content)) # Late turn of a saved session
+        return seq
+
+    def iter_messages(self, session_id: str, phases: Optional[List[str]] = None, batch: int = 200):
+        """
+        Streams a transcript in seq order, `batch` rows per query (no connection held between batches).
+        Yields {'seq', 'phase', 'role', 'content', 'meta', 'created_at'}; `phases` filters by phase.
+        """
+        last = 0
+        while True:
+            with self.pool.connection() as con:
+                rows = con.execute(self.sql(SQL_MESSAGES_PAGE), (session_id, last, batch)).fetchall()
+            for seq, phase, role, content, content_z, meta, created_at in rows:
+                last = seq
+                if phases is not None and phase not in phases:
+                    continue
+                yield {
+                    "seq": seq,
+                    "phase": phase,
+                    "role": role,
+                    "content": unpack_message(content, content_z),
+                    "meta": json.loads(meta) if meta else None,
+                    "created_at": created_at,
+                }
+            if len(rows) < batch:
+                return
+
+    def session_exists(self, session_id: str) -> bool:
+        return self.scalar(SQL_SESSION_EXISTS, (session_id,)) is not None
+
+    # --- KPI rollups ---
+    def _bump_kpis(self, con, session: SessionRecord, grades: List[GradeRecord]):
+        score = session['total_score']
+        passed = 1 if score >= PASS_SCORE else 0
+        con.execute(self.sql(SQL_KPI_UPSERT_DAILY), (str(session['date'])[:10], score, passed))
+        con.execute(self.sql(SQL_KPI_UPSERT_ROLE), (score, passed, session['scenario_id']))
+        con.execute(self.sql(SQL_KPI_UPSERT_SCENARIO), (session['scenario_id'], score, passed))
+        con.execute(self.sql(SQL_KPI_UPSERT_SCORE), (int(round(score)),))
+        con.executemany(self.sql(SQL_KPI_UPSERT_CRITERIA), [
+            (session['scenario_id'], g['criteria'], g['score']) for g in grades
+        ])
+
+    def rebuild_kpis(self):
+        """Recomputes every kpi_* rollup from sessions/session_grades (backfills, seeding, repairs)."""
+        with self.pool.transaction() as con:
+            for sql in SQL_KPI_REBUILD:
+                con.execute(self.sql(sql))
+
+    def kpis_populated(self) -> bool:
+        return self.scalar(SQL_KPI_POPULATED) is not None
+
+    def get_kpis(self, since_day: str) -> dict:
+        """Raw rollup rows for the KPI cards: roles, scenarios, criteria, {score: sessions} and sessions since since_day."""
+        with self.pool.connection() as con:
+            return {
+                "roles": self._dicts(con.execute(self.sql(SQL_KPI_ROLES))),
+                "scenarios": self._dicts(con.execute(self.sql(SQL_KPI_SCENARIOS))),
+                "criteria": self._dicts(con.execute(self.sql(SQL_KPI_CRITERIA))),
+                "scores": dict(con.execute(self.sql(SQL_KPI_SCORES)).fetchall()),
+                "recent_sessions": con.execute(self.sql(SQL_KPI_SESSIONS_SINCE), (since_day,)).fetchone()[0],
+            }
+
+    def get_session(self, session_id: str) -> Optional[dict]:
+        rows = self.query(SQL_SESSION_BY_ID, (session_id,))
+        return rows[0] if rows else None
+
+    def list_sessions(self) -> List[dict]:
+        """All session headers joined with their scenario topic (newest first)."""
+        return self.query(SQL_LIST_SESSIONS)
+
+    def page_sessions(self, filters: Optional[SessionFilter] = None, limit: int = 50,
+                      after: Optional[Tuple[str, str]] = None) -> Tuple[List[dict], Optional[Tuple[str, str]]]:
+        """
+        One page of session headers (newest first) matching filters, using keyset pagination.
+        `after` is the cursor returned with the previous page; returns (rows, next_cursor or None).
+        """
+        rows = self.query(*page_query(filters or {}, limit + 1, after))
+        if len(rows) > limit:
+            rows = rows[:limit]
+            return rows, (rows[-1]["date"], rows[-1]["session_id"])
+        return rows, None
+
+    def count_filtered_sessions(self, filters: Optional[SessionFilter] = None) -> int:
+        clauses, params = _session_filter(filters or {})
+        where = f" WHERE {' AND '.join(clauses)}" if clauses else ""
+        return self.scalar(SQL_COUNT_SESSION_HEADERS + where, params)
+
+    def iter_sessions(self, filters: Optional[SessionFilter] = None, page_size: int = 1000):
+        """Yields every matching session header page by page (exports) without one giant fetch."""
+        cursor = None
+        while True:
+            rows, cursor = self.page_sessions(filters, limit=page_size, after=cursor)
+            yield from rows
+            if cursor is None:
+                return
+
+    def search(self, text: str, limit: int = 20, highlight: Tuple[str, str] = ("**", "**")) -> List[dict]:
+        """
+        Ranked full-text hits across transcripts and grading evidence/feedback (SQLite FTS5).
+        Each hit: session_id, trainee_name, date, topic, source ('transcript' | 'grade'), criteria, snippet, rank.
+        """
+        match = fts_query(text)
+        if not match:
+            return []
+        start, end = highlight
+        return self.query(SQL_SEARCH, (start, end, match, start, end, match, limit))
+
+    def list_roles(self) -> List[str]:
+        return [r["role_id"] for r in self.query(SQL_ROLE_IDS)]
+
+    def list_readiness(self) -> List[str]:
+        return [r["readiness"] for r in self.query(SQL_READINESS_LABELS)]
+
+    def get_session_grades(self, session_id: str) -> List[dict]:
+        return self.query(SQL_SESSION_GRADES, (session_id,))
+
+    # --- report jobs ---
+    def enqueue_report_job(self, session_id: str):
+        """(Re)queues report generation for an already saved session."""
+        now = time.time()
+        with self.pool.transaction() as con:
+            con.execute(self.sql(SQL_ENQUEUE_REPORT), (session_id, now, now))
+            con.execute(self.sql(SQL_SET_REPORT_STATUS), ("pending", session_id))
+
+    def claim_report_job(self) -> Optional[dict]:
+        """
+        Atomically moves the oldest pending job to 'running' and returns it (None when idle).
+        Safe with several workers/processes: the conditional UPDATE only succeeds for one of them.
+        """
+        while True:
+            with self.pool.transaction() as con:
+                row = con.execute(self.sql(SQL_NEXT_PENDING_JOB)).fetchone()
+                if row is None:
+                    return None
+                job_id, session_id, attempts = row
+                claimed = con.execute(self.sql(SQL_CLAIM_JOB), (time.time(), job_id)).rowcount
+                if claimed:
+                    con.execute(self.sql(SQL_SET_REPORT_STATUS), ("running", session_id))
+                    return {"job_id": job_id, "session_id": session_id, "attempts": attempts + 1}
+
+    def complete_report_job(self, job_id: int, session_id: str, report_path: str):
+        with self.pool.transaction() as con:
+            con.execute(self.sql(SQL_FINISH_JOB), ("done", None, time.time(), job_id))
+            con.execute(self.sql(SQL_SET_REPORT_READY), (report_path, session_id))
+
+    def fail_report_job(self, job_id: int, session_id: str, error: str, retry: bool):
+        """Marks a job failed, or puts it back to 'pending' when another attempt is allowed."""
+        status = "pending" if retry else "failed"
+        with self.pool.transaction() as con:
+            con.execute(self.sql(SQL_FINISH_JOB), (status, error, time.time(), job_id))
+            con.execute(self.sql(SQL_SET_REPORT_STATUS), (status, session_id))
+
+    def requeue_stale_report_jobs(self, older_than_seconds: float) -> int:
+        """Jobs left 'running' by a crashed worker go back to 'pending'."""
+        now = time.time()
+        with self.pool.transaction() as con:
+            return con.execute(self.sql(SQL_REQUEUE_STALE_JOBS), (now, now - older_than_seconds)).rowcount
+
+    def report_job_counts(self) -> Dict[str, int]:
+        with self.pool.connection() as con:
+            return dict(con.execute(self.sql(SQL_JOB_COUNTS)).fetchall())
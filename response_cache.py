@@ -0,0 +1,193 @@
+"""
+Exact-match LLM response cache.
+
+CachedLLM wraps the LLM inside the compiled chat chain (`prompt | CachedLLM(llm) | parser`). Answers are
+keyed by sha256 of (backend/model identity incl. sampling params, fully rendered prompt), so a hit only
+happens for byte-identical prompts: scenario openers with an empty history, or GRADING re-run on an
+unchanged transcript.
+- Store: local SQLite file, evicted by total size (least recently used first); entries expire after a TTL.
+- Only phases listed in `phases` are cached; the phase comes from the chain config (`metadata.llm_phase`).
+"""
+import json
+import time
+import hashlib
+import logging
+import sqlite3
+import threading
+from langchain_core.runnables import Runnable
+
+logger = logging.getLogger("gaia")
+
+SAMPLING_PARAMS = ("temperature", "top_p", "top_k", "max_tokens", "max_output_tokens", "num_predict", "seed")
+
+def llm_identity(llm):
+    """Backend, model and sampling parameters of an LLM (RoutedLLM or a plain LangChain client)."""
+    if hasattr(llm, "cache_identity"):
+        return llm.cache_identity()
+    params = {name: getattr(llm, name) for name in SAMPLING_PARAMS if getattr(llm, name, None) is not None}
+    return [type(llm).__name__, getattr(llm, "model", None) or getattr(llm, "model_name", None), params]
+
+def _text(value) -> str:
+    if isinstance(value, str):
+        return value
+    content = getattr(value, "content", "")
+    return content if isinstance(content, str) else str(content)
+
+class ResponseCache:
+    """Size-bounded SQLite store of LLM answers with TTL and per-phase hit/miss counters."""
+
+    def __init__(self, path: str, ttl: float = 7 * 24 * 3600, max_bytes: int = 256 * 1024 * 1024, phases=()):
+        self.path = path
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self.phases = set(phases)
+        self._lock = threading.Lock()
+        self._stats = {}
+
+        self._con = sqlite3.connect(path, timeout=30, check_same_thread=False)
+        self._con.execute("PRAGMA journal_mode=WAL;")
+        self._con.execute("PRAGMA synchronous=NORMAL;")
+        self._con.execute('''CREATE TABLE IF NOT EXISTS responses (
+            key TEXT PRIMARY KEY,
+            phase TEXT,
+            response TEXT,
+            bytes INTEGER,
+            created_at REAL,
+            last_used REAL,
+            hits INTEGER DEFAULT 0
+        )''')
+        self._con.execute("CREATE INDEX IF NOT EXISTS idx_responses_last_used ON responses(last_used)")
+        self._con.commit()
+        self._disk_bytes = self._con.execute("SELECT COALESCE(SUM(bytes), 0) FROM responses").fetchone()[0]
+
+    def enabled(self, phase: str) -> bool:
+        return phase in self.phases
+
+    @staticmethod
+    def key(identity, prompt: str) -> str:
+        payload = json.dumps([identity, prompt], sort_keys=True, ensure_ascii=False, default=str)
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    def _count(self, phase: str, outcome: str):
+        counters = self._stats.setdefault(phase, {"hits": 0, "misses": 0})
+        counters[outcome] += 1
+
+    def get(self, key: str, phase: str):
+        """Cached answer or None (missing / expired). Counts the hit or miss."""
+        now = time.time()
+        with self._lock:
+            row = self._con.execute("SELECT response FROM responses WHERE key = ? AND created_at >= ?",
+                                    (key, now - self.ttl)).fetchone()
+            if row is None:
+                self._count(phase, "misses")
+                return None
+            self._con.execute("UPDATE responses SET last_used = ?, hits = hits + 1 WHERE key = ?", (now, key))
+            self._con.commit()
+            self._count(phase, "hits")
+            return row[0]
+
+    def put(self, key: str, phase: str, response: str):
+        if not response:
+            return
+        now = time.time()
+        size = len(response.encode("utf-8"))
+        with self._lock:
+            old = self._con.execute("SELECT bytes FROM responses WHERE key = ?", (key,)).fetchone()
+            self._con.execute("INSERT OR REPLACE INTO responses (key, phase, response, bytes, created_at, last_used) VALUES (?, ?, ?, ?, ?, ?)",
+                              (key, phase, response, size, now, now))
+            self._con.commit()
+            self._disk_bytes += size - (old[0] if old else 0)
+            if self._disk_bytes > self.max_bytes:
+                self._evict()
+
+    def _evict(self):
+        """Drops expired answers, then least recently used ones until the store is under 90% of max_bytes."""
+        horizon = time.time() - self.ttl
+        expired = self._con.execute("SELECT COALESCE(SUM(bytes), 0), COUNT(*) FROM responses WHERE created_at < ?", (horizon,)).fetchone()
+        self._con.execute("DELETE FROM responses WHERE created_at < ?", (horizon,))
+        self._disk_bytes -= expired[0]
+
+        target = int(self.max_bytes * 0.9)
+        cursor = self._con.execute("SELECT rowid, bytes FROM responses ORDER BY last_used ASC")
+        doomed, freed = [], 0
+        for rowid, size in cursor:
+            if self._disk_bytes - freed <= target:
+                break
+            doomed.append((rowid,))
+            freed += size
+        self._con.executemany("DELETE FROM responses WHERE rowid = ?", doomed)
+        self._con.commit()
+        self._disk_bytes -= freed
+        logger.info(f"Response cache: dropped {expired[1]} expired and evicted {len(doomed)} answers ({freed} bytes)")
+
+    def stats(self) -> dict:
+        """Hit/miss counters per phase since process start plus the current store size."""
+        with self._lock:
+            phases = {phase: dict(counters) for phase, counters in self._stats.items()}
+            disk_bytes = self._disk_bytes
+        hits = sum(c["hits"] for c in phases.values())
+        lookups = hits + sum(c["misses"] for c in phases.values())
+        return {"hits": hits, "misses": lookups - hits, "hit_rate": hits / lookups if lookups else 0.0,
+                "phases": phases, "disk_bytes": disk_bytes}
+
+class CachedLLM(Runnable):
+    """
+    Drop-in LLM Runnable answering byte-identical prompts from the ResponseCache.
+    Streams are stored once complete; a hit is returned as a single chunk.
+    """
+
+    def __init__(self, llm, cache: ResponseCache):
+        self.llm = llm
+        self.cache = cache
+        self.identity = llm_identity(llm)
+
+    def _lookup(self, input, config):
+        """(key, phase, cached answer); key is None when the phase is not cached."""
+        phase = ((config or {}).get("metadata") or {}).get("llm_phase")
+        if not self.cache.enabled(phase):
+            return None, phase, None
+        prompt = input.to_string() if hasattr(input, "to_string") else str(input)
+        key = self.cache.key(self.identity, prompt)
+        return key, phase, self.cache.get(key, phase)
+
+    def invoke(self, input, config=None, **kwargs):
+        key, phase, cached = self._lookup(input, config)
+        if cached is not None:
+            return cached
+        result = self.llm.invoke(input, config, **kwargs)
+        if key:
+            self.cache.put(key, phase, _text(result))
+        return result
+
+    async def ainvoke(self, input, config=None, **kwargs):
+        key, phase, cached = self._lookup(input, config)
+        if cached is not None:
+            return cached
+        result = await self.llm.ainvoke(input, config, **kwargs)
+        if key:
+            self.cache.put(key, phase, _text(result))
+        return result
+
+    def stream(self, input, config=None, **kwargs):
+        key, phase, cached = self._lookup(input, config)
+        if cached is not None:
+            yield cached
+            return
+        parts = []
+        for chunk in self.llm.stream(input, config, **kwargs):
+            parts.append(_text(chunk))
+            yield chunk
+        if key: # Only reached when the stream completed
+            self.cache.put(key, phase, "".join(parts))
+
+    async def astream(self, input, config=None, **kwargs):
+        key, phase, cached = self._lookup(input, config)
+        if cached is not None:
+            yield cached
+            return
+        parts = []
+        async for chunk in self.llm.astream(input, config, **kwargs):
+            parts.append(_text(chunk))
+            yield chunk
+        if key:
+            self.cache.put(key, phase, "".join(parts))
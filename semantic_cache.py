@@ -0,0 +1,119 @@
+"""
+Semantic answer cache for TUTORING questions.
+
+Answers are grouped in scopes of (scenario id, Knowledge Base version, preceding answer); a question only
+matches answers of its own scenario, generated against the current index, at the same point of the dialogue. Each scope keeps its question embeddings in
+one normalized float32 matrix, so a lookup is a single matrix-vector product (cosine similarity).
+- similarity >= threshold: the cached answer is returned instead of calling the LLM
+- similarity >= draft_threshold: the cached answer is used as draft context (retrieval is skipped)
+Entries are evicted least recently used first above max_items. engine drops the whole cache when the
+Knowledge Base is re-ingested.
+"""
+import logging
+import itertools
+import threading
+from collections import OrderedDict
+import numpy as np
+
+logger = logging.getLogger("gaia")
+
+def _normalize(vector) -> np.ndarray:
+    vec = np.asarray(vector, dtype=np.float32)
+    norm = np.linalg.norm(vec)
+    return vec / norm if norm else vec
+
+class _Scope:
+    """Question matrix of one (scenario, KB version), grown by doubling; removal swaps in the last row."""
+
+    def __init__(self, dim: int):
+        self.vectors = np.empty((16, dim), dtype=np.float32)
+        self.entries = [] # row -> (entry id, question, answer)
+        self.rows = {} # entry id -> row
+
+    def add(self, entry_id: int, vector: np.ndarray, question: str, answer: str):
+        size = len(self.entries)
+        if size == len(self.vectors):
+            self.vectors = np.concatenate([self.vectors, np.empty_like(self.vectors)])
+        self.vectors[size] = vector
+        self.entries.append((entry_id, question, answer))
+        self.rows[entry_id] = size
+
+    def remove(self, entry_id: int):
+        row = self.rows.pop(entry_id)
+        last = len(self.entries) - 1
+        if row != last:
+            self.vectors[row] = self.vectors[last]
+            self.entries[row] = self.entries[last]
+            self.rows[self.entries[row][0]] = row
+        self.entries.pop()
+
+    def nearest(self, vector: np.ndarray):
+        """(similarity, entry) of the closest question, or None when the scope is empty."""
+        if not self.entries:
+            return None
+        scores = self.vectors[:len(self.entries)] @ vector
+        row = int(np.argmax(scores))
+        return float(scores[row]), self.entries[row]
+
+class SemanticCache:
+    def __init__(self, threshold: float = 0.95, draft_threshold: float = 0.88, max_items: int = 5000):
+        self.threshold = threshold
+        self.draft_threshold = min(draft_threshold, threshold)
+        self.max_items = max_items
+        self._scopes = {} # (scenario id, kb version, preceding answer hash) -> _Scope
+        self._lru = OrderedDict() # entry id -> scope key
+        self._ids = itertools.count()
+        self._lock = threading.Lock()
+        self._stats = {"hits": 0, "drafts": 0, "misses": 0, "evictions": 0}
+
+    def lookup(self, scope_key, vector):
+        """
+        Returns ("answer" | "draft", {"similarity", "question", "answer"}) for the closest cached question
+        above the draft threshold, or (None, None).
+        """
+        vector = _normalize(vector)
+        with self._lock:
+            scope = self._scopes.get(scope_key)
+            match = scope.nearest(vector) if scope else None
+            if match is None or match[0] < self.draft_threshold:
+                self._stats["misses"] += 1
+                return None, None
+            similarity, (entry_id, question, answer) = match
+            self._lru.move_to_end(entry_id)
+            kind = "answer" if similarity >= self.threshold else "draft"
+            self._stats["hits" if kind == "answer" else "drafts"] += 1
+        return kind, {"similarity": similarity, "question": question, "answer": answer}
+
+    def add(self, scope_key, question: str, vector, answer: str):
+        if not answer or self.max_items <= 0:
+            return
+        vector = _normalize(vector)
+        with self._lock:
+            scope = self._scopes.get(scope_key)
+            if scope is None:
+                scope = self._scopes[scope_key] = _Scope(len(vector))
+            entry_id = next(self._ids)
+            scope.add(entry_id, vector, question, answer)
+            self._lru[entry_id] = scope_key
+            while len(self._lru) > self.max_items:
+                old_id, old_scope_key = self._lru.popitem(last=False)
+                old_scope = self._scopes[old_scope_key]
+                old_scope.remove(old_id)
+                if not old_scope.entries:
+                    del self._scopes[old_scope_key]
+                self._stats["evictions"] += 1
+
+    def clear(self):
+        with self._lock:
+            self._scopes.clear()
+            self._lru.clear()
+
+    def stats(self) -> dict:
+        """Hit (answered), draft and miss counters since process start plus the number of cached answers."""
+        with self._lock:
+            stats = dict(self._stats)
+            stats["items"] = len(self._lru)
+            stats["scopes"] = len(self._scopes)
+        lookups = stats["hits"] + stats["drafts"] + stats["misses"]
+        stats["hit_rate"] = stats["hits"] / lookups if lookups else 0.0
+        return stats
@@ -0,0 +1,181 @@
+"""
+Memory-mapped Knowledge Base snapshot: a fast-path alternative to querying Chroma (RETRIEVER_BACKEND=memmap).
+
+export_snapshot() copies the 'knowledge_base' collection into a snapshot directory:
+- vectors.npy   float32 matrix (chunks x dim), rows L2-normalized
+- offsets.npy   int64 byte offsets of every row's record in records.bin
+- records.bin   one JSON record per row: {"id", "text", "metadata"}
+- doc_sets.npy  int32 code of every row's `doc_set` metadata (names in meta.json), for scoped retrieval
+- meta.json     format, kb_version, count, dim, doc_sets, exported_at
+Snapshots are written to a fresh `v<kb_version>-<timestamp>` folder and published by atomically replacing
+the CURRENT pointer file, so readers never see a half-written snapshot.
+
+MemmapIndex opens every file with mmap: all Streamlit workers share the same pages through the OS page
+cache, and a query is one matrix-vector product (exact cosine top-k) plus decoding k records.
+
+    python vector_index.py    # export the current collection
+"""
+import os
+import json
+import time
+import shutil
+import logging
+import numpy as np
+from typing import Any, List
+from langchain_core.documents import Document
+from langchain_core.retrievers import BaseRetriever
+
+logger = logging.getLogger("gaia")
+
+EXPORT_BATCH = 5000 # Rows read from Chroma per call
+KEEP_SNAPSHOTS = 2 # Older snapshot folders are deleted after an export
+SNAPSHOT_FORMAT = 2 # Bumped when the file layout changes; older snapshots are re-exported
+
+def export_snapshot(vectorstore, directory: str, kb_version: int = None) -> dict:
+    """Writes the vector store's collection as a new snapshot in `directory` and publishes it."""
+    started = time.perf_counter()
+    collection = vectorstore._collection
+    count = collection.count()
+    name = f"v{kb_version}-{int(time.time() * 1000)}"
+    target = os.path.join(directory, name)
+    os.makedirs(target)
+
+    vectors, offsets, dim, position = None, np.zeros(count + 1, dtype=np.int64), 0, 0
+    codes, doc_sets = np.full(count, -1, dtype=np.int32), {} # doc_set name -> code
+    with open(os.path.join(target, "records.bin"), "wb") as records:
+        for start in range(0, count, EXPORT_BATCH):
+            batch = collection.get(include=["embeddings", "documents", "metadatas"], limit=EXPORT_BATCH, offset=start)
+            matrix = np.asarray(batch["embeddings"], dtype=np.float32)
+            if vectors is None:
+                dim = matrix.shape[1]
+                vectors = np.lib.format.open_memmap(os.path.join(target, "vectors.npy"), mode="w+", dtype=np.float32, shape=(count, dim))
+            norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+            norms[norms == 0] = 1
+            vectors[start:start + len(matrix)] = matrix / norms
+            for offset, (chunk_id, text, metadata) in enumerate(zip(batch["ids"], batch["documents"], batch["metadatas"]), start):
+                record = json.dumps({"id": chunk_id, "text": text, "metadata": metadata or {}}, ensure_ascii=False).encode("utf-8")
+                records.write(record)
+                position += len(record)
+                offsets[offset + 1] = position
+                if metadata and metadata.get("doc_set") is not None:
+                    codes[offset] = doc_sets.setdefault(metadata["doc_set"], len(doc_sets))
+    if vectors is None:
+        vectors = np.zeros((0, 0), dtype=np.float32)
+        np.save(os.path.join(target, "vectors.npy"), vectors)
+    else:
+        vectors.flush()
+    np.save(os.path.join(target, "offsets.npy"), offsets)
+    np.save(os.path.join(target, "doc_sets.npy"), codes)
+
+    meta = {"format": SNAPSHOT_FORMAT, "kb_version": kb_version, "count": count, "dim": dim,
+            "doc_sets": list(doc_sets), "exported_at": time.time()}
+    with open(os.path.join(target, "meta.json"), "w", encoding="utf-8") as f:
+        json.dump(meta, f)
+
+    # Publish: atomic swap of the pointer, readers never see a half-written snapshot
+    pointer = os.path.join(directory, "CURRENT")
+    with open(f"{pointer}.tmp", "w", encoding="utf-8") as f:
+        f.write(name)
+    os.replace(f"{pointer}.tmp", pointer)
+
+    snapshots = sorted((d for d in os.listdir(directory) if d.startswith("v") and d != name),
+                       key=lambda d: os.path.getmtime(os.path.join(directory, d)))
+    for old in snapshots[:max(0, len(snapshots) - (KEEP_SNAPSHOTS - 1))]:
+        shutil.rmtree(os.path.join(directory, old), ignore_errors=True) # Open mmaps stay valid after unlink
+
+    meta["seconds"] = round(time.perf_counter() - started, 2)
+    logger.info(f"KB snapshot {name}: {count} chunks x {dim} dims in {meta['seconds']}s")
+    return meta
+
+class MemmapIndex:
+    """Read-only view of a published snapshot; every file is memory-mapped."""
+
+    def __init__(self, path: str):
+        self.path = path
+        with open(os.path.join(path, "meta.json"), encoding="utf-8") as f:
+            self.meta = json.load(f)
+        self.kb_version = self.meta["kb_version"]
+        self.vectors = np.load(os.path.join(path, "vectors.npy"), mmap_mode="r")
+        self.offsets = np.load(os.path.join(path, "offsets.npy"), mmap_mode="r")
+        self.codes = np.load(os.path.join(path, "doc_sets.npy"), mmap_mode="r") if self.meta.get("format") == SNAPSHOT_FORMAT else None
+        self.doc_set_codes = {name: code for code, name in enumerate(self.meta.get("doc_sets", []))}
+        self._scoped_rows = {} # sorted doc_set tuple -> row numbers
+        records_path = os.path.join(path, "records.bin")
+        self.records = np.memmap(records_path, dtype=np.uint8, mode="r") if os.path.getsize(records_path) else b""
+
+    @classmethod
+    def open(cls, directory: str):
+        """The snapshot CURRENT points to, or None when nothing was exported yet."""
+        try:
+            with open(os.path.join(directory, "CURRENT"), encoding="utf-8") as f:
+                return cls(os.path.join(directory, f.read().strip()))
+        except FileNotFoundError:
+            return None
+
+    def stale(self, kb_version) -> bool:
+        """True when the snapshot was exported for another KB version or in an older layout."""
+        return self.kb_version != kb_version or self.codes is None
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    def record(self, row: int) -> dict:
+        return json.loads(bytes(self.records[self.offsets[row]:self.offsets[row + 1]]).decode("utf-8"))
+
+    def rows_for(self, doc_sets) -> np.ndarray:
+        """Row numbers of the chunks in any of `doc_sets` (cached per set)."""
+        key = tuple(sorted(set(doc_sets)))
+        rows = self._scoped_rows.get(key)
+        if rows is None:
+            wanted = [self.doc_set_codes[name] for name in key if name in self.doc_set_codes]
+            rows = self._scoped_rows[key] = np.flatnonzero(np.isin(self.codes, wanted))
+        return rows
+
+    def search(self, query_vector, k: int = 3, doc_sets=None) -> list:
+        """Exact cosine top-k: [(score, record)] best first. `doc_sets` restricts the search to those sets."""
+        rows = self.rows_for(doc_sets) if doc_sets is not None else None
+        candidates = len(self) if rows is None else len(rows)
+        if not candidates:
+            return []
+        query = np.asarray(query_vector, dtype=np.float32)
+        norm = np.linalg.norm(query)
+        query = query / norm if norm else query
+        # Score every row over the shared mmap pages, then pick the in-scope scores: indexing the memmap
+        # itself (vectors[rows]) would copy the scoped rows into private memory in every worker, per query
+        scores = self.vectors @ query
+        if rows is not None:
+            scores = scores[rows]
+        k = min(k, candidates)
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top])]
+        return [(float(scores[i]), self.record(int(i if rows is None else rows[i]))) for i in top]
+
+class MemmapRetriever(BaseRetriever):
+    """
+    Same interface as `vectorstore.as_retriever(search_kwargs={"k": k})`, backed by a MemmapIndex.
+    Supports the Chroma metadata filters engine uses: `filter={"doc_set": {"$in": [...]}}` or `{"doc_set": name}`,
+    a per-call `k`, and searching by a precomputed query vector.
+    """
+
+    index: Any
+    embeddings: Any
+    k: int = 3
+
+    def _get_relevant_documents(self, query: str, *, run_manager=None, filter: dict = None, k: int = None) -> List[Document]:
+        return self.similarity_search_by_vector(self.embeddings.embed_query(query), k=k, filter=filter)
+
+    def similarity_search_by_vector(self, embedding, k: int = None, filter: dict = None) -> List[Document]:
+        """Search with an already computed query vector (same signature as Chroma's)."""
+        doc_sets = None
+        if filter:
+            if set(filter) != {"doc_set"}:
+                raise ValueError(f"MemmapRetriever only filters on doc_set, got {filter}")
+            condition = filter["doc_set"]
+            doc_sets = condition["$in"] if isinstance(condition, dict) else [condition]
+        hits = self.index.search(embedding, k or self.k, doc_sets=doc_sets)
+        return [Document(page_content=record["text"], metadata=record["metadata"], id=record["id"]) for _, record in hits]
+
+if __name__ == "__main__":
+    from engine import KB_SNAPSHOT_DIR, load_vectors
+    from ingest import kb_version
+    print(json.dumps(export_snapshot(load_vectors(), KB_SNAPSHOT_DIR, kb_version=kb_version()), indent=2))